@@ -0,0 +1,74 @@
+"""
+Microbenchmarks for the per-message hot paths.
+
+    python -m benchmarks --output results.json
+    python -m benchmarks --compare results.json --fail
+    python -m benchmarks --backend local -k redis
+
+The memory backend needs nothing running. The local backend uses the
+Postgres and Redis from the config, so don't point it at production.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from . import cases  # noqa: F401, registers the cases
+from .fakes import Environment
+from .harness import compare, metadata, run, save
+
+
+def report(label: str, result: Dict[str, float]) -> None:
+    print(
+        f"  {label:<48} {result['median_us']:>12.3f}us "
+        f"(min {result['min_us']:.3f}us, {result['ops']:,.0f} ops/s)"
+    )
+
+
+async def main(arguments: argparse.Namespace) -> List[str]:
+    print(f"Running benchmarks against the {arguments.backend} backend:")
+    async with Environment(arguments.backend) as env:
+        results = await run(env, arguments.pattern, report)
+
+    if arguments.output:
+        save(arguments.output, metadata(arguments.backend), results)
+        print(f"\nSaved {len(results)} results to {arguments.output}.")
+
+    if arguments.compare:
+        return compare(arguments.compare, results, arguments.threshold)
+
+    return []
+
+
+def parse(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    parser.add_argument("--backend", choices=("memory", "local"), default="memory")
+    parser.add_argument("--output", type=Path, help="write the results to a JSON file")
+    parser.add_argument("--compare", type=Path, help="a previous results file to compare with")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="relative slowdown of the median reported as a regression",
+    )
+    parser.add_argument("-k", dest="pattern", help="only run benchmarks containing this")
+    parser.add_argument(
+        "--fail",
+        action="store_true",
+        help="exit with a non-zero status when something regressed",
+    )
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    logging.disable(logging.INFO)
+    arguments = parse()
+    regressions = asyncio.run(main(arguments))
+    if regressions and arguments.fail:
+        print(f"\n{len(regressions)} benchmarks regressed.")
+        sys.exit(1)
@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Optional
+
+from discord import Embed
+
+from config import config
+from main import get_prefix
+from tools.client import Context
+from tools.client.cache import Strategy, cache
+from tools.client.redis import decode, encode
+from tools.paginator import Paginator
+
+from .fakes import Environment, MemoryDatabase
+from .harness import Operation, bench
+
+COMMAND = f"{config.client.prefix}balance"
+
+
+class BenchContext(Context):
+    """
+    A context whose sends return what would have been sent,
+    so the embed helpers are timed without the outbound queue.
+    """
+
+    async def send(self, *args: Any, **kwargs: Any) -> Any:  # type: ignore
+        return self.prepare(args, kwargs)
+
+
+@bench("get_prefix", params=("default", "custom"))
+async def bench_get_prefix(env: Environment, param: str) -> Operation:
+    message = env.message("hello", guild_id=2 if param == "custom" else 1)
+    if param == "custom" and isinstance(env.bot.database, MemoryDatabase):
+        env.bot.database.prefixes[2] = ["!", "?"]
+
+    # The first call fills the prefix cache, we time the hits.
+    await get_prefix(env.bot, message)
+
+    async def operation() -> None:
+        await get_prefix(env.bot, message)
+
+    return operation
+
+
+@bench("get_context", params=("command", "chatter"))
+async def bench_get_context(env: Environment, param: str) -> Operation:
+    message = env.message(COMMAND if param == "command" else "just talking")
+
+    async def operation() -> None:
+        await env.bot.get_context(message)
+
+    return operation
+
+
+@bench("cache.hit", params=tuple(strategy.name for strategy in Strategy))
+async def bench_cache_hit(env: Environment, param: str) -> Operation:
+    strategy = Strategy[param]
+
+    @cache(maxsize=60 if strategy is Strategy.timed else 1024, strategy=strategy)
+    async def lookup(key: int) -> int:
+        return key
+
+    if strategy is Strategy.timed:
+        # The expiring cache scans every entry on access, so give it some.
+        await asyncio.gather(*(lookup(key) for key in range(1000)))
+
+    await lookup(0)
+
+    def operation() -> None:
+        lookup(0)
+
+    return operation
+
+
+@bench("cache.miss", params=tuple(strategy.name for strategy in Strategy))
+async def bench_cache_miss(env: Environment, param: str) -> Operation:
+    strategy = Strategy[param]
+
+    @cache(maxsize=60 if strategy is Strategy.timed else 1024, strategy=strategy)
+    async def lookup(key: int) -> int:
+        return key
+
+    async def operation() -> None:
+        await lookup(0)
+        lookup.invalidate(0)
+
+    return operation
+
+
+@bench("cache.get_key")
+async def bench_cache_get_key(env: Environment, param: None) -> Operation:
+    @cache()
+    async def lookup(bot: Any, guild_id: int, *, connection: Any = None) -> None:
+        return None
+
+    def operation() -> None:
+        lookup.get_key(env.bot, 1234567890, connection=None)
+
+    return operation
+
+
+@bench("redis.encode", params=("int", "dict"))
+async def bench_redis_encode(env: Environment, param: str) -> Operation:
+    value: Any = 1234567 if param == "int" else {"wallet": 100, "bank": 2500}
+
+    def operation() -> None:
+        encode(value)
+
+    return operation
+
+
+@bench("redis.decode", params=("int", "dict", "text"))
+async def bench_redis_decode(env: Environment, param: str) -> Operation:
+    output = {
+        "int": b"1234567",
+        "dict": b'{"wallet": 100, "bank": 2500}',
+        "text": b"not json at all",
+    }[param]
+
+    def operation() -> None:
+        decode(output)
+
+    return operation
+
+
+@bench("redis.roundtrip")
+async def bench_redis_roundtrip(env: Environment, param: None) -> Optional[Operation]:
+    if not env.redis:
+        # Only meaningful against a real server.
+        return None
+
+    await env.redis.set("benchmark:roundtrip", {"wallet": 100, "bank": 2500})
+
+    async def operation() -> None:
+        await env.redis.get("benchmark:roundtrip")
+
+    return operation
+
+
+@bench("paginator.prepare_entries", params=(100, 10_000, 100_000))
+async def bench_prepare_entries(env: Environment, param: int) -> Operation:
+    ctx = await env.bot.get_context(env.message(COMMAND), cls=BenchContext)
+    entries = [f"entry number {index}" for index in range(param)]
+
+    def operation() -> None:
+        Paginator(ctx, entries=entries).prepare_entries()
+
+    return operation
+
+
+@bench("paginator.render_page", params=(100, 10_000, 100_000))
+async def bench_render_page(env: Environment, param: int) -> Operation:
+    ctx = await env.bot.get_context(env.message(COMMAND), cls=BenchContext)
+    entries = [f"entry number {index}" for index in range(param)]
+
+    async def operation() -> None:
+        await Paginator(ctx, entries=entries).render_page(0)
+
+    return operation
+
+
+@bench("context.embed", params=("neutral", "approve", "warn"))
+async def bench_context_embed(env: Environment, param: str) -> Operation:
+    ctx = await env.bot.get_context(env.message(COMMAND), cls=BenchContext)
+    helper = getattr(ctx, param)
+
+    async def operation() -> None:
+        await helper("You have **1,000** coins in your wallet.")
+
+    return operation
+
+
+@bench("embed.to_dict")
+async def bench_embed_to_dict(env: Environment, param: None) -> Operation:
+    embed = Embed(description="You have **1,000** coins in your wallet.")
+    embed.set_footer(text="Page 1/10")
+
+    def operation() -> None:
+        embed.to_dict()
+
+    return operation
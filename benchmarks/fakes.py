@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from asyncpg.connection import LoggedQuery
+from discord.utils import time_snowflake
+
+from main import Harvest
+from tools.client import Redis, database
+
+BOT_ID = 100000000000000001
+_snowflakes = itertools.count(time_snowflake(datetime.now(timezone.utc)))
+
+
+class MemoryDatabase:
+    """
+    Stands in for the Postgres pool with dictionaries.
+    It only understands the handful of queries the hot paths make,
+    anything else returns nothing, every query is counted.
+    """
+
+    def __init__(self) -> None:
+        self.prefixes: Dict[int, List[str]] = {}
+        self.queries: Counter[str] = Counter()
+
+    async def fetchval(self, query: str, *args: Any, timeout: Optional[float] = None) -> Any:
+        self.queries[" ".join(query.split())] += 1
+        if "prefixes" in query:
+            return self.prefixes.get(args[0])
+
+        return None
+
+    async def fetchrow(self, query: str, *args: Any, timeout: Optional[float] = None) -> Any:
+        self.queries[" ".join(query.split())] += 1
+        if "INTO settings" in query:
+            return {"guild_id": args[0], "prefixes": self.prefixes.get(args[0], [])}
+
+        return None
+
+    async def fetch(self, query: str, *args: Any, timeout: Optional[float] = None) -> List[Any]:
+        self.queries[" ".join(query.split())] += 1
+        return []
+
+    async def execute(self, query: str, *args: Any, timeout: Optional[float] = None) -> str:
+        self.queries[" ".join(query.split())] += 1
+        return "OK"
+
+
+class CountingDatabase:
+    """
+    Wraps a real pool to count the queries made through it, including
+    the ones on connections taken with acquire().
+    """
+
+    def __init__(self) -> None:
+        self.pool: Any = None
+        self.queries: Counter[str] = Counter()
+
+    @classmethod
+    async def connect(cls) -> "CountingDatabase":
+        self = cls()
+        self.pool = await database.connect(query_logger=self.count)
+        await database.migrate(self.pool)
+        return self
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.pool, name)
+
+    def count(self, query: LoggedQuery) -> None:
+        self.queries[" ".join(query.query.split())] += 1
+
+
+class FakeUser:
+    def __init__(self, user_id: int, bot: bool = False):
+        self.id = user_id
+        self.bot = bot
+        self.name = f"user{user_id}"
+        self.display_name = self.name
+        self.mention = f"<@{user_id}>"
+
+    def __eq__(self, other: object) -> bool:
+        return getattr(other, "id", None) == self.id
+
+    def __hash__(self) -> int:
+        return self.id >> 22
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int, owner_id: int = 0):
+        self.id = guild_id
+        self.owner_id = owner_id
+        self.members: List[FakeUser] = []
+
+    def get_member(self, user_id: int) -> Optional[FakeUser]:
+        return next((member for member in self.members if member.id == user_id), None)
+
+
+class FakeChannel:
+    """
+    A channel whose sends take `latency` seconds instead of going to Discord.
+    """
+
+    def __init__(self, channel_id: int, guild: Optional[FakeGuild], latency: float = 0.0):
+        self.id = channel_id
+        self.guild = guild
+        self.latency = latency
+        self.sent = 0
+
+    async def send(self, content: Optional[str] = None, **kwargs: Any) -> "FakeMessage":
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        self.sent += 1
+        return FakeMessage(
+            content or "",
+            author=FakeUser(BOT_ID, bot=True),
+            channel=self,
+            state=None,
+        )
+
+
+class FakeMessage:
+    """
+    Just enough of a Message for get_context, cooldowns and Context.send.
+    """
+
+    def __init__(
+        self,
+        content: str,
+        *,
+        author: FakeUser,
+        channel: FakeChannel,
+        state: Any,
+    ):
+        self.id = next(_snowflakes)
+        self.content = content
+        self.author = author
+        self.channel = channel
+        self.guild = channel.guild
+        self.created_at = datetime.now(timezone.utc)
+        self.edited_at = None
+        self.mentions: List[FakeUser] = []
+        self.raw_mentions: List[int] = []
+        self._state = state
+
+    async def delete(self, *, delay: Optional[float] = None) -> None:
+        return None
+
+    async def edit(self, **kwargs: Any) -> "FakeMessage":
+        return self
+
+
+def create_bot(database: Any = None) -> Harvest:
+    """
+    A Harvest instance which never logs in, with the client user faked
+    so that mention prefixes and get_context work.
+    """
+
+    bot = Harvest()
+    bot._connection.user = FakeUser(BOT_ID, bot=True)  # type: ignore
+    bot.database = database or MemoryDatabase()
+    return bot
+
+
+def make_message(
+    bot: Harvest,
+    content: str,
+    *,
+    guild_id: int = 1,
+    user_id: int = 2,
+    channel: Optional[FakeChannel] = None,
+) -> FakeMessage:
+    channel = channel or FakeChannel(guild_id * 10, FakeGuild(guild_id))
+    return FakeMessage(
+        content,
+        author=FakeUser(user_id),
+        channel=channel,
+        state=bot._connection,
+    )
+
+
+class Environment:
+    """
+    What the benchmark cases run against.
+
+    The memory backend needs nothing running, the local backend connects
+    to the Postgres and Redis from the config so real round trips are timed.
+    """
+
+    def __init__(self, backend: str = "memory"):
+        self.backend = backend
+        self.bot: Harvest = None  # type: ignore
+        self.redis: Any = None
+
+    async def __aenter__(self) -> "Environment":
+        if self.backend == "local":
+            self.bot = create_bot(await CountingDatabase.connect())
+            self.redis = self.bot.redis = await Redis.from_url()
+        else:
+            self.bot = create_bot()
+
+        return self
+
+    async def __aexit__(self, *_: Any) -> None:
+        if self.redis:
+            await self.redis.close()
+
+        if self.backend == "local":
+            await self.bot.database.close()
+
+    def message(self, content: str, **kwargs: Any) -> FakeMessage:
+        return make_message(self.bot, content, **kwargs)
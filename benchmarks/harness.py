@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import inspect
+import json
+import platform
+import statistics
+import subprocess
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+Operation = Callable[[], Any]
+CaseFactory = Callable[..., Awaitable[Optional[Operation]]]
+
+
+class Benchmark:
+    """
+    A named case which is set up once per parameter and returns the operation
+    to time, or None when it doesn't apply to the current backend.
+    """
+
+    def __init__(self, name: str, factory: CaseFactory, params: Sequence[Any]):
+        self.name = name
+        self.factory = factory
+        self.params = params
+
+    def label(self, param: Any) -> str:
+        return self.name if param is None else f"{self.name}[{param}]"
+
+
+registry: List[Benchmark] = []
+
+
+def bench(name: str, *, params: Sequence[Any] = (None,)) -> Callable[[CaseFactory], CaseFactory]:
+    def decorator(factory: CaseFactory) -> CaseFactory:
+        registry.append(Benchmark(name, factory, params))
+        return factory
+
+    return decorator
+
+
+async def timed(operation: Operation, number: int) -> float:
+    if inspect.iscoroutinefunction(operation):
+        start = time.perf_counter()
+        for _ in range(number):
+            await operation()
+
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(number):
+        operation()
+
+    return time.perf_counter() - start
+
+
+async def measure(operation: Operation, target: float = 0.1, repeat: int = 5) -> Dict[str, float]:
+    """
+    Find a loop count which takes at least `target` seconds, like timeit's autorange,
+    then time `repeat` runs of it and report the per operation figures.
+    """
+
+    number = 1
+    while True:
+        elapsed = await timed(operation, number)
+        if elapsed >= target:
+            break
+
+        number *= 10 if elapsed < target / 10 else 2
+
+    if elapsed > 1:
+        repeat = min(repeat, 3)
+
+    runs = [await timed(operation, number) / number for _ in range(repeat)]
+    median = statistics.median(runs)
+    return {
+        "median_us": round(median * 1e6, 3),
+        "min_us": round(min(runs) * 1e6, 3),
+        "mean_us": round(statistics.fmean(runs) * 1e6, 3),
+        "ops": round(1 / median, 1) if median else 0.0,
+        "number": number,
+        "repeat": repeat,
+    }
+
+
+async def run(
+    env: Any,
+    pattern: Optional[str] = None,
+    report: Callable[[str, Dict[str, float]], None] = lambda *_: None,
+) -> Dict[str, Dict[str, float]]:
+    results: Dict[str, Dict[str, float]] = {}
+    for benchmark in registry:
+        for param in benchmark.params:
+            label = benchmark.label(param)
+            if pattern and pattern not in label:
+                continue
+
+            operation = await benchmark.factory(env, param)
+            if operation is None:
+                # The case doesn't apply to this backend.
+                continue
+
+            results[label] = await measure(operation)
+            report(label, results[label])
+
+    return results
+
+
+def metadata(backend: str) -> Dict[str, str]:
+    try:
+        commit = subprocess.run(
+            ("git", "rev-parse", "--short", "HEAD"),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = "unknown"
+
+    return {
+        "commit": commit,
+        "backend": backend,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def save(path: Path, meta: Dict[str, str], results: Dict[str, Dict[str, float]]) -> None:
+    path.write_text(json.dumps({"meta": meta, "results": results}, indent=2))
+
+
+def compare(
+    baseline: Path,
+    results: Dict[str, Dict[str, float]],
+    threshold: float,
+) -> List[str]:
+    """
+    Print the change against a previous run and return the regressed benchmarks.
+    """
+
+    previous = json.loads(baseline.read_text())
+    print(f"\nCompared to {previous['meta'].get('commit', baseline.name)}:")
+
+    regressions = []
+    for label, result in results.items():
+        before = previous["results"].get(label)
+        if not before:
+            continue
+
+        change = (result["median_us"] - before["median_us"]) / before["median_us"]
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(label)
+        elif change < -threshold:
+            flag = "  improved"
+
+        print(
+            f"  {label:<48} {before['median_us']:>12.3f}us -> "
+            f"{result['median_us']:>12.3f}us {change:+8.1%}{flag}"
+        )
+
+    return regressions
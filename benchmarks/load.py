@@ -0,0 +1,327 @@
+"""
+Synthetic load through the same path gateway messages take.
+
+    python -m benchmarks.load --rate 50,100,200,400 --duration 20
+    python -m benchmarks.load --guilds 500 --users 5000 --mix chatter=90,beg=10
+
+Messages are fed to Harvest.on_message at a fixed arrival rate, whether
+or not earlier ones have finished, so a saturated bot shows up as growing
+latency instead of a politely slower generator. Sends go to fake channels
+which take --latency seconds, Postgres and Redis are the local ones from
+the config, so don't point it at production. The rows and keys it creates
+are removed afterwards, even when a run fails.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import random
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from cogs.economy.repository import TOTALS, key
+from config import config
+from tools.client.metrics import Histogram, render_table
+
+from .fakes import Environment, FakeChannel, FakeGuild, FakeMessage, FakeUser
+
+# Far away from real snowflakes, so the economy rows are easy to tell apart.
+BASE_ID = 900000000000000000
+CHATTER = "did anyone else see the match last night"
+MIX = "chatter=60,beg=15,balance=20,prefix=5"
+EXTENSIONS = ("cogs.config", "cogs.economy")
+
+
+def parse_mix(mix: str) -> Dict[str, int]:
+    weights: Dict[str, int] = {}
+    for part in mix.split(","):
+        kind, _, weight = part.partition("=")
+        weights[kind.strip()] = int(weight or 1)
+
+    return weights
+
+
+class Workload:
+    """
+    Random messages from M users spread across N guilds.
+    """
+
+    def __init__(
+        self,
+        env: Environment,
+        guilds: int,
+        users: int,
+        mix: Dict[str, int],
+        latency: float,
+    ):
+        self.state = env.bot._connection
+        self.channels = [
+            FakeChannel(BASE_ID + index * 10, FakeGuild(BASE_ID + index), latency)
+            for index in range(guilds)
+        ]
+        self.users = [FakeUser(BASE_ID + index) for index in range(users)]
+        self.kinds = list(mix)
+        self.weights = list(mix.values())
+
+    def message(self) -> Tuple[str, FakeMessage]:
+        kind = random.choices(self.kinds, self.weights)[0]
+        content = CHATTER if kind == "chatter" else f"{config.client.prefix}{kind}"
+        return kind, FakeMessage(
+            content,
+            author=random.choice(self.users),
+            channel=random.choice(self.channels),
+            state=self.state,
+        )
+
+
+class Step:
+    """
+    The results of driving one arrival rate.
+    """
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.sent = 0
+        self.finished = 0
+        self.unfinished = 0
+        self.elapsed = 0.0
+        self.latency: Dict[str, Histogram] = {}
+        self.overall = Histogram()
+        self.lag = Histogram()
+        self.outcomes: Counter[str] = Counter()
+        self.queries: Counter[str] = Counter()
+        self.redis: Counter[str] = Counter()
+
+    def observe(self, kind: str, milliseconds: float) -> None:
+        if kind not in self.latency:
+            self.latency[kind] = Histogram()
+
+        self.latency[kind].observe(milliseconds)
+        self.overall.observe(milliseconds)
+        self.finished += 1
+
+    @property
+    def throughput(self) -> float:
+        return self.finished / self.elapsed if self.elapsed else 0.0
+
+
+async def redis_calls(env: Environment) -> Counter[str]:
+    """
+    Per command call counts from the server, which sees everything
+    including the scripts and pipelines we don't wrap.
+    """
+
+    stats = await env.redis.info("commandstats")
+    return Counter(
+        {
+            name.removeprefix("cmdstat_"): int(value["calls"])
+            for name, value in stats.items()
+        }
+    )
+
+
+async def drive(env: Environment, workload: Workload, step: Step, duration: float) -> None:
+    bot = env.bot
+    pending: Set[asyncio.Task[None]] = set()
+    queries = Counter(bot.database.queries)
+    redis = await redis_calls(env)
+    bot.monitor.lag = step.lag
+
+    async def handle(kind: str, message: FakeMessage) -> None:
+        started = time.perf_counter()
+        try:
+            await bot.on_message(message)  # type: ignore
+        except Exception as exc:
+            step.outcomes[type(exc).__name__] += 1
+        finally:
+            step.observe(kind, (time.perf_counter() - started) * 1000)
+
+    loop = asyncio.get_running_loop()
+    interval = 1 / step.rate
+    started = loop.time()
+    while (target := started + step.sent * interval) < started + duration:
+        # When we fall behind this only yields, so arrivals burst to catch up.
+        await asyncio.sleep(max(0.0, target - loop.time()))
+
+        kind, message = workload.message()
+        task = asyncio.create_task(handle(kind, message))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+        step.sent += 1
+
+    # Give the stragglers as long again as the step itself before giving up.
+    if pending:
+        _, unfinished = await asyncio.wait(pending, timeout=duration)
+        step.unfinished = len(unfinished)
+        for task in unfinished:
+            task.cancel()
+
+    step.elapsed = loop.time() - started
+    step.queries = bot.database.queries - queries
+    step.redis = await redis_calls(env) - redis
+
+
+def render(steps: List[Step]) -> str:
+    lines = [
+        render_table(
+            (
+                "rate",
+                "sent",
+                "handled/s",
+                "p50",
+                "p95",
+                "p99",
+                "max",
+                "loop lag p99",
+                "queries/msg",
+                "redis/msg",
+                "unfinished",
+            ),
+            [
+                (
+                    f"{step.rate:g}/s",
+                    step.sent,
+                    f"{step.throughput:,.1f}",
+                    f"{step.overall.percentile(0.50):.1f}ms",
+                    f"{step.overall.percentile(0.95):.1f}ms",
+                    f"{step.overall.percentile(0.99):.1f}ms",
+                    f"{step.overall.maximum:.1f}ms",
+                    f"{step.lag.percentile(0.99):.1f}ms",
+                    f"{sum(step.queries.values()) / max(step.sent, 1):.2f}",
+                    f"{sum(step.redis.values()) / max(step.sent, 1):.2f}",
+                    step.unfinished,
+                )
+                for step in steps
+            ],
+        )
+    ]
+
+    for step in steps:
+        lines.append("")
+        lines.append(f"At {step.rate:g} messages per second:")
+        lines.append(
+            render_table(
+                ("message", "count", "p50", "p95", "p99", "max"),
+                [
+                    (
+                        kind,
+                        histogram.count,
+                        f"{histogram.percentile(0.50):.1f}ms",
+                        f"{histogram.percentile(0.95):.1f}ms",
+                        f"{histogram.percentile(0.99):.1f}ms",
+                        f"{histogram.maximum:.1f}ms",
+                    )
+                    for kind, histogram in sorted(step.latency.items())
+                ],
+            )
+        )
+        if step.outcomes:
+            lines.append(
+                "Outcomes: "
+                + ", ".join(f"{name} {count:,}" for name, count in step.outcomes.most_common())
+            )
+
+    queries: Counter[str] = sum((step.queries for step in steps), Counter())
+    if queries:
+        lines.append("")
+        lines.append(
+            render_table(
+                ("query", "count"),
+                [(query[:80], count) for query, count in queries.most_common(10)],
+            )
+        )
+
+    redis: Counter[str] = sum((step.redis for step in steps), Counter())
+    if redis:
+        lines.append("")
+        lines.append(render_table(("redis command", "calls"), redis.most_common(10)))
+
+    return "\n".join(lines)
+
+
+async def cleanup(env: Environment, workload: Workload) -> None:
+    """
+    Remove the rows and keys the run created.
+    """
+
+    user_ids = [user.id for user in workload.users]
+    guild_ids = [channel.guild.id for channel in workload.channels if channel.guild]
+    await env.bot.db.execute("DELETE FROM economy WHERE user_id = ANY($1::BIGINT[])", user_ids)
+    await env.bot.db.execute("DELETE FROM settings WHERE guild_id = ANY($1::BIGINT[])", guild_ids)
+    await env.redis.delete(*(key(user_id) for user_id in user_ids))
+    await env.redis.zrem(TOTALS, *user_ids)
+
+
+async def main(arguments: argparse.Namespace) -> None:
+    steps: List[Step] = []
+    async with Environment("local") as env:
+        bot = env.bot
+        workload = Workload(
+            env,
+            arguments.guilds,
+            arguments.users,
+            parse_mix(arguments.mix),
+            arguments.latency,
+        )
+
+        async def on_command_completion(ctx: Any) -> None:
+            steps[-1].outcomes["completed"] += 1
+
+        async def on_command_error(ctx: Any, error: Exception) -> None:
+            steps[-1].outcomes[type(error).__name__] += 1
+
+        bot.add_listener(on_command_completion)
+        bot.add_listener(on_command_error)
+        try:
+            for extension in EXTENSIONS:
+                await bot.load_extension(extension)
+
+            bot.monitor.start()
+            for rate in arguments.rate:
+                print(f"Driving {rate:g} messages per second for {arguments.duration:g}s...")
+                steps.append(Step(rate))
+                await drive(env, workload, steps[-1], arguments.duration)
+                if arguments.cooldown:
+                    await asyncio.sleep(arguments.cooldown)
+        finally:
+            bot.monitor.stop()
+            await bot.tasks.drain(timeout=10)
+            await cleanup(env, workload)
+
+        print()
+        print(render(steps))
+
+
+def parse(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.load")
+    parser.add_argument(
+        "--rate",
+        type=lambda value: [float(rate) for rate in value.split(",")],
+        default=[50.0, 100.0, 200.0],
+        help="comma separated arrival rates in messages per second, run in order",
+    )
+    parser.add_argument("--duration", type=float, default=15, help="seconds per rate")
+    parser.add_argument("--guilds", type=int, default=50)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--mix", default=MIX, help=f"message weights, default {MIX}")
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.05,
+        help="seconds each fake Discord send takes",
+    )
+    parser.add_argument(
+        "--cooldown",
+        type=float,
+        default=3,
+        help="seconds of rest between rates, so command cooldowns expire",
+    )
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    logging.disable(logging.INFO)
+    asyncio.run(main(parse()))
@@ -0,0 +1,227 @@
+"""
+Concurrent transfers between a small set of accounts, checking that no
+money is created or destroyed along the way.
+
+    python -m benchmarks.transfers --accounts 20 --workers 50 --transfers 200
+
+Every worker pays random accounts, in both directions so lock ordering is
+exercised, and now and then settles a whole batch at once. Afterwards the
+wallets in Postgres have to add up to what they started with and the cached
+accounts have to match them. Some accounts start out in debt, they have to
+accept payments but can't pay anything until they're out of it again. Runs
+against the local Postgres and Redis from the config, the accounts it
+creates are removed again.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import random
+import sys
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+from asyncpg import DeadlockDetectedError
+
+from cogs.economy.repository import TOTALS, EconomyRepository, Transfer, key
+from tools.client.metrics import Histogram, render_table
+
+from .fakes import Environment
+
+# Far away from real snowflakes and from the load test's users.
+BASE_ID = 910000000000000000
+
+
+async def seed(repository: EconomyRepository, wallets: Dict[int, int]) -> None:
+    await repository.bot.db.execute(
+        """
+        INSERT INTO economy (user_id, wallet, bank)
+        SELECT user_id, wallet, 0
+        FROM unnest($1::BIGINT[], $2::BIGINT[]) AS account (user_id, wallet)
+        ON CONFLICT (user_id) DO UPDATE
+        SET wallet = EXCLUDED.wallet, bank = 0, version = economy.version + 1
+        """,
+        list(wallets),
+        list(wallets.values()),
+    )
+    await repository.bot.redis.delete(*(key(user_id) for user_id in wallets))
+    await repository.bot.redis.zrem(TOTALS, *wallets)
+
+
+async def debts(repository: EconomyRepository, wallets: Dict[int, int]) -> List[str]:
+    """
+    Pay into an account in debt and try to pay out of one, the money
+    moved there and back again so the supply stays as it was seeded.
+    """
+
+    problems: List[str] = []
+    indebted = [user_id for user_id, wallet in wallets.items() if wallet < -1]
+    solvent = [user_id for user_id, wallet in wallets.items() if wallet > 1]
+    if not indebted or not solvent:
+        return problems
+
+    debtor, creditor = indebted[0], solvent[0]
+    if not await repository.transfer(creditor, debtor, 1):
+        problems.append("a payment into a wallet in debt was rejected")
+    elif not await repository.transfer(debtor, creditor, 1):
+        # Back to where it was, still in debt.
+        problems.append("a wallet in debt couldn't return what it was paid")
+
+    if await repository.transfer(debtor, creditor, 2):
+        problems.append("a wallet in debt paid out more than it had")
+        await repository.transfer(creditor, debtor, 2)
+
+    return problems
+
+
+async def worker(
+    repository: EconomyRepository,
+    user_ids: List[int],
+    arguments: argparse.Namespace,
+    outcomes: Counter[str],
+    latency: Histogram,
+) -> None:
+    for _ in range(arguments.transfers):
+        if random.random() < arguments.settle:
+            transfers = [
+                Transfer(*random.sample(user_ids, 2), random.randint(1, arguments.amount))
+                for _ in range(arguments.batch)
+            ]
+            operation = "settle"
+            call = repository.settle(transfers)
+        else:
+            sender, recipient = random.sample(user_ids, 2)
+            operation = "transfer"
+            call = repository.transfer(sender, recipient, random.randint(1, arguments.amount))
+
+        started = time.perf_counter()
+        try:
+            result = await call
+        except DeadlockDetectedError:
+            outcomes[f"{operation} deadlocked"] += 1
+            continue
+
+        latency.observe((time.perf_counter() - started) * 1000)
+        outcomes[f"{operation} {'applied' if result else 'rejected'}"] += 1
+
+
+async def verify(repository: EconomyRepository, wallets: Dict[int, int]) -> List[str]:
+    problems: List[str] = []
+    records = await repository.bot.db.fetch(
+        "SELECT user_id, wallet, bank, version FROM economy WHERE user_id = ANY($1::BIGINT[])",
+        list(wallets),
+    )
+    supply = sum(record["wallet"] + record["bank"] for record in records)
+    expected = sum(wallets.values())
+    if supply != expected:
+        problems.append(f"the money supply is ${supply}, expected ${expected}")
+
+    # Paying out has to leave a wallet at zero or above, so the ones still
+    # in debt can only have been paid into.
+    negative = [
+        record["user_id"]
+        for record in records
+        if record["wallet"] < min(wallets[record["user_id"]], 0)
+    ]
+    if negative:
+        problems.append(f"{len(negative)} wallets went further negative")
+
+    cached = await repository.bot.redis.mget([key(record["user_id"]) for record in records])
+    stale = [
+        record["user_id"]
+        for record, account in zip(records, cached)
+        if isinstance(account, dict)
+        and (account["wallet"], account["version"]) != (record["wallet"], record["version"])
+    ]
+    if stale:
+        problems.append(f"{len(stale)} cached accounts disagree with Postgres")
+
+    return problems
+
+
+async def main(arguments: argparse.Namespace) -> int:
+    async with Environment("local") as env:
+        repository = EconomyRepository(env.bot)
+        user_ids = [BASE_ID + index for index in range(arguments.accounts)]
+        indebted = round(arguments.accounts * arguments.indebted)
+        wallets = {
+            user_id: -arguments.wallet if index < indebted else arguments.wallet
+            for index, user_id in enumerate(user_ids)
+        }
+        await seed(repository, wallets)
+
+        outcomes: Counter[str] = Counter()
+        latency = Histogram()
+        try:
+            problems = await debts(repository, wallets)
+            started = time.perf_counter()
+            await asyncio.gather(
+                *(
+                    worker(repository, user_ids, arguments, outcomes, latency)
+                    for _ in range(arguments.workers)
+                )
+            )
+            elapsed = time.perf_counter() - started
+            problems.extend(await verify(repository, wallets))
+            if deadlocks := sum(
+                count for outcome, count in outcomes.items() if outcome.endswith("deadlocked")
+            ):
+                problems.append(f"{deadlocks} operations deadlocked")
+        finally:
+            await env.bot.db.execute(
+                "DELETE FROM economy WHERE user_id = ANY($1::BIGINT[])", user_ids
+            )
+            await env.bot.redis.delete(*(key(user_id) for user_id in user_ids))
+            await env.bot.redis.zrem(TOTALS, *user_ids)
+
+    print(
+        render_table(
+            ("outcome", "count"),
+            sorted(outcomes.items()),
+        )
+    )
+    print()
+    print(
+        f"{sum(outcomes.values()):,} operations in {elapsed:.2f}s, "
+        f"p50 {latency.percentile(0.50):.1f}ms, p99 {latency.percentile(0.99):.1f}ms"
+    )
+
+    if problems:
+        for problem in problems:
+            print(f"FAILED: {problem}")
+
+        return 1
+
+    print("The money supply was conserved.")
+    return 0
+
+
+def parse(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.transfers")
+    parser.add_argument("--accounts", type=int, default=20, help="fewer means more contention")
+    parser.add_argument("--wallet", type=int, default=1000, help="starting wallet of every account")
+    parser.add_argument(
+        "--indebted",
+        type=float,
+        default=0.2,
+        help="share of accounts which start with the negative wallet instead",
+    )
+    parser.add_argument("--workers", type=int, default=50)
+    parser.add_argument("--transfers", type=int, default=200, help="operations per worker")
+    parser.add_argument("--amount", type=int, default=100, help="largest single transfer")
+    parser.add_argument(
+        "--settle",
+        type=float,
+        default=0.1,
+        help="share of operations which settle a batch instead",
+    )
+    parser.add_argument("--batch", type=int, default=50, help="transfers per settlement")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    logging.disable(logging.INFO)
+    sys.exit(asyncio.run(main(parse())))
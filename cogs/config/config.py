@@ -17,7 +17,8 @@ class Config(Cog):
     async def prefix(self, ctx: Context) -> Message:
         """View the current guild prefixes."""
 
-        prefixes = ctx.settings.prefixes or [config.client.prefix]
+        settings = await ctx.settings
+        prefixes = settings.prefixes or [config.client.prefix]
 
         return await ctx.neutral(
             f"The current prefixes are: {', '.join(f'`{prefix}`' for prefix in prefixes)}"
@@ -35,7 +36,8 @@ class Config(Cog):
 
         # TODO: Add a prompt to context.
 
-        await ctx.settings.update(prefixes=[prefix])
+        settings = await ctx.settings
+        await settings.update(prefixes=[prefix])
         return await ctx.approve(f"The prefix has been set to `{prefix}`")
 
     @prefix.command(name="add")
@@ -46,10 +48,11 @@ class Config(Cog):
         if not prefix:
             return await ctx.approve("You must provide a prefix to add!")
 
-        elif prefix in ctx.settings.prefixes:
+        settings = await ctx.settings
+        if prefix in settings.prefixes:
             return await ctx.warn("That prefix is already in use!")
 
-        await ctx.settings.update(prefixes=[*ctx.settings.prefixes, prefix])
+        await settings.update(prefixes=[*settings.prefixes, prefix])
         return await ctx.approve(f"The prefix `{prefix}` has been added")
 
     @prefix.command(name="remove")
@@ -60,12 +63,11 @@ class Config(Cog):
         if not prefix:
             return await ctx.warn("You must provide a prefix to remove!")
 
-        elif prefix not in ctx.settings.prefixes:
+        settings = await ctx.settings
+        if prefix not in settings.prefixes:
             return await ctx.warn("That prefix is not in use!")
 
-        await ctx.settings.update(
-            prefixes=[p for p in ctx.settings.prefixes if p != prefix]
-        )
+        await settings.update(prefixes=[p for p in settings.prefixes if p != prefix])
         return await ctx.approve(f"The prefix `{prefix}` has been removed")
 
     @prefix.command(name="reset")
@@ -73,5 +75,6 @@ class Config(Cog):
     async def prefix_reset(self, ctx: Context) -> Message:
         """Reset the guild prefixes."""
 
-        await ctx.settings.update(prefixes=[])
+        settings = await ctx.settings
+        await settings.update(prefixes=[])
         return await ctx.approve("The prefixes have been reset to the default `;`")
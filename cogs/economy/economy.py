@@ -1,21 +1,29 @@
 from __future__ import annotations
 
-import asyncio
 import random
 from pathlib import Path
 import json
+from datetime import timedelta
+from typing import Annotated, Any, Dict
 
 from discord import Embed, Member
+from discord.utils import format_dt
 from discord.ext.commands import Cog, command
 from discord.ext import commands
 
 from main import Harvest
 from tools.client.context import Context
+from tools.client.members import CachedMember
+from tools.paginator import QueryPageSource, register_source, send_persistent
 from config import config
 
+from .repository import EconomyRepository
+
 
 class Economy(Cog):
     CACHE_TTL = 3600
+    INTEREST_RATE = 0.01
+    INTEREST_EVERY = timedelta(days=1)
 
     def __init__(self, bot: Harvest):
         self.bot = bot
@@ -23,118 +31,111 @@ class Economy(Cog):
         with open(data_path, "r", encoding="utf-8") as f:
             self._msgs = json.load(f)
 
+        register_source("leaderboard", self._leaderboard_source)
+        register_source("history", self._history_source)
+        self.accounts = EconomyRepository(bot, ttl=self.CACHE_TTL)
 
-    async def _get_wallet(self, user_id: int) -> int:
-        key = f"bal:{user_id}"
-        bal = await self.bot.redis.get(key)
-        if bal is not None:
-            await self.bot.redis.expire(key, self.CACHE_TTL)
-            return int(bal)
+    async def cog_load(self) -> None:
+        self.accounts.schedule_warm()
+        self.bot.schedules.register("economy.interest", self.INTEREST_EVERY, self.interest)
 
-        bal = (
-            await self.bot.db.fetchval(
-                "SELECT wallet FROM economy WHERE user_id = $1", user_id
-            )
-            or 0
-        )
-        await self.bot.redis.set(key, bal, ex=self.CACHE_TTL)
-        return int(bal)
-
-    def _schedule_wallet_upsert(self, user_id: int, wallet: int) -> None:
-        async def _upsert():
-            await self.bot.db.execute(
-                """
-                INSERT INTO economy(user_id, wallet)
-                  VALUES($1, $2)
-                ON CONFLICT (user_id) DO UPDATE
-                  SET wallet = EXCLUDED.wallet
-                """,
-                user_id,
-                wallet,
-            )
-        asyncio.create_task(_upsert())
+    async def cog_unload(self) -> None:
+        self.bot.schedules.unregister("economy.interest")
+
+    async def interest(self) -> Dict[str, Any]:
+        return await self.accounts.apply_interest(self.INTEREST_RATE)
 
     @command(name="beg")
     @commands.cooldown(1, 3, commands.BucketType.user)
     async def beg(self, ctx: Context):
         """Beg for money, a early way to get money."""
         user_id = ctx.author.id
-        current = await self._get_wallet(user_id)
 
         category = random.choice(["nothing", "lose", "win"])
         if category == "nothing":
             msg_text = random.choice(self._msgs["nothing"])
-            new_wallet = current
+            account = await self.accounts.get(user_id)
         else:
             amount = random.randint(1, 50)
-            new_wallet = current - amount if category == "lose" else current + amount
             template = random.choice(self._msgs[category])
             msg_text = template.replace("${amount}", f"**${amount}**")
-
-        key = f"bal:{user_id}"
-        await self.bot.redis.set(key, new_wallet, ex=self.CACHE_TTL)
-        self._schedule_wallet_upsert(user_id, new_wallet)
+            account = await self.accounts.adjust(
+                user_id, "beg", wallet=-amount if category == "lose" else amount
+            )
 
         embed = Embed(description=msg_text, color=config.colors.primary)
-        embed.set_footer(text=f"Wallet balance: ${new_wallet}")
+        embed.set_footer(text=f"Wallet balance: ${account.wallet}")
         await ctx.send(embed=embed)
 
-    @command(name="openaccount", aliases=["openacc"])
+    @command(name="openaccount", aliases=["openacc"], extras={"cost": 2})
     @commands.cooldown(1, 10, commands.BucketType.user)
     async def openaccount(self, ctx: Context):
         """Open a bank account by depositing $400 from your wallet."""
         user_id = ctx.author.id
+        account = await self.accounts.get(user_id)
 
-        record = await self.bot.db.fetchrow(
-            "SELECT wallet, bank FROM economy WHERE user_id = $1", user_id
-        )
-        wallet = record["wallet"] or 0 if record else 0
-        bank   = record["bank"]   or 0 if record else 0
-
-        if bank > 0:
+        if account.bank > 0:
             return await ctx.neutral(
-                f"You already have a bank account with **${bank}** in it."
+                f"You already have a bank account with **${account.bank}** in it."
             )
 
-        if wallet < 400:
-            needed = 400 - wallet
+        if account.wallet < 400:
+            needed = 400 - account.wallet
             return await ctx.neutral(
                 f"You need **${needed}** more in your wallet to open a bank account."
             )
 
-        new_wallet = wallet - 400
-        await self.bot.redis.set(f"bal:{user_id}", new_wallet, ex=self.CACHE_TTL)
-
-        async def _open_upsert():
-            await self.bot.db.execute(
-                """
-                INSERT INTO economy(user_id, wallet, bank)
-                  VALUES ($1, $2, 400)
-                ON CONFLICT (user_id) DO UPDATE
-                  SET wallet = EXCLUDED.wallet,
-                      bank   = EXCLUDED.bank
-                """,
-                user_id,
-                new_wallet,
-            )
-        asyncio.create_task(_open_upsert())
+        opened = await self.accounts.open_account(user_id, 400)
+        if not opened:
+            return await ctx.neutral("Your balance just changed, please try again.")
 
         await ctx.neutral(
             f"🏦 Bank account opened! $400 has been moved into your bank.\n"
-            f"Wallet: **${new_wallet}**, Bank: **$400**"
+            f"Wallet: **${opened.wallet}**, Bank: **${opened.bank}**"
+        )
+
+    @command(name="pay", aliases=["give"], extras={"cost": 2})
+    @commands.cooldown(1, 5, commands.BucketType.user)
+    async def pay(
+        self,
+        ctx: Context,
+        member: Annotated[Member, CachedMember],
+        amount: commands.Range[int, 1],
+    ):
+        """Pay someone from your wallet."""
+        if member == ctx.author:
+            return await ctx.neutral("You can't pay yourself.")
+
+        if member.bot:
+            return await ctx.neutral("Bots don't need money.")
+
+        result = await self.accounts.transfer(ctx.author.id, member.id, amount, "pay")
+        if not result:
+            account = await self.accounts.get(ctx.author.id)
+            if account.wallet < amount:
+                return await ctx.neutral(
+                    f"You only have **${account.wallet}** in your wallet."
+                )
+
+            return await ctx.neutral("The payment didn't go through, try again.")
+
+        sender, _ = result
+        await ctx.neutral(
+            f"💸 Paid **${amount}** to {member.mention}.\n"
+            f"Wallet: **${sender.wallet}**"
         )
 
-    @command(name="balance", aliases=["bal"])
+    @command(name="balance", aliases=["bal"], extras={"cost": 3})
     @commands.cooldown(1, 3, commands.BucketType.user)
-    async def balance(self, ctx: Context, member: Member = None):
+    async def balance(
+        self, ctx: Context, member: Annotated[Member, CachedMember] = None
+    ):
         """Show a user's wallet, bank, total balance, and rank."""
         target = member or ctx.author
         user_id = target.id
 
-        record = await self.bot.db.fetchrow(
-            "SELECT wallet, bank FROM economy WHERE user_id = $1", user_id
-        )
-        if not record:
+        account = await self.accounts.get(user_id)
+        if not account.exists:
             if target == ctx.author:
                 return await ctx.neutral(
                     "You don't have an account yet! Use `;openaccount` to open a bank account."
@@ -144,15 +145,11 @@ class Economy(Cog):
                     f"{target.mention} doesn't have an account yet!"
                 )
 
-        wallet = record["wallet"] or 0
-        bank   = record["bank"]   or 0
-        total  = wallet + bank
+        wallet = account.wallet
+        bank   = account.bank
+        total  = account.total
 
-        higher = await self.bot.db.fetchval(
-            "SELECT COUNT(*) FROM economy WHERE (wallet + bank) > $1", total
-        )
-        rank = higher + 1
-        total_players = await self.bot.db.fetchval("SELECT COUNT(*) FROM economy")
+        rank, total_players = await self.accounts.rank(account)
 
         if 10 <= rank % 100 <= 20:
             suffix = "th"
@@ -178,5 +175,64 @@ class Economy(Cog):
 
         await ctx.send(embed=embed)
 
+    def _leaderboard_source(self, bot: Harvest, argument: str) -> QueryPageSource:
+        return QueryPageSource(
+            bot.db,
+            "SELECT user_id, wallet + bank AS total FROM economy",
+            keys=("total", "user_id"),
+            descending=True,
+            format_entry=lambda record: f"<@{record.user_id}> **${record.total}**",
+            embed=Embed(title="Leaderboard"),
+            color=config.colors.primary,
+        )
+
+    @command(name="leaderboard", aliases=["lb", "top"], extras={"cost": 2})
+    @commands.cooldown(1, 5, commands.BucketType.user)
+    async def leaderboard(self, ctx: Context):
+        """View the richest players, only the viewed page is loaded."""
+        await send_persistent(ctx, "leaderboard")
+
+    def _history_source(self, bot: Harvest, argument: str) -> QueryPageSource:
+        return QueryPageSource(
+            bot.db,
+            """
+            SELECT id, kind, wallet, bank, created_at
+            FROM transactions
+            WHERE user_id = $1
+            """,
+            int(argument),
+            keys=("created_at", "id"),
+            descending=True,
+            format_entry=lambda record: (
+                f"{format_dt(record.created_at, 'R')} **{record.kind.replace('_', ' ')}**"
+                + "".join(
+                    f" {name} `{amount:+,}`"
+                    for name, amount in (("wallet", record.wallet), ("bank", record.bank))
+                    if amount
+                )
+            ),
+            embed=Embed(title="Transaction history"),
+            counter=False,
+            color=config.colors.primary,
+        )
+
+    @command(name="history", aliases=["transactions"], extras={"cost": 2})
+    @commands.cooldown(1, 5, commands.BucketType.user)
+    async def history(
+        self, ctx: Context, member: Annotated[Member, CachedMember] = None
+    ):
+        """View the changes to a balance, newest first."""
+        target = member or ctx.author
+
+        # Show what was recorded in the last few seconds too.
+        await self.bot.ledger.flush()
+        try:
+            await send_persistent(ctx, "history", str(target.id))
+        except ValueError:
+            return await ctx.neutral(
+                f"{target.mention} doesn't have any transactions yet!"
+            )
+
+
 async def setup(bot: Harvest):
     await bot.add_cog(Economy(bot))
@@ -0,0 +1,498 @@
+from __future__ import annotations
+
+import asyncio
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from hashlib import sha1
+from logging import getLogger
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from redis.typing import EncodableT
+
+from tools.client.loader import DataLoader
+from tools.client.redis import encode
+
+if TYPE_CHECKING:
+    from main import Harvest
+
+log = getLogger("Harvest/economy")
+
+TOTALS = "economy:totals"
+WARM = "economy:totals:warm"
+# Held while the totals are rebuilt into BUILD, which then replaces them.
+BUILDING = "economy:totals:building"
+BUILD = "economy:totals:build"
+# The totals are rebuilt this often, so any drift doesn't last.
+WARM_TTL = 86400
+
+# Only replace cached accounts with newer versions, and keep the totals
+# used for ranks in step with them, as well as the ones being rebuilt.
+# All of the accounts are applied at once, so nobody sees one side of a
+# transfer without the other.
+STORE_SCRIPT = b"""
+    local stored = 0
+    local building = redis.call("exists", KEYS[2]) == 1
+    for index = 4, #KEYS do
+        local offset = (index - 4) * 4
+        local version = tonumber(ARGV[offset + 3])
+        local current = redis.call("get", KEYS[index])
+        local newer = true
+        if current then
+            local ok, account = pcall(cjson.decode, current)
+            if ok and tonumber(account["version"]) >= version then
+                newer = false
+            end
+        end
+        if newer then
+            redis.call("set", KEYS[index], ARGV[offset + 2], "ex", ARGV[1])
+            if version > 0 then
+                redis.call("zadd", KEYS[1], ARGV[offset + 5], ARGV[offset + 4])
+                if building then
+                    redis.call("zadd", KEYS[3], ARGV[offset + 5], ARGV[offset + 4])
+                end
+            end
+            stored = stored + 1
+        end
+    end
+    return stored
+"""
+STORE_SCRIPT_HASH = sha1(STORE_SCRIPT).hexdigest()
+
+ACCOUNT_COLUMNS = "user_id, wallet, bank, version"
+
+
+class Account(NamedTuple):
+    user_id: int
+    wallet: int = 0
+    bank: int = 0
+    # Bumped by every write, zero until the account has a row.
+    version: int = 0
+
+    @property
+    def exists(self) -> bool:
+        return self.version > 0
+
+    @property
+    def total(self) -> int:
+        return self.wallet + self.bank
+
+    def to_dict(self) -> dict:
+        return {"wallet": self.wallet, "bank": self.bank, "version": self.version}
+
+
+class Transfer(NamedTuple):
+    sender: int
+    recipient: int
+    amount: int
+
+
+def key(user_id: int) -> str:
+    return f"acct:{user_id}"
+
+
+class EconomyRepository:
+    """
+    The one place economy accounts are read and written.
+
+    Reads go through Redis, misses are loaded from PostgreSQL in batches and
+    cached without overwriting anything newer. Writes are applied in
+    PostgreSQL first, then the new version is cached, so a reader sees either
+    the old account or the new one but never a stale cache after a write.
+    """
+
+    def __init__(self, bot: "Harvest", ttl: int = 3600):
+        self.bot = bot
+        self.ttl = ttl
+        self.loader: DataLoader[int, Account] = DataLoader(self.load)
+        self.warming: Optional[asyncio.Task[None]] = None
+
+    async def get(self, user_id: int) -> Account:
+        return await self.loader.load(user_id)
+
+    async def get_many(self, user_ids: Iterable[int]) -> List[Account]:
+        return await self.loader.load_many(user_ids)
+
+    async def load(self, user_ids: List[int]) -> Dict[int, Account]:
+        cached = await self.bot.redis.mget([key(user_id) for user_id in user_ids])
+        accounts = {
+            user_id: Account(user_id, value["wallet"], value["bank"], value["version"])
+            for user_id, value in zip(user_ids, cached)
+            if isinstance(value, dict)
+        }
+
+        missing = [user_id for user_id in user_ids if user_id not in accounts]
+        if not missing:
+            return accounts
+
+        records = await self.bot.db.fetch(
+            f"SELECT {ACCOUNT_COLUMNS} FROM economy WHERE user_id = ANY($1::BIGINT[])",
+            missing,
+        )
+        loaded = {record["user_id"]: Account(*record) for record in records}
+
+        # NX so that a write which landed meanwhile isn't replaced.
+        async with self.bot.redis.pipeline(transaction=False) as pipeline:
+            for user_id in missing:
+                account = loaded.get(user_id) or Account(user_id)
+                pipeline.set(key(user_id), encode(account.to_dict()), ex=self.ttl, nx=True)
+                accounts[user_id] = account
+
+            await pipeline.execute()
+
+        return accounts
+
+    async def store(self, *accounts: Account) -> None:
+        if not accounts:
+            return
+
+        arguments: List[EncodableT] = [self.ttl]
+        for account in accounts:
+            arguments.extend(
+                (
+                    encode(account.to_dict()),
+                    account.version,
+                    account.user_id,
+                    account.total,
+                )
+            )
+
+        await self.bot.redis.script(
+            STORE_SCRIPT,
+            STORE_SCRIPT_HASH,
+            [TOTALS, BUILDING, BUILD, *(key(account.user_id) for account in accounts)],
+            arguments,
+        )
+
+    async def adjust(
+        self,
+        user_id: int,
+        kind: str,
+        *,
+        wallet: int = 0,
+        bank: int = 0,
+    ) -> Account:
+        """
+        Add to a balance atomically, creating the account if needed.
+        """
+
+        record = await self.bot.db.fetchrow(
+            f"""
+            INSERT INTO economy (user_id, wallet, bank, version)
+            VALUES ($1, $2, $3, 1)
+            ON CONFLICT (user_id) DO UPDATE
+            SET wallet = economy.wallet + EXCLUDED.wallet,
+                bank = economy.bank + EXCLUDED.bank,
+                version = economy.version + 1
+            RETURNING {ACCOUNT_COLUMNS}
+            """,
+            user_id,
+            wallet,
+            bank,
+        )
+        account = Account(*record)  # type: ignore
+        self.bot.ledger.record(user_id, kind, wallet=wallet, bank=bank)
+        await self.store(account)
+        return account
+
+    async def open_account(self, user_id: int, deposit: int) -> Optional[Account]:
+        """
+        Move `deposit` from the wallet into an empty bank.
+        Returns None when the account isn't eligible anymore.
+        """
+
+        record = await self.bot.db.fetchrow(
+            f"""
+            UPDATE economy
+            SET wallet = wallet - $2,
+                bank = bank + $2,
+                version = version + 1
+            WHERE user_id = $1
+              AND wallet >= $2
+              AND bank = 0
+            RETURNING {ACCOUNT_COLUMNS}
+            """,
+            user_id,
+            deposit,
+        )
+        if not record:
+            return None
+
+        account = Account(*record)
+        self.bot.ledger.record(user_id, "open_account", wallet=-deposit, bank=deposit)
+        await self.store(account)
+        return account
+
+    async def settle(
+        self,
+        transfers: Sequence[Transfer],
+        kind: str = "transfer",
+    ) -> Optional[List[Account]]:
+        """
+        Apply a batch of transfers between wallets in one statement.
+
+        The net change of every account involved is applied at once, with
+        the rows locked in user_id order so that concurrent settlements can't
+        deadlock. Either every transfer is applied or, when any wallet which
+        pays out on balance would go negative, none of them and None is
+        returned. Wallets which are already negative can still be paid into.
+        """
+
+        if not transfers:
+            return []
+
+        if any(transfer.amount <= 0 for transfer in transfers):
+            raise ValueError("transfer amounts must be positive")
+
+        records = await self.bot.db.fetch(
+            f"""
+            WITH transfers AS (
+                SELECT *
+                FROM unnest($1::BIGINT[], $2::BIGINT[], $3::BIGINT[])
+                  AS transfer (sender, recipient, amount)
+            ), deltas AS (
+                SELECT user_id, SUM(delta)::BIGINT AS delta
+                FROM (
+                    SELECT sender AS user_id, -amount AS delta FROM transfers
+                    UNION ALL
+                    SELECT recipient, amount FROM transfers
+                ) AS changes
+                GROUP BY user_id
+            ), locked AS MATERIALIZED (
+                SELECT user_id, wallet
+                FROM economy
+                WHERE user_id IN (SELECT user_id FROM deltas)
+                ORDER BY user_id
+                FOR UPDATE
+            ), allowed AS MATERIALIZED (
+                SELECT NOT EXISTS (
+                    SELECT 1
+                    FROM deltas
+                    LEFT JOIN locked USING (user_id)
+                    WHERE deltas.delta < 0
+                      AND COALESCE(locked.wallet, 0) + deltas.delta < 0
+                ) AS ok
+            )
+            INSERT INTO economy (user_id, wallet, version)
+            SELECT user_id, delta, 1
+            FROM deltas
+            WHERE (SELECT ok FROM allowed)
+            ORDER BY user_id
+            ON CONFLICT (user_id) DO UPDATE
+            SET wallet = economy.wallet + EXCLUDED.wallet,
+                version = economy.version + 1
+            RETURNING {ACCOUNT_COLUMNS}
+            """,
+            [transfer.sender for transfer in transfers],
+            [transfer.recipient for transfer in transfers],
+            [transfer.amount for transfer in transfers],
+        )
+        if not records:
+            return None
+
+        for sender, recipient, amount in transfers:
+            self.bot.ledger.record(sender, kind, wallet=-amount)
+            self.bot.ledger.record(recipient, kind, wallet=amount)
+
+        accounts = [Account(*record) for record in records]
+        await self.store(*accounts)
+        return accounts
+
+    async def transfer(
+        self,
+        sender: int,
+        recipient: int,
+        amount: int,
+        kind: str = "transfer",
+    ) -> Optional[Tuple[Account, Account]]:
+        """
+        Move `amount` from one wallet to another atomically.
+        Returns None when the sender can't afford it.
+        """
+
+        if sender == recipient:
+            raise ValueError("can't transfer to the same account")
+
+        accounts = await self.settle([Transfer(sender, recipient, amount)], kind)
+        if accounts is None:
+            return None
+
+        by_user = {account.user_id: account for account in accounts}
+        return by_user[sender], by_user[recipient]
+
+    async def apply_interest(
+        self,
+        rate: float,
+        chunk: int = 1000,
+        on: Optional[date] = None,
+    ) -> Dict[str, Any]:
+        """
+        Add `rate` of every bank balance to it, rounded down, once per day.
+
+        Each chunk of accounts is one UPDATE in its own transaction,
+        walking the user_id range, so no lock is held for long. Accounts are
+        marked with the day they were paid, so a run which was interrupted
+        can be repeated and only pays the accounts it didn't get to.
+        """
+
+        on = on or datetime.now(timezone.utc).date()
+        after, touched, paid, chunks = 0, 0, 0, 0
+        while True:
+            records = await self.bot.db.fetch(
+                """
+                WITH chunk AS MATERIALIZED (
+                    SELECT user_id, FLOOR(bank * $3::NUMERIC)::BIGINT AS interest
+                    FROM economy
+                    WHERE user_id > $1
+                    ORDER BY user_id
+                    LIMIT $2
+                ), updated AS (
+                    UPDATE economy
+                    SET bank = economy.bank + chunk.interest,
+                        version = economy.version + 1,
+                        last_interest_on = $4
+                    FROM chunk
+                    WHERE economy.user_id = chunk.user_id
+                      AND chunk.interest > 0
+                      AND economy.last_interest_on IS DISTINCT FROM $4
+                    RETURNING economy.user_id, economy.wallet, economy.bank,
+                              economy.version, chunk.interest
+                )
+                SELECT chunk_end.user_id AS chunk_end, updated.*
+                FROM (SELECT MAX(user_id) AS user_id FROM chunk) AS chunk_end
+                LEFT JOIN updated ON true
+                """,
+                after,
+                chunk,
+                Decimal(str(rate)),
+                on,
+            )
+            if not records or records[0]["chunk_end"] is None:
+                break
+
+            after = records[0]["chunk_end"]
+            chunks += 1
+            accounts: List[Account] = []
+            for record in records:
+                if record["user_id"] is None:
+                    continue
+
+                accounts.append(
+                    Account(record["user_id"], record["wallet"], record["bank"], record["version"])
+                )
+                self.bot.ledger.record(record["user_id"], "interest", bank=record["interest"])
+                paid += record["interest"]
+
+            await self.store(*accounts)
+            touched += len(accounts)
+
+        return {"accounts": touched, "interest": paid, "chunks": chunks}
+
+    async def rank(self, account: Account) -> Tuple[int, int]:
+        """
+        The rank of an account by total and the number of accounts,
+        from the cached totals once they've been built.
+        """
+
+        if await self.bot.redis.exists(WARM):
+            async with self.bot.redis.pipeline(transaction=False) as pipeline:
+                pipeline.zcount(TOTALS, f"({account.total}", "+inf")
+                pipeline.zcard(TOTALS)
+                higher, players = await pipeline.execute()
+
+            return higher + 1, players
+
+        self.schedule_warm()
+        higher = await self.bot.db.fetchval(
+            "SELECT COUNT(*) FROM economy WHERE (wallet + bank) > $1", account.total
+        )
+        players = await self.bot.db.fetchval("SELECT COUNT(*) FROM economy")
+        return higher + 1, players  # type: ignore
+
+    def schedule_warm(self) -> None:
+        if self.warming and not self.warming.done():
+            return
+
+        self.warming = self.bot.tasks.spawn(
+            self.warm(), group="economy.cache", name="economy-warm"
+        )
+
+    async def warm(self, chunk: int = 5000) -> None:
+        """
+        Rebuild the cached totals from PostgreSQL, unless they're current.
+
+        They're built aside and swapped in whole, so deleted accounts drop
+        out. Writes made meanwhile land in the new totals as well, and the
+        snapshot only adds the accounts they didn't touch.
+        """
+
+        if await self.bot.redis.exists(WARM):
+            return
+
+        # Only one process builds them.
+        if not await self.bot.redis.set(BUILDING, 1, ex=600, nx=True):
+            return
+
+        count = 0
+        try:
+            await self.bot.redis.delete(BUILD)
+            async with self.bot.db.acquire() as connection:
+                async with connection.transaction():
+                    batch: Dict[str, int] = {}
+                    async for record in connection.cursor(
+                        "SELECT user_id, wallet + bank AS total FROM economy",
+                        prefetch=chunk,
+                    ):
+                        batch[str(record["user_id"])] = record["total"]
+                        if len(batch) >= chunk:
+                            await self.bot.redis.zadd(BUILD, batch, nx=True)
+                            await self.bot.redis.expire(BUILDING, 600)
+                            count += len(batch)
+                            batch.clear()
+
+                    if batch:
+                        await self.bot.redis.zadd(BUILD, batch, nx=True)
+                        count += len(batch)
+
+            # Nothing at all was written when there are no accounts.
+            built = await self.bot.redis.exists(BUILD)
+            async with self.bot.redis.pipeline(transaction=True) as pipeline:
+                if built:
+                    pipeline.rename(BUILD, TOTALS)
+                else:
+                    pipeline.delete(TOTALS)
+
+                pipeline.set(WARM, 1, ex=WARM_TTL)
+                pipeline.delete(BUILDING)
+                await pipeline.execute()
+        finally:
+            await self.bot.redis.delete(BUILDING)
+
+        log.info("Cached the totals of %s economy accounts.", count)
+
+    async def invalidate(self, user_ids: Iterable[int]) -> None:
+        """
+        Drop cached accounts which were changed behind our back, the totals
+        are rebuilt as well since they can't be trusted anymore either.
+        """
+
+        keys = [key(user_id) for user_id in user_ids]
+        if keys:
+            await self.bot.redis.delete(*keys, WARM)
+            self.schedule_warm()
+
+
+__all__ = (
+    "Account",
+    "EconomyRepository",
+    "Transfer",
+)
@@ -0,0 +1,10 @@
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from main import Harvest
+
+
+async def setup(bot: "Harvest") -> None:
+    from .owner import Owner
+
+    await bot.add_cog(Owner(bot))
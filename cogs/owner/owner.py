@@ -0,0 +1,293 @@
+from __future__ import annotations
+
+import asyncio
+from io import BytesIO
+from logging import getLogger
+from typing import List, Optional
+
+from discord import File, Message
+from discord.ext import tasks
+from discord.ext.commands import Cog, FlagConverter, Greedy, Range, command, group
+from discord.utils import utcnow
+
+from cogs.economy.repository import EconomyRepository
+from main import Harvest
+from tools.client.context import Context
+from tools.client.memory import MemoryReport
+from tools.client.metrics import render_table
+from tools.client.profiler import SamplingProfiler
+from tools.paginator import Paginator
+
+log = getLogger("Harvest/owner")
+
+
+class ProfileFlags(FlagConverter, delimiter=" ", prefix="--"):
+    seconds: Range[float, 1, 120] = 10
+    everything: bool = False
+    tag: bool = True
+
+
+class RepairFlags(FlagConverter, delimiter=" ", prefix="--"):
+    apply: bool = False
+
+
+class Owner(Cog):
+    def __init__(self, bot: Harvest):
+        self.bot = bot
+        self.profiling = asyncio.Lock()
+
+    async def cog_load(self) -> None:
+        self.http_report.start()
+
+    async def cog_unload(self) -> None:
+        self.http_report.cancel()
+
+    async def cog_check(self, ctx: Context) -> bool:  # type: ignore
+        return await self.bot.is_owner(ctx.author)
+
+    async def send_report(self, ctx: Context, report: str, filename: str) -> Message:
+        if len(report) > 1900:
+            return await ctx.send(
+                file=File(BytesIO(report.encode("utf-8")), filename=filename)
+            )
+
+        return await ctx.send(f"```\n{report}\n```")
+
+    @tasks.loop(minutes=15)
+    async def http_report(self) -> None:
+        if self.bot.telemetry.routes:
+            log.info("Discord HTTP summary:\n%s", self.bot.telemetry.summary())
+
+    @group(name="http", invoke_without_command=True)
+    async def http(self, ctx: Context) -> Message:
+        """View Discord HTTP telemetry per route."""
+
+        return await self.send_report(ctx, self.bot.telemetry.summary(), "http.txt")
+
+    @http.command(name="reset")
+    async def http_reset(self, ctx: Context) -> Message:
+        """Reset the Discord HTTP telemetry."""
+
+        self.bot.telemetry.reset()
+        return await ctx.approve("The HTTP telemetry has been reset")
+
+    @group(name="admission", invoke_without_command=True)
+    async def admission(self, ctx: Context) -> Message:
+        """View the admission decisions, blocked guilds and the command queue."""
+
+        report = self.bot.admission.summary() + "\n\n" + self.bot.scheduler.summary()
+        return await self.send_report(ctx, report, "admission.txt")
+
+    @admission.command(name="block")
+    async def admission_block(
+        self,
+        ctx: Context,
+        guild_id: int,
+        seconds: Optional[Range[float, 1]] = None,
+    ) -> Message:
+        """Block a guild from running commands, until unblocked without a duration."""
+
+        self.bot.admission.block(guild_id, seconds)
+        return await ctx.approve(
+            f"Blocked `{guild_id}` for **{seconds:.0f} seconds**"
+            if seconds
+            else f"Blocked `{guild_id}` until it's unblocked"
+        )
+
+    @admission.command(name="unblock")
+    async def admission_unblock(self, ctx: Context, guild_id: int) -> Message:
+        """Let a blocked guild run commands again."""
+
+        self.bot.admission.unblock(guild_id)
+        return await ctx.approve(f"Unblocked `{guild_id}`")
+
+    def render_drift(self, drift: List) -> str:
+        return render_table(
+            ("user", "wallet", "bank", "ledger wallet", "ledger bank"),
+            [
+                (
+                    record["user_id"],
+                    record["wallet"],
+                    record["bank"],
+                    record["ledger_wallet"],
+                    record["ledger_bank"],
+                )
+                for record in drift
+            ],
+        )
+
+    @group(name="ledger", invoke_without_command=True)
+    async def ledger(self, ctx: Context) -> Message:
+        """View the accounts whose balance disagrees with the ledger."""
+
+        drift = await self.bot.ledger.drift()
+        if not drift:
+            return await ctx.approve("Every balance matches the ledger")
+
+        return await self.send_report(ctx, self.render_drift(drift), "ledger.txt")
+
+    @ledger.command(name="repair")
+    async def ledger_repair(
+        self,
+        ctx: Context,
+        user_ids: Greedy[int],
+        *,
+        flags: RepairFlags,
+    ) -> Message:
+        """
+        Preview rebuilding the given balances from the ledger.
+        They're only overwritten once --apply is passed.
+        """
+
+        if not user_ids:
+            return await ctx.warn("Pass the users whose balances should be rebuilt!")
+
+        if self.bot.ledger.dropped:
+            return await ctx.warn(
+                f"The ledger dropped **{self.bot.ledger.dropped:,}** entries, it can't be trusted!"
+            )
+
+        drift = await self.bot.ledger.repair(user_ids, apply=flags.apply)
+        if not drift:
+            return await ctx.approve("None of those balances can be rebuilt differently")
+
+        if not flags.apply:
+            await self.send_report(ctx, self.render_drift(drift), "repair.txt")
+            return await ctx.neutral(
+                f"Would rebuild **{len(drift):,}** balances, pass `--apply` to write them"
+            )
+
+        economy = self.bot.get_cog("Economy")
+        accounts = getattr(economy, "accounts", None) or EconomyRepository(self.bot)
+        await accounts.invalidate([record["user_id"] for record in drift])
+
+        return await ctx.approve(f"Rebuilt **{len(drift):,}** balances from the ledger")
+
+    @command(name="tasks")
+    async def background_tasks(self, ctx: Context) -> Message:
+        """View the background task groups."""
+
+        return await self.send_report(ctx, self.bot.tasks.summary(), "tasks.txt")
+
+    @command(name="paginators")
+    async def paginators(self, ctx: Context) -> Message:
+        """View the paginator edits sent, failed and saved by coalescing."""
+
+        return await self.send_report(ctx, Paginator.summary(), "paginators.txt")
+
+    @group(name="schedules", invoke_without_command=True)
+    async def schedules(self, ctx: Context) -> Message:
+        """View the periodic jobs and how their last runs went."""
+
+        return await self.send_report(ctx, await self.bot.schedules.summary(), "schedules.txt")
+
+    @schedules.command(name="run")
+    async def schedules_run(self, ctx: Context, name: str) -> Message:
+        """Run a periodic job now, without moving its next run."""
+
+        if name not in self.bot.schedules.jobs:
+            return await ctx.warn(f"There is no schedule named `{name}`!")
+
+        result = await self.bot.schedules.execute(name)
+
+        return await ctx.approve(
+            f"Ran `{name}`: "
+            + (", ".join(f"{key} **{value:,}**" for key, value in (result or {}).items()) or "done")
+        )
+
+    @command(name="jobs")
+    async def jobs(self, ctx: Context) -> Message:
+        """View the delayed job queue and its workers."""
+
+        return await self.send_report(ctx, await self.bot.jobs.summary(), "jobs.txt")
+
+    @group(name="events", invoke_without_command=True)
+    async def events(self, ctx: Context) -> Message:
+        """View the gateway events received and processed."""
+
+        return await self.send_report(ctx, self.bot.events.summary(), "events.txt")
+
+    @events.command(name="reset")
+    async def events_reset(self, ctx: Context) -> Message:
+        """Reset the gateway event counters."""
+
+        self.bot.events.reset()
+        return await ctx.approve("The gateway event counters have been reset")
+
+    @group(name="loop", invoke_without_command=True)
+    async def loop(self, ctx: Context) -> Message:
+        """View event loop lag and recent stalls."""
+
+        return await self.send_report(ctx, self.bot.monitor.summary(), "loop.txt")
+
+    @loop.command(name="stall")
+    async def loop_stall(self, ctx: Context, index: int = 1) -> Message:
+        """View the full stack of a recent stall."""
+
+        stalls = list(reversed(self.bot.monitor.stalls))
+        if not 0 < index <= len(stalls):
+            return await ctx.warn("There is no stall with that index!")
+
+        stall = stalls[index - 1]
+        return await self.send_report(
+            ctx,
+            f"{stall.command or 'unknown'} blocked for {stall.duration * 1000:.0f}ms\n\n"
+            + "".join(stall.stack),
+            "stall.txt",
+        )
+
+    @group(name="trace", invoke_without_command=True)
+    async def trace(self, ctx: Context, *, command: str = "") -> Message:
+        """View latency percentiles per command, or per phase of a command."""
+
+        return await self.send_report(
+            ctx, self.bot.tracer.summary(command or None), "trace.txt"
+        )
+
+    @trace.command(name="reset")
+    async def trace_reset(self, ctx: Context) -> Message:
+        """Reset the command latency traces."""
+
+        self.bot.tracer.reset()
+        return await ctx.approve("The command traces have been reset")
+
+    @command(name="profile")
+    async def profile(self, ctx: Context, *, flags: ProfileFlags) -> Message:
+        """
+        Sample the live process and upload collapsed stacks for a flamegraph.
+        Only the event loop thread is sampled unless --everything is passed.
+        """
+
+        if self.profiling.locked():
+            return await ctx.warn("A profile is already being recorded!")
+
+        async with self.profiling:
+            await ctx.neutral(f"Profiling for **{flags.seconds:g}** seconds..")
+            profiler = SamplingProfiler(
+                loop_only=not flags.everything,
+                monitor=self.bot.monitor if flags.tag else None,
+            )
+            collapsed = await profiler.profile(flags.seconds)
+
+        return await ctx.send(
+            f"Collected **{profiler.samples:,}** samples "
+            f"over **{len(profiler.stacks):,}** unique stacks.",
+            file=File(
+                BytesIO(collapsed.encode("utf-8")),
+                filename=f"profile-{utcnow():%Y%m%d-%H%M%S}.collapsed.txt",
+            ),
+        )
+
+    @command(name="memory", aliases=["mem"])
+    async def memory(self, ctx: Context, seconds: Range[float, 0, 600] = 0) -> Message:
+        """
+        View object counts, cache sizes and RSS.
+        Pass a number of seconds to also diff allocations over that interval.
+        """
+
+        report = MemoryReport(self.bot)
+        if seconds:
+            await ctx.neutral(f"Tracing allocations for **{seconds:g}** seconds..")
+            await report.diff(seconds)
+
+        return await self.send_report(ctx, await report.render(), "memory.txt")
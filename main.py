@@ -1,23 +1,48 @@
 from __future__ import annotations
-from typing import List, cast, Optional
+from time import perf_counter
+
+BOOT = perf_counter()
+
+from typing import List, Optional, Tuple
 from pathlib import Path
 
 from aiohttp import ClientSession, TCPConnector
 from datetime import datetime
 from logging import DEBUG, getLogger
+from contextvars import ContextVar
 import asyncio
+import sys
 
 from colorama import Fore, Style
 
 import discord
-from discord import AllowedMentions, Intents, ClientUser, Interaction
+from discord import (
+    AllowedMentions,
+    Intents,
+    ClientUser,
+    Interaction,
+    MemberCacheFlags,
+    RawMemberRemoveEvent,
+)
 from discord.ext import commands
 from discord.message import Message
 from discord.ext.commands import Bot, when_mentioned_or, MinimalHelpCommand
 from discord.utils import utcnow
 
 from tools.client import Redis, database, init_logging, Context
-from tools.client.database import Database, Settings
+from tools.client.admission import Admission
+from tools.client.database import Database, Ledger, Schedules, fetch_prefixes
+from tools.client.events import EventFilter, intent_profile
+from tools.client.jobs import JobQueue
+from tools.client.members import MemberCache
+from tools.client.monitor import LoopMonitor
+from tools.client.outbound import Outbound
+from tools.client.scheduler import Scheduler
+from tools.client.tasks import TaskManager
+from tools.client.telemetry import HTTPTelemetry, current_command
+from tools.client.tracing import Tracer, current_trace, span
+from tools.client.startup import Timeline
+from tools.paginator import PageButton
 
 from config import config
 
@@ -27,24 +52,17 @@ log = getLogger("bot")
 async def get_prefix(bot: "Harvest", message: Message) -> List[str]:
     prefix = [config.client.prefix]
     if message.guild:
-        prefix = (
-            cast(
-                Optional[List[str]],
-                await bot.db.fetchval(
-                    """
-                    SELECT prefixes
-                    FROM settings
-                    WHERE guild_id = $1
-                    """,
-                    message.guild.id,
-                ),
-            )
-            or prefix
-        )
+        prefix = await fetch_prefixes(bot, message.guild.id) or prefix
 
     return when_mentioned_or(*prefix)(bot, message)
 
 
+# The prefixes resolved by on_message, reused by get_context in the same task.
+resolved_prefixes: ContextVar[Optional[Tuple[int, List[str]]]] = ContextVar(
+    "resolved_prefixes", default=None
+)
+
+
 class CleanHelp(MinimalHelpCommand):
     """
     Simplified help command that filters out Owner, Jishaku, and uncategorized commands,
@@ -77,8 +95,35 @@ class Harvest(Bot):
     uptime: datetime
     database: Database
     redis: Redis
+    startup: Timeline
+    outbound: Outbound
+    telemetry: HTTPTelemetry
+    monitor: LoopMonitor
+    tracer: Tracer
+    members: MemberCache
+    events: EventFilter
+    admission: Admission
+    scheduler: Scheduler
+    tasks: TaskManager
+    ledger: Ledger
+    schedules: Schedules
+    jobs: JobQueue
 
     def __init__(self, *args, **kwargs):
+        self.startup = Timeline(origin=BOOT)
+        self.startup.mark("imports")
+        self.telemetry = HTTPTelemetry()
+        self.monitor = LoopMonitor()
+        self.tracer = Tracer(
+            sink=None if sys.stdout.isatty() else "Harvest.traces.jsonl"
+        )
+        # Only members who recently interacted are kept, and guilds aren't
+        # chunked, everyone else is fetched when a command needs them.
+        self.members = MemberCache(self, maxsize=kwargs.pop("member_cache_size", 10_000))
+        # "auto" narrows the intents below to what the loaded cogs listen to.
+        self.intent_profile = kwargs.pop("intent_profile", "auto")
+        self.events = EventFilter(self)
+
         super().__init__(
             *args,
             **kwargs,
@@ -91,6 +136,8 @@ class Harvest(Bot):
                 message_content=True,
                 emojis_and_stickers=True,
             ),
+            member_cache_flags=MemberCacheFlags.none(),
+            chunk_guilds_at_startup=False,
             allowed_mentions=AllowedMentions(
                 everyone=False, roles=False, users=True, replied_user=True
             ),
@@ -98,7 +145,13 @@ class Harvest(Bot):
             case_insensitive=True,
             owner_ids=config.client.owners,
             help_command=CleanHelp(),
+            http_trace=self.telemetry.trace,
         )
+        self.telemetry.install(self.http)
+        self.events.install(self._connection)
+        self.outbound = Outbound(self)
+        self.before_invoke(self.trace_before_invoke)
+        self.after_invoke(self.trace_after_invoke)
         self.buckets = {
             "guild_commands": {
                 "lock": asyncio.Lock(),
@@ -108,39 +161,67 @@ class Harvest(Bot):
                 "blocked": set(),
             }
         }
-
-    @staticmethod
-    async def command_cooldown(ctx: Context) -> bool:
-        if ctx.author.id == ctx.guild.owner_id:
-            return True
-
-        data = ctx.bot.buckets["guild_commands"]
-        if ctx.guild.id in data["blocked"]:
-            return False
-
-        bucket = data["cooldown"].get_bucket(ctx.message)
-        return bucket.update_rate_limit() is None
+        self.admission = Admission(self)
+        self.scheduler = Scheduler()
+        self.tasks = TaskManager()
+        self.ledger = Ledger(self)
+        self.schedules = Schedules(self)
+        self.jobs = JobQueue(self)
 
     async def on_message(self, message: Message):
         if message.author.bot:
             return
 
-        mention_forms = {self.user.mention, f"<@!{self.user.id}>"}
-        if message.content.strip() in mention_forms:
-            ctx = await self.get_context(message)
+        self.members.remember(message.author)
+        trace, trace_token = self.tracer.begin()
+        with span("prefix"):
+            prefixes = await self.get_prefix(message)
 
-            prefixes = ctx.settings.prefixes or [config.client.prefix]
+        token = resolved_prefixes.set((message.id, prefixes))
+        try:
+            mention_forms = {self.user.mention, f"<@!{self.user.id}>"}
+            mentioned = message.content.strip() in mention_forms
 
-            if len(prefixes) > 1:
-                text = "The current prefixes are: " + ", ".join(
-                    f"`{p}`" for p in prefixes
-                )
-            else:
-                text = f"The current prefix is `{prefixes[0]}`"
+            # Non-command traffic stops here, before a Context is built.
+            if not mentioned and not message.content.startswith(tuple(prefixes)):
+                return
+
+            if not self.admission.admit(message):
+                return
+
+            with self.admission.running():
+                if not mentioned:
+                    return await self.process_commands(message)
+
+                ctx = await self.get_context(message)
+                prefixes = (
+                    message.guild and await fetch_prefixes(self, message.guild.id)
+                ) or [config.client.prefix]
+
+                if len(prefixes) > 1:
+                    text = "The current prefixes are: " + ", ".join(
+                        f"`{p}`" for p in prefixes
+                    )
+                else:
+                    text = f"The current prefix is `{prefixes[0]}`"
+
+                return await ctx.neutral(text)
+        finally:
+            resolved_prefixes.reset(token)
+            self.tracer.finish(trace, trace_token)
+
+    async def on_interaction(self, interaction: Interaction) -> None:
+        self.members.remember(interaction.user)
+
+    async def on_raw_member_remove(self, payload: RawMemberRemoveEvent) -> None:
+        self.members.forget(payload.guild_id, payload.user.id)
 
-            return await ctx.neutral(text)
+    async def get_prefix(self, message: Message) -> List[str]:
+        resolved = resolved_prefixes.get()
+        if resolved and resolved[0] == message.id:
+            return resolved[1]
 
-        await self.process_commands(message)
+        return await super().get_prefix(message)  # type: ignore
 
     @property
     def db(self) -> Database:
@@ -152,9 +233,39 @@ class Harvest(Bot):
 
     async def setup_hook(self) -> None:
         self.session = ClientSession(connector=TCPConnector(ssl=False))
+        self.add_dynamic_items(PageButton)
+        self.monitor.start()
 
-        self.database = await database.connect()
-        self.redis = await Redis.from_url()
+        with self.startup.phase("dependencies"):
+            self.database, self.redis = await self.startup.gather(
+                ("postgres", database.connect()),
+                ("redis", Redis.from_url()),
+            )
+            await database.migrate(self.database)
+            await self.ledger.start()
+
+        # Extensions only register commands and listeners, none of them
+        # depend on gateway state so they can be loaded before READY.
+        with self.startup.phase("extensions"):
+            await self.load_extensions()
+
+        # Started once the extensions have registered their jobs.
+        self.tasks.group("schedules", limit=4)
+        self.schedules.start()
+        self.jobs.start()
+
+        # Intents are only sent when identifying, which happens after this.
+        # Cogs loaded later widen them again, see load_extension.
+        if self.intent_profile == "auto":
+            intents = intent_profile(self)
+            unused = [
+                flag
+                for flag, enabled in self.intents
+                if enabled and not getattr(intents, flag)
+            ]
+            log.info("Dropping the intents no cog listens to: %s.", ", ".join(unused) or "none")
+            # DEP-WARN: ConnectionState._intents is what IDENTIFY sends.
+            self._connection._intents = intents
 
     async def on_ready(self) -> None:
         if hasattr(self, "uptime"):
@@ -165,10 +276,56 @@ class Harvest(Bot):
         )
         self.uptime = utcnow()
 
-        await self.load_extensions()
+        self.startup.mark("ready")
+        self.startup.report()
+
+    async def load_extension(self, name: str, *, package: Optional[str] = None) -> None:
+        await super().load_extension(name, package=package)
+        self.widen_intents(name)
+
+    async def reload_extension(self, name: str, *, package: Optional[str] = None) -> None:
+        await super().reload_extension(name, package=package)
+        self.widen_intents(name)
+
+    def widen_intents(self, extension: str) -> None:
+        """
+        Add the intents a cog loaded after startup needs. They're only sent
+        on the next IDENTIFY, a resumed session keeps the old ones, so the
+        shard has to reconnect before those events arrive.
+        """
+
+        if self.intent_profile != "auto" or not self.is_ready():
+            return
+
+        current = self._connection._intents
+        missing = [
+            flag
+            for flag, enabled in intent_profile(self)
+            if enabled and not getattr(current, flag)
+        ]
+        if not missing:
+            return
+
+        intents = Intents(**dict(current))
+        for flag in missing:
+            setattr(intents, flag, True)
+
+        # DEP-WARN: ConnectionState._intents is what IDENTIFY sends.
+        self._connection._intents = intents
+        log.warning(
+            "Extension %s needs the %s intents, they take effect once the shards reconnect.",
+            extension,
+            ", ".join(missing),
+        )
+
+    async def load_extension_safe(self, name: str) -> None:
+        try:
+            await self.load_extension(name)
+        except Exception as exc:
+            log.exception("Failed to load extension %s.", name, exc_info=exc)
 
     async def load_extensions(self) -> None:
-        await bot.load_extension("jishaku")
+        extensions = ["jishaku"]
 
         for feature in Path("cogs").iterdir():
             if not feature.is_dir():
@@ -177,23 +334,73 @@ class Harvest(Bot):
             elif not (feature / "__init__.py").is_file():
                 continue
 
-            try:
-                await self.load_extension(".".join(feature.parts))
-            except Exception as exc:
-                log.exception(
-                    "Failed to load extension %s.", feature.name, exc_info=exc
-                )
+            extensions.append(".".join(feature.parts))
+
+        await self.startup.gather(
+            *(
+                (f"extension {name}", self.load_extension_safe(name))
+                for name in extensions
+            )
+        )
 
     async def get_context(
         self, origin: Message | Interaction, /, *, cls=Context
     ) -> Context:
-        context = await super().get_context(origin, cls=cls)
-        context.settings = await Settings.fetch(self, context.guild)
+        with span("context"):
+            return await super().get_context(origin, cls=cls)
+
+    async def invoke(self, ctx: Context, /) -> None:
+        name = ctx.command.qualified_name if ctx.command else None
+        token = current_command.set(name)
+        if name:
+            self.monitor.track(asyncio.current_task(), name)
+
+        trace = current_trace.get()
+        if trace:
+            trace.command = name
+
+        try:
+            # Bot owners skip the queue, like they skip admission.
+            if ctx.command and ctx.author.id not in self.owner_ids:
+                with span("queue"):
+                    ctx.cost = await self.scheduler.acquire(
+                        ctx.guild.id if ctx.guild else ctx.author.id,
+                        ctx.command.extras.get("cost", 1),
+                    )
+
+            if trace:
+                trace.mark()
+
+            await super().invoke(ctx)
+        finally:
+            current_command.reset(token)
+            # Held for the whole command, so all of its work stays under the cap.
+            ctx.release()
 
-        return context
+    @staticmethod
+    async def trace_before_invoke(ctx: Context) -> None:
+        # Everything between invoke and here is checks, cooldowns and conversion.
+        if trace := current_trace.get():
+            trace.split("prepare")
+
+    @staticmethod
+    async def trace_after_invoke(ctx: Context) -> None:
+        if trace := current_trace.get():
+            trace.split("callback")
+
+    async def close(self) -> None:
+        # Background writes still need the database, so they go first.
+        await self.schedules.close()
+        await self.jobs.close(timeout=10)
+        await self.tasks.drain(timeout=10)
+        await self.ledger.close()
+        self.monitor.stop()
+        self.tracer.close()
+        await super().close()
 
     def run(self) -> None:
         log.info("Starting the bot...")
+        self.startup.mark("run")
 
         super().run(config.discord.token, reconnect=True, log_handler=None)
 
@@ -230,5 +437,8 @@ class Harvest(Bot):
 
 if __name__ == "__main__":
     bot = Harvest()
-    init_logging(DEBUG)
+    with bot.startup.phase("logging"):
+        # Structured logs are only written when running detached, e.g. under systemd.
+        init_logging(DEBUG, structured=None if sys.stdout.isatty() else "Harvest.jsonl")
+
     bot.run()
@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import time
+from collections import Counter
+from contextlib import contextmanager
+from logging import getLogger
+from typing import TYPE_CHECKING, Dict, Iterator, Optional, Tuple
+
+from discord import Message
+
+from .metrics import render_table
+
+if TYPE_CHECKING:
+    from main import Harvest
+
+log = getLogger("Harvest/admission")
+
+
+class Admission:
+    """
+    Decides whether a command message is processed at all, before a Context
+    is built for it. Guild and bot owners are always let through.
+
+    Each guild draws from the `guild_commands` cooldown, a token bucket of
+    12 commands per 2.5 seconds. Throttled commands add to a strike score
+    which halves every `half_life` seconds, a guild whose score passes
+    `strikes` is moved to the blocked set for a while, twice as long for
+    every block it earned within the last hour.
+
+    Everyone else is shed while the event loop lags or too many
+    commands are already running.
+    """
+
+    def __init__(
+        self,
+        bot: "Harvest",
+        *,
+        strikes: float = 20,
+        half_life: float = 30,
+        block_for: float = 60,
+        max_block: float = 3600,
+        max_lag: float = 0.5,
+        max_pending: int = 250,
+    ):
+        self.bot = bot
+        self.strikes = strikes
+        self.half_life = half_life
+        self.block_for = block_for
+        self.max_block = max_block
+        self.max_lag = max_lag
+        self.max_pending = max_pending
+        self.pending = 0
+        self.scores: Dict[int, Tuple[float, float]] = {}
+        self.expiry: Dict[int, float] = {}
+        self.offenses: Dict[int, Tuple[int, float]] = {}
+        self.stats: Counter[str] = Counter()
+
+    @property
+    def buckets(self) -> dict:
+        return self.bot.buckets["guild_commands"]
+
+    def privileged(self, message: Message) -> bool:
+        return message.author.id in self.bot.owner_ids or (
+            message.guild is not None and message.author.id == message.guild.owner_id
+        )
+
+    def overloaded(self) -> Optional[str]:
+        if self.pending >= self.max_pending:
+            return "pending"
+
+        if max(self.bot.monitor.current_lag, self.bot.monitor.last_lag) >= self.max_lag:
+            return "lag"
+
+        return None
+
+    def is_blocked(self, guild_id: int, now: float) -> bool:
+        if guild_id not in self.buckets["blocked"]:
+            return False
+
+        # Guilds blocked by hand have no expiry and stay blocked.
+        expiry = self.expiry.get(guild_id)
+        if expiry is None or expiry > now:
+            return True
+
+        self.unblock(guild_id)
+        return False
+
+    def strike(self, guild_id: int, now: float) -> None:
+        score, last = self.scores.get(guild_id, (0.0, now))
+        score = score * 0.5 ** ((now - last) / self.half_life) + 1
+        if score < self.strikes:
+            self.scores[guild_id] = (score, now)
+            if len(self.scores) > 10_000:
+                self.prune(now)
+
+            return
+
+        count, since = self.offenses.get(guild_id, (0, now))
+        count = count + 1 if now - since < 3600 else 1
+        duration = min(self.block_for * 2 ** (count - 1), self.max_block)
+
+        self.scores.pop(guild_id, None)
+        self.offenses[guild_id] = (count, now)
+        self.block(guild_id, duration)
+        log.warning(
+            "Blocked guild %s for %.0f seconds after %.0f throttled commands.",
+            guild_id,
+            duration,
+            score,
+        )
+
+    def prune(self, now: float) -> None:
+        """
+        Forget the scores which have decayed to nothing and the old offenses.
+        """
+
+        self.scores = {
+            guild_id: (score, last)
+            for guild_id, (score, last) in self.scores.items()
+            if score * 0.5 ** ((now - last) / self.half_life) >= 1
+        }
+        self.offenses = {
+            guild_id: (count, since)
+            for guild_id, (count, since) in self.offenses.items()
+            if now - since < 3600
+        }
+
+    def block(self, guild_id: int, duration: Optional[float] = None) -> None:
+        self.buckets["blocked"].add(guild_id)
+        if duration is None:
+            self.expiry.pop(guild_id, None)
+        else:
+            self.expiry[guild_id] = time.monotonic() + duration
+
+    def unblock(self, guild_id: int) -> None:
+        self.buckets["blocked"].discard(guild_id)
+        self.expiry.pop(guild_id, None)
+
+    def admit(self, message: Message) -> bool:
+        if self.privileged(message):
+            self.stats["privileged"] += 1
+            return True
+
+        now = time.monotonic()
+        guild_id = message.guild.id if message.guild else None
+        if guild_id and self.is_blocked(guild_id, now):
+            self.stats["blocked"] += 1
+            return False
+
+        if reason := self.overloaded():
+            self.stats[f"shed ({reason})"] += 1
+            return False
+
+        bucket = self.buckets["cooldown"].get_bucket(message)
+        if bucket and bucket.update_rate_limit():
+            self.stats["throttled"] += 1
+            if guild_id:
+                self.strike(guild_id, now)
+
+            return False
+
+        self.stats["admitted"] += 1
+        return True
+
+    @contextmanager
+    def running(self) -> Iterator[None]:
+        self.pending += 1
+        try:
+            yield
+        finally:
+            self.pending -= 1
+
+    def summary(self) -> str:
+        now = time.monotonic()
+        lines = [
+            f"{self.pending:,} commands running, the loop is "
+            f"{self.bot.monitor.current_lag * 1000:.0f}ms behind.",
+            "",
+            render_table(("decision", "count"), self.stats.most_common()),
+        ]
+        if blocked := self.buckets["blocked"]:
+            lines.append("")
+            lines.append(
+                render_table(
+                    ("blocked guild", "remaining"),
+                    [
+                        (
+                            guild_id,
+                            f"{self.expiry[guild_id] - now:.0f}s"
+                            if guild_id in self.expiry
+                            else "until unblocked",
+                        )
+                        for guild_id in blocked
+                    ],
+                )
+            )
+
+        return "\n".join(lines)
+
+
+__all__ = ("Admission",)
@@ -4,7 +4,17 @@ import asyncio
 import enum
 import time
 from functools import wraps
-from typing import Any, Callable, Coroutine, Generic, MutableMapping, Protocol, TypeVar
+from typing import (
+    Any,
+    Callable,
+    Coroutine,
+    Generic,
+    List,
+    MutableMapping,
+    Optional,
+    Protocol,
+    TypeVar,
+)
 
 from lru import LRU
 
@@ -26,6 +36,10 @@ class CacheProtocol(Protocol[R]):
     def get_stats(self) -> tuple[int, int]: ...
 
 
+# Every function decorated with cache(), so their sizes can be inspected.
+registry: List[CacheProtocol[Any]] = []
+
+
 class ExpiringCache(dict, Generic[R]):
     def __init__(self, seconds: float) -> None:
         self.__ttl: float = seconds
@@ -62,6 +76,7 @@ def cache(
     maxsize: int = 128,
     strategy: Strategy = Strategy.lru,
     ignore_kwargs: bool = False,
+    ttl: Optional[float] = None,
 ) -> Callable[[Callable[..., Coroutine[Any, Any, R]]], CacheProtocol[R]]:
     def decorator(func: Callable[..., Coroutine[Any, Any, R]]) -> CacheProtocol[R]:
         if strategy is Strategy.lru:
@@ -79,6 +94,9 @@ def cache(
             def _stats():
                 return 0, 0
 
+        # When each entry was created, only kept with a ttl.
+        _created: MutableMapping[str, float] = LRU(maxsize) if ttl else {}
+
         def _make_key(args: tuple[Any, ...], kwargs: dict[str, Any]) -> str:
             # this is a bit of a cluster fuck
             # we do care what 'self' parameter is when we __repr__ it
@@ -100,13 +118,30 @@ def cache(
 
             return ":".join(key)
 
+        def _evict_failed(key: str, task: asyncio.Task[Any]) -> None:
+            # A failed lookup would otherwise be handed out until evicted.
+            if not task.cancelled() and task.exception() is None:
+                return
+
+            try:
+                if _internal_cache[key] is task:
+                    del _internal_cache[key]
+            except KeyError:
+                pass
+
         @wraps(func)
         def wrapper(*args: Any, **kwargs: Any) -> Any:
             key = _make_key(args, kwargs)
             try:
                 task = _internal_cache[key]
+                if ttl and time.monotonic() - _created.get(key, 0) > ttl:
+                    raise KeyError(key)
             except KeyError:
                 _internal_cache[key] = task = asyncio.create_task(func(*args, **kwargs))
+                task.add_done_callback(lambda task: _evict_failed(key, task))
+                if ttl:
+                    _created[key] = time.monotonic()
+
                 return task
             else:
                 return task
@@ -136,6 +171,7 @@ def cache(
         wrapper.invalidate = _invalidate  # type: ignore
         wrapper.get_stats = _stats  # type: ignore
         wrapper.invalidate_containing = _invalidate_containing  # type: ignore
+        registry.append(wrapper)  # type: ignore
         return wrapper  # type: ignore
 
     return decorator
@@ -1,4 +1,5 @@
-from typing import TYPE_CHECKING, Optional, Any, cast
+import asyncio
+from typing import TYPE_CHECKING, Awaitable, Optional, Any, cast
 
 from aiohttp import ClientSession
 
@@ -11,12 +12,12 @@ from discord import (
     VoiceChannel,
     Colour,
     Embed,
-    HTTPException,
 )
 from discord.ext.commands import Command
 from discord.ext.commands import Context as OriginalContext
 
 from tools.client.database import Database, Settings
+from tools.client.tracing import span
 from config import config
 
 if TYPE_CHECKING:
@@ -29,8 +30,10 @@ class Context(OriginalContext):
     author: Member
     channel: VoiceChannel | TextChannel | Thread
     command: Command[Any, ..., Any]
-    settings: Settings
     response: Optional[Message] = None
+    # The scheduler units this command holds until it finishes.
+    cost: int = 0
+    _settings: Optional[Awaitable[Settings]] = None
 
     @property
     def session(self) -> ClientSession:
@@ -40,20 +43,35 @@ class Context(OriginalContext):
     def db(self) -> Database:
         return self.bot.database
 
+    @property
+    def settings(self) -> Awaitable[Settings]:
+        """
+        The guild settings, only fetched once a command awaits them.
+        """
+
+        if self._settings is None:
+            self._settings = asyncio.ensure_future(self.fetch_settings())
+
+        return self._settings
+
+    async def fetch_settings(self) -> Settings:
+        with span("settings"):
+            return await Settings.fetch(self.bot, self.guild)
+
     @property
     def color(self) -> Colour:
         return Colour.dark_embed()
 
-    async def send(self, *args, **kwargs) -> Message:
+    def prepare(self, args: tuple, kwargs: dict) -> dict:
         if kwargs.pop("no_reference", False):
             reference = None
         else:
             reference = kwargs.pop("reference", self.message)
 
-        patch = cast(
-            Optional[Message],
-            kwargs.pop("patch", None),
-        )
+        # Replies to a deleted message are sent without the reply
+        # instead of failing, so we don't have to send everything twice.
+        if isinstance(reference, Message):
+            reference = reference.to_reference(fail_if_not_exists=False)
 
         embed = cast(
             Optional[Embed],
@@ -64,7 +82,6 @@ class Context(OriginalContext):
 
         if args:
             kwargs["content"] = args[0]
-            args = ()
 
         if file := kwargs.pop("file", None):
             kwargs["files"] = [file]
@@ -72,20 +89,62 @@ class Context(OriginalContext):
         if kwargs.get("view") is None:
             kwargs.pop("view", None)
 
+        if reference:
+            kwargs["reference"] = reference
+
+        return kwargs
+
+    def release(self) -> None:
+        """
+        Give back the scheduler units once the command has finished.
+        """
+
+        if self.cost:
+            self.bot.scheduler.release(self.cost)
+            self.cost = 0
+
+    async def send(self, *args, **kwargs) -> Message:
+        patch = cast(
+            Optional[Message],
+            kwargs.pop("patch", None),
+        )
         if patch:
+            kwargs.pop("batch", None)
+            kwargs = self.prepare(args, kwargs)
+            kwargs.pop("reference", None)
+
             self.response = await patch.edit(**kwargs)
-        else:
-            if reference:
-                kwargs["reference"] = reference
+            return self.response
+
+        elif self.interaction:
+            kwargs.pop("batch", None)
+            self.response = await super().send(**self.prepare(args, kwargs))
+            return self.response
 
-            try:
-                self.response = await super().send(*args, **kwargs)
-            except HTTPException:
-                kwargs.pop("reference", None)
-                self.response = await super().send(*args, **kwargs)
+        with span("send"):
+            self.response = await self.enqueue(args, kwargs)
 
         return self.response
 
+    def enqueue(self, args: tuple, kwargs: dict) -> asyncio.Future[Message]:
+        batch = kwargs.pop("batch", False)
+        return self.bot.outbound.send(
+            self.channel,
+            self.channel.id,
+            batch=batch,
+            **self.prepare(args, kwargs),
+        )
+
+    def post(self, *args, **kwargs) -> asyncio.Future[Message]:
+        """
+        Queue a message without waiting for it to be delivered.
+        Failures are logged, as nothing might be waiting on the future.
+        """
+
+        future = self.enqueue(args, kwargs)
+        future.add_done_callback(self.bot.outbound.log_failure)
+        return future
+
     async def neutral(
         self,
         *args: str,
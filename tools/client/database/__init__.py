@@ -1,18 +1,28 @@
 from json import dumps, loads
 from logging import getLogger
-from typing import Any, List, Optional, Union
+from os import listdir
+from typing import Any, Callable, List, Optional, Union
 
 from asyncpg import Connection, Pool
 from asyncpg import Record as DefaultRecord
 from asyncpg import create_pool
+from asyncpg.connection import LoggedQuery
 
 
-from .settings import Settings
+from .ledger import Ledger
+from .schedules import Schedules
+from .settings import Settings, fetch_prefixes
 
 from config import config
+from tools.client.tracing import record_span
 
 log = getLogger("Harvest/db")
 
+MIGRATIONS = "tools/client/database/migrations"
+
+# Serialises migrations between processes starting at the same time.
+MIGRATION_LOCK = 0x4D494752
+
 
 def ENCODER(self: Any) -> str:
     return dumps(self)
@@ -64,7 +74,12 @@ class Database(Pool):
     ) -> Optional[str | int]: ...
 
 
+def trace_query(query: LoggedQuery) -> None:
+    record_span("postgres", query.elapsed)
+
+
 async def init(connection: Connection):
+    connection.add_query_logger(trace_query)
     await connection.set_type_codec(
         "JSONB",
         schema="pg_catalog",
@@ -77,11 +92,61 @@ async def init(connection: Connection):
         await connection.execute(schema)
 
 
-async def connect() -> Database:
+async def migrate(pool: Database) -> None:
+    """
+    Apply the migrations which haven't been yet, once per database rather
+    than on every new connection. Each one runs in its own transaction.
+    """
+
+    async with pool.acquire() as connection:
+        await connection.execute("SELECT pg_advisory_lock($1)", MIGRATION_LOCK)
+        try:
+            await connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS migrations (
+                  name       TEXT        PRIMARY KEY,
+                  applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                )
+                """
+            )
+            applied = {
+                record["name"]
+                for record in await connection.fetch("SELECT name FROM migrations")
+            }
+            for name in sorted(listdir(MIGRATIONS)):
+                if not name.endswith(".sql") or name in applied:
+                    continue
+
+                with open(f"{MIGRATIONS}/{name}", "r", encoding="UTF-8") as buffer:
+                    migration = buffer.read()
+
+                async with connection.transaction():
+                    await connection.execute(migration)
+                    await connection.execute(
+                        "INSERT INTO migrations (name) VALUES ($1)", name
+                    )
+
+                log.info("Applied the %s migration.", name)
+        finally:
+            await connection.execute("SELECT pg_advisory_unlock($1)", MIGRATION_LOCK)
+
+
+async def connect(
+    query_logger: Optional[Callable[[LoggedQuery], None]] = None,
+) -> Database:
+    """
+    Create the pool, `query_logger` sees every query on every connection.
+    """
+
+    async def setup(connection: Connection) -> None:
+        await init(connection)
+        if query_logger:
+            connection.add_query_logger(query_logger)
+
     pool = await create_pool(
         str(config.database),
         record_class=Record,
-        init=init,
+        init=setup,
     )
     if not pool:
         raise RuntimeError("Connection to PostgreSQL server failed!")
@@ -92,5 +157,9 @@ async def connect() -> Database:
 
 __all__ = (
     "Database",
+    "Ledger",
+    "Schedules",
     "Settings",
+    "fetch_prefixes",
+    "migrate",
 )
@@ -0,0 +1,274 @@
+from __future__ import annotations
+
+import asyncio
+from contextlib import suppress
+from datetime import datetime, timezone
+from logging import getLogger
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
+
+from asyncpg import PostgresError
+
+if TYPE_CHECKING:
+    from main import Harvest
+
+log = getLogger("Harvest/ledger")
+
+COLUMNS = ("user_id", "kind", "wallet", "bank", "created_at")
+Entry = Tuple[int, str, int, int, datetime]
+
+# Serialises the one-off opening snapshot between processes.
+OPENING_LOCK = 0x4C454447
+
+
+def month_start(moment: datetime, offset: int = 0) -> datetime:
+    month = moment.year * 12 + moment.month - 1 + offset
+    return datetime(month // 12, month % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+class Ledger:
+    """
+    A buffered writer for the transactions ledger.
+
+    Entries are recorded in memory and copied into PostgreSQL in bulk every
+    `interval` seconds, or sooner once `batch` entries are waiting. When a
+    flush fails the entries are kept for the next attempt, up to `capacity`.
+    """
+
+    def __init__(
+        self,
+        bot: "Harvest",
+        *,
+        interval: float = 2.0,
+        batch: int = 500,
+        capacity: int = 100_000,
+    ):
+        self.bot = bot
+        self.interval = interval
+        self.batch = batch
+        self.capacity = capacity
+        self.buffer: List[Entry] = []
+        self.wakeup = asyncio.Event()
+        self.lock = asyncio.Lock()
+        self.worker: Optional[asyncio.Task[None]] = None
+        self.partitioned: Optional[datetime] = None
+        self.dropped = 0
+
+    def record(self, user_id: int, kind: str, *, wallet: int = 0, bank: int = 0) -> None:
+        """
+        Record a change to a balance, deltas rather than the new values.
+        """
+
+        if not wallet and not bank:
+            return
+
+        if len(self.buffer) >= self.capacity:
+            self.dropped += 1
+            return
+
+        self.buffer.append((user_id, kind, wallet, bank, datetime.now(timezone.utc)))
+        if len(self.buffer) >= self.batch:
+            self.wakeup.set()
+
+    async def start(self) -> None:
+        await self.ensure_partitions()
+        await self.open()
+        self.worker = asyncio.create_task(self.run(), name="ledger-writer")
+
+    async def close(self) -> None:
+        if self.worker:
+            self.worker.cancel()
+            with suppress(asyncio.CancelledError):
+                await self.worker
+
+            self.worker = None
+
+        await self.flush()
+        if self.buffer:
+            log.warning("Lost %s ledger entries which couldn't be written.", len(self.buffer))
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+            self.wakeup.clear()
+            await self.flush()
+
+    async def ensure_partitions(self) -> None:
+        """
+        Create this month's and next month's partitions, so the default
+        partition stays empty and new partitions can always be attached.
+        """
+
+        now = datetime.now(timezone.utc)
+        if self.partitioned == month_start(now):
+            return
+
+        for offset in (0, 1):
+            start, end = month_start(now, offset), month_start(now, offset + 1)
+            try:
+                await self.bot.db.execute(
+                    f"""
+                    CREATE TABLE IF NOT EXISTS transactions_{start:%Y_%m}
+                    PARTITION OF transactions
+                    FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')
+                    """
+                )
+            except PostgresError as exc:
+                log.warning("Failed to create the %s ledger partition: %s", f"{start:%Y-%m}", exc)
+                return
+
+        self.partitioned = month_start(now)
+
+    async def open(self) -> None:
+        """
+        Snapshot the existing balances as opening entries while the ledger
+        is empty, so that it adds up to the economy table from the start.
+        """
+
+        async with self.bot.db.acquire() as connection:
+            async with connection.transaction():
+                await connection.execute("SELECT pg_advisory_xact_lock($1)", OPENING_LOCK)
+                result = await connection.execute(
+                    """
+                    INSERT INTO transactions (user_id, kind, wallet, bank)
+                    SELECT user_id, 'opening', wallet, bank
+                    FROM economy
+                    WHERE NOT EXISTS (SELECT 1 FROM transactions)
+                    """
+                )
+
+        if result != "INSERT 0 0":
+            log.info("Opened the ledger from the current balances (%s).", result)
+
+    async def flush(self) -> None:
+        async with self.lock:
+            if not self.buffer:
+                return
+
+            await self.ensure_partitions()
+            entries, self.buffer = self.buffer, []
+            try:
+                await self.bot.db.copy_records_to_table(
+                    "transactions",
+                    records=entries,
+                    columns=COLUMNS,
+                )
+            except asyncio.CancelledError:
+                self.buffer[:0] = entries
+                raise
+            except (PostgresError, OSError) as exc:
+                log.warning("Failed to write %s ledger entries: %s", len(entries), exc)
+                self.buffer[:0] = entries[: self.capacity - len(self.buffer)]
+
+    async def balances(self, user_ids: Optional[Sequence[int]] = None) -> Dict[int, Tuple[int, int]]:
+        """
+        Rebuild wallet and bank balances from the ledger alone.
+        """
+
+        await self.flush()
+        records = await self.bot.db.fetch(
+            """
+            SELECT user_id, SUM(wallet)::BIGINT AS wallet, SUM(bank)::BIGINT AS bank
+            FROM transactions
+            WHERE $1::BIGINT[] IS NULL OR user_id = ANY($1::BIGINT[])
+            GROUP BY user_id
+            """,
+            user_ids,
+        )
+        return {record["user_id"]: (record["wallet"], record["bank"]) for record in records}
+
+    async def drift(self, limit: int = 25) -> List:
+        """
+        The accounts whose stored balance disagrees with the ledger.
+        """
+
+        await self.flush()
+        return await self.bot.db.fetch(
+            """
+            WITH ledger AS (
+                SELECT user_id, SUM(wallet)::BIGINT AS wallet, SUM(bank)::BIGINT AS bank
+                FROM transactions
+                GROUP BY user_id
+            )
+            SELECT
+                user_id,
+                economy.wallet, economy.bank,
+                ledger.wallet AS ledger_wallet, ledger.bank AS ledger_bank
+            FROM economy
+            FULL JOIN ledger USING (user_id)
+            WHERE economy.wallet IS DISTINCT FROM ledger.wallet
+               OR economy.bank IS DISTINCT FROM ledger.bank
+            ORDER BY user_id
+            LIMIT $1
+            """,
+            limit,
+        )
+
+    async def repair(self, user_ids: Sequence[int], *, apply: bool = False) -> List:
+        """
+        The drift of the given accounts which can be rebuilt from the ledger,
+        only written back over the stored balances with `apply`.
+
+        Accounts missing from either table are left alone, and so are those
+        whose balance predates their first entry, as their history is partial.
+        """
+
+        if self.dropped:
+            raise RuntimeError(f"{self.dropped} ledger entries were dropped, it can't be trusted")
+
+        await self.flush()
+        drift = """
+            WITH ledger AS (
+                SELECT
+                    user_id,
+                    SUM(wallet)::BIGINT AS wallet,
+                    SUM(bank)::BIGINT AS bank,
+                    bool_or(kind = 'opening') AS opened,
+                    MIN(created_at) AS first_at
+                FROM transactions
+                WHERE user_id = ANY($1::BIGINT[])
+                GROUP BY user_id
+            ), drift AS (
+                SELECT
+                    user_id,
+                    economy.wallet, economy.bank,
+                    ledger.wallet AS ledger_wallet, ledger.bank AS ledger_bank
+                FROM economy
+                JOIN ledger USING (user_id)
+                WHERE (
+                    ledger.opened
+                    OR ledger.first_at > COALESCE(
+                        (SELECT MIN(created_at) FROM transactions WHERE kind = 'opening'),
+                        '-infinity'
+                    )
+                )
+                  AND (
+                    economy.wallet IS DISTINCT FROM ledger.wallet
+                    OR economy.bank IS DISTINCT FROM ledger.bank
+                  )
+            )
+        """
+        if not apply:
+            return await self.bot.db.fetch(
+                drift + "SELECT * FROM drift ORDER BY user_id",
+                list(user_ids),
+            )
+
+        return await self.bot.db.fetch(
+            drift
+            + """
+            UPDATE economy
+            SET wallet = drift.ledger_wallet,
+                bank = drift.ledger_bank,
+                version = economy.version + 1
+            FROM drift
+            WHERE economy.user_id = drift.user_id
+            RETURNING drift.*
+            """,
+            list(user_ids),
+        )
+
+__all__ = ("Ledger",)
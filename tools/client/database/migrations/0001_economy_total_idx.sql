@@ -0,0 +1,3 @@
+-- leaderboard keyset pagination and rank lookups
+CREATE INDEX IF NOT EXISTS economy_total_idx
+  ON economy ((wallet + bank) DESC, user_id DESC);
@@ -0,0 +1,22 @@
+-- append-only ledger of every balance change, partitioned by month
+-- the partitions themselves are created ahead of time by the ledger writer
+CREATE TABLE IF NOT EXISTS transactions (
+  id         BIGSERIAL,
+  user_id    BIGINT      NOT NULL,
+  kind       TEXT        NOT NULL,
+  wallet     BIGINT      NOT NULL DEFAULT 0,
+  bank       BIGINT      NOT NULL DEFAULT 0,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+CREATE TABLE IF NOT EXISTS transactions_default
+  PARTITION OF transactions DEFAULT;
+
+-- rows arrive in time order, so a BRIN index stays tiny
+CREATE INDEX IF NOT EXISTS transactions_created_brin
+  ON transactions USING BRIN (created_at);
+
+-- history keyset pagination per user
+CREATE INDEX IF NOT EXISTS transactions_user_idx
+  ON transactions (user_id, created_at DESC, id DESC);
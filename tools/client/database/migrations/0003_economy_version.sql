@@ -0,0 +1,2 @@
+-- bumped by every write so the cache never goes back to an older account
+ALTER TABLE economy ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 1;
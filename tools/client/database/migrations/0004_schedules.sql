@@ -0,0 +1,10 @@
+-- periodic jobs, kept here so they survive restarts
+CREATE TABLE IF NOT EXISTS schedules (
+  name          TEXT             PRIMARY KEY,
+  every         INTERVAL         NOT NULL,
+  next_run_at   TIMESTAMPTZ      NOT NULL DEFAULT now(),
+  last_run_at   TIMESTAMPTZ,
+  last_duration DOUBLE PRECISION,
+  last_result   JSONB,
+  last_error    TEXT
+);
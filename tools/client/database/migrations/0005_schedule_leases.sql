@@ -0,0 +1,2 @@
+-- a claimed run holds its schedule until it finishes or this passes
+ALTER TABLE schedules ADD COLUMN IF NOT EXISTS locked_until TIMESTAMPTZ;
@@ -0,0 +1,2 @@
+-- the day interest was last paid, so a rerun only pays the rest
+ALTER TABLE economy ADD COLUMN IF NOT EXISTS last_interest_on DATE;
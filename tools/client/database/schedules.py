@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from contextlib import suppress
+from datetime import timedelta
+from logging import getLogger
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, Optional, Set
+
+from asyncpg import PostgresError
+
+from tools.client.metrics import render_table
+
+if TYPE_CHECKING:
+    from main import Harvest
+
+log = getLogger("Harvest/schedules")
+
+# Returns a short summary of what it did, which is kept with the schedule.
+Job = Callable[[], Awaitable[Optional[Dict[str, Any]]]]
+
+
+class Schedules:
+    """
+    Periodic jobs whose next run is kept in PostgreSQL, so they carry on
+    where they left off after a restart instead of starting over.
+
+    Due schedules are claimed with SKIP LOCKED for up to `lease`, so with
+    several processes each run still happens only once. They only move
+    forward once the run succeeds, on the same grid however late it was, and
+    the runs which were missed while the bot was down happen once on startup.
+    A failed run is retried after `retry`, one whose process died once its
+    lease runs out, so jobs should be safe to repeat.
+    """
+
+    def __init__(
+        self,
+        bot: "Harvest",
+        *,
+        poll: float = 30.0,
+        lease: timedelta = timedelta(hours=1),
+        retry: timedelta = timedelta(minutes=5),
+    ):
+        self.bot = bot
+        self.poll = poll
+        self.lease = lease
+        self.retry = retry
+        self.jobs: Dict[str, Job] = {}
+        self.every: Dict[str, timedelta] = {}
+        self.stored: Set[str] = set()
+        self.worker: Optional[asyncio.Task[None]] = None
+
+    def register(self, name: str, every: timedelta, job: Job) -> None:
+        self.jobs[name] = job
+        self.every[name] = every
+        self.stored.discard(name)
+
+    def unregister(self, name: str) -> None:
+        self.jobs.pop(name, None)
+        self.every.pop(name, None)
+
+    def start(self) -> None:
+        self.worker = asyncio.create_task(self.run(), name="schedules")
+
+    async def close(self) -> None:
+        if self.worker:
+            self.worker.cancel()
+            with suppress(asyncio.CancelledError):
+                await self.worker
+
+            self.worker = None
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.tick()
+            except (PostgresError, OSError) as exc:
+                log.warning("Failed to check for due schedules: %s", exc)
+
+            await asyncio.sleep(self.poll)
+
+    async def store(self) -> None:
+        """
+        Create the rows of newly registered schedules, due right away.
+        """
+
+        for name in set(self.jobs) - self.stored:
+            await self.bot.db.execute(
+                """
+                INSERT INTO schedules (name, every)
+                VALUES ($1, $2)
+                ON CONFLICT (name) DO UPDATE
+                SET every = EXCLUDED.every
+                """,
+                name,
+                self.every[name],
+            )
+            self.stored.add(name)
+
+    async def tick(self) -> None:
+        if not self.jobs:
+            return
+
+        await self.store()
+        records = await self.bot.db.fetch(
+            """
+            UPDATE schedules
+            SET locked_until = now() + $2::INTERVAL
+            WHERE name IN (
+                SELECT name
+                FROM schedules
+                WHERE name = ANY($1::TEXT[])
+                  AND next_run_at <= now()
+                  AND (locked_until IS NULL OR locked_until <= now())
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING name
+            """,
+            list(self.jobs),
+            self.lease,
+        )
+        for record in records:
+            self.bot.tasks.spawn(
+                self.execute(record["name"], claimed=True),
+                group="schedules",
+                name=f"schedule-{record['name']}",
+            )
+
+    async def execute(self, name: str, *, claimed: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Run a job now and keep its outcome, whether or not it was due.
+        Only a `claimed` run moves the schedule along.
+        """
+
+        started = time.perf_counter()
+        try:
+            result = await self.jobs[name]()
+        except Exception as exc:
+            await self.finish(name, time.perf_counter() - started, None, repr(exc), claimed)
+            raise
+
+        duration = time.perf_counter() - started
+        await self.finish(name, duration, result, None, claimed)
+        log.info("Ran the %s schedule in %.2fs: %s", name, duration, result)
+        return result
+
+    async def finish(
+        self,
+        name: str,
+        duration: float,
+        result: Optional[Dict[str, Any]],
+        error: Optional[str],
+        claimed: bool,
+    ) -> None:
+        # Skipping the intervals which were missed keeps the runs on the
+        # grid they started on, rather than drifting by how late they were.
+        await self.bot.db.execute(
+            """
+            UPDATE schedules
+            SET last_run_at = now(),
+                last_duration = $2,
+                last_result = $3,
+                last_error = $4,
+                next_run_at = CASE
+                    WHEN $5::BOOLEAN AND $4::TEXT IS NULL THEN next_run_at + every * (
+                        FLOOR(
+                            EXTRACT(EPOCH FROM now() - next_run_at)
+                            / EXTRACT(EPOCH FROM every)
+                        ) + 1
+                    )
+                    ELSE next_run_at
+                END,
+                locked_until = CASE
+                    WHEN NOT $5::BOOLEAN THEN locked_until
+                    WHEN $4::TEXT IS NULL THEN NULL
+                    ELSE now() + $6::INTERVAL
+                END
+            WHERE name = $1
+            """,
+            name,
+            duration,
+            result,
+            error,
+            claimed,
+            self.retry,
+        )
+
+    async def summary(self) -> str:
+        records = await self.bot.db.fetch(
+            """
+            SELECT name, every, next_run_at, last_run_at, last_duration, last_result, last_error
+            FROM schedules
+            ORDER BY name
+            """
+        )
+        if not records:
+            return "Nothing has been scheduled."
+
+        return render_table(
+            ("name", "every", "next run", "last run", "took", "result"),
+            [
+                (
+                    record["name"] + ("" if record["name"] in self.jobs else " (unregistered)"),
+                    record["every"],
+                    f"{record['next_run_at']:%Y-%m-%d %H:%M}",
+                    f"{record['last_run_at']:%Y-%m-%d %H:%M}" if record["last_run_at"] else "-",
+                    f"{record['last_duration']:.2f}s" if record["last_duration"] is not None else "-",
+                    record["last_error"]
+                    or ", ".join(f"{key}={value}" for key, value in (record["last_result"] or {}).items())
+                    or "-",
+                )
+                for record in records
+            ],
+        )
+
+
+__all__ = ("Schedules",)
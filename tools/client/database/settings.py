@@ -1,4 +1,4 @@
-from typing import TYPE_CHECKING, List
+from typing import TYPE_CHECKING, List, Optional, cast
 
 from discord import Guild
 
@@ -34,6 +34,9 @@ class Settings:
         for key, value in kwargs.items():
             setattr(self, key, value)
 
+        if "prefixes" in kwargs:
+            fetch_prefixes.invalidate(self.bot, self.guild.id)
+
     @classmethod
     @cache()
     async def fetch(cls, bot: "Harvest", guild: Guild) -> "Settings":
@@ -50,3 +53,27 @@ class Settings:
         )
 
         return cls(bot, guild, record)
+
+
+# Expires so that prefixes changed by another instance show up here too.
+@cache(maxsize=1024, ttl=300)
+async def fetch_prefixes(bot: "Harvest", guild_id: int) -> List[str]:
+    """
+    Fetch only the guild prefixes, this runs for every message so
+    it deliberately avoids building a full Settings object.
+    """
+
+    return (
+        cast(
+            Optional[List[str]],
+            await bot.db.fetchval(
+                """
+                SELECT prefixes
+                FROM settings
+                WHERE guild_id = $1
+                """,
+                guild_id,
+            ),
+        )
+        or []
+    )
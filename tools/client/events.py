@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+import inspect
+import time
+from collections import Counter
+from logging import getLogger
+from typing import TYPE_CHECKING, Any, Callable, Dict, Set, Tuple
+
+from discord import Intents
+
+from .metrics import render_table
+
+if TYPE_CHECKING:
+    from discord.state import ConnectionState
+
+    from main import Harvest
+
+log = getLogger("Harvest/events")
+
+# What we always need: guild state, prefix commands and member lookups.
+BASE_INTENTS = Intents(
+    guilds=True,
+    members=True,
+    messages=True,
+    message_content=True,
+)
+
+# The intent which delivers each event, for events outside of the base intents.
+EVENT_INTENTS: Dict[str, str] = {
+    "reaction_add": "reactions",
+    "reaction_remove": "reactions",
+    "reaction_clear": "reactions",
+    "reaction_clear_emoji": "reactions",
+    "raw_reaction_add": "reactions",
+    "raw_reaction_remove": "reactions",
+    "raw_reaction_clear": "reactions",
+    "raw_reaction_clear_emoji": "reactions",
+    "member_ban": "moderation",
+    "member_unban": "moderation",
+    "audit_log_entry_create": "moderation",
+    "guild_emojis_update": "emojis_and_stickers",
+    "guild_stickers_update": "emojis_and_stickers",
+    "typing": "typing",
+    "raw_typing": "typing",
+    "presence_update": "presences",
+    "voice_state_update": "voice_states",
+    "invite_create": "invites",
+    "invite_delete": "invites",
+    "webhooks_update": "webhooks",
+    "integration_create": "integrations",
+    "integration_update": "integrations",
+    "raw_integration_delete": "integrations",
+    "scheduled_event_create": "guild_scheduled_events",
+    "scheduled_event_update": "guild_scheduled_events",
+    "scheduled_event_delete": "guild_scheduled_events",
+    "automod_rule_create": "auto_moderation_configuration",
+    "automod_rule_update": "auto_moderation_configuration",
+    "automod_rule_delete": "auto_moderation_configuration",
+    "automod_action": "auto_moderation_execution",
+}
+
+# Gateway events whose parsers only dispatch, so nothing in the client state
+# goes stale when they're dropped. Each maps to the events it dispatches.
+# The message and reaction events are not here, their parsers keep the
+# message cache and view bookkeeping current even when nobody listens.
+DROPPABLE: Dict[str, Tuple[str, ...]] = {
+    "TYPING_START": ("typing", "raw_typing"),
+    "GUILD_AUDIT_LOG_ENTRY_CREATE": ("audit_log_entry_create",),
+    "GUILD_BAN_ADD": ("member_ban",),
+    "GUILD_BAN_REMOVE": ("member_unban",),
+    "INVITE_CREATE": ("invite_create",),
+    "INVITE_DELETE": ("invite_delete",),
+    "WEBHOOKS_UPDATE": ("webhooks_update",),
+}
+
+
+def listened_events(bot: "Harvest") -> Set[str]:
+    """
+    The events something is registered for right now, without the on_ prefix.
+    """
+
+    events = {name[3:] for name in bot.extra_events}
+    events.update(
+        name[3:]
+        for name, _ in inspect.getmembers(type(bot), inspect.iscoroutinefunction)
+        if name.startswith("on_")
+    )
+    return events
+
+
+def intent_profile(bot: "Harvest") -> Intents:
+    """
+    The base intents plus whatever the loaded listeners need.
+    Waiting on an event with wait_for isn't visible here,
+    a cog which does that should register a listener for it.
+    """
+
+    intents = Intents(**dict(BASE_INTENTS))
+    for event in listened_events(bot):
+        if flag := EVENT_INTENTS.get(event):
+            setattr(intents, flag, True)
+
+    return intents
+
+
+class EventFilter:
+    """
+    Wraps the gateway parsers to count every event we receive and drop the
+    ones nobody listens to before discord.py builds any models from them.
+    Messages from other bots are dropped here too, we never respond to them.
+    """
+
+    def __init__(self, bot: "Harvest"):
+        self.bot = bot
+        self.received: Counter[str] = Counter()
+        self.processed: Counter[str] = Counter()
+        self.started = time.monotonic()
+
+    def install(self, state: "ConnectionState") -> None:
+        # DEP-WARN: ConnectionState.parsers maps gateway event names to the
+        # parse_ methods and is shared with the websocket, so we wrap in place.
+        for name, parser in list(state.parsers.items()):
+            state.parsers[name] = self.wrap(name, parser, state)
+
+    def listening(self, event: str) -> bool:
+        # DEP-WARN: Client._listeners holds the pending wait_for calls.
+        return (
+            f"on_{event}" in self.bot.extra_events
+            or event in self.bot._listeners
+            or hasattr(self.bot, f"on_{event}")
+        )
+
+    def wrap(
+        self,
+        name: str,
+        parser: Callable[[Any], Any],
+        state: "ConnectionState",
+    ) -> Callable[[Any], Any]:
+        if name == "MESSAGE_CREATE":
+
+            def parse_message(data: Any) -> Any:
+                self.received[name] += 1
+                author = data.get("author", {})
+                # Our own messages still have to reach the message cache and wait_for.
+                if author.get("bot") and int(author["id"]) != state.self_id:
+                    return None
+
+                self.processed[name] += 1
+                return parser(data)
+
+            return parse_message
+
+        events = DROPPABLE.get(name)
+        if events is None:
+
+            def parse(data: Any) -> Any:
+                self.received[name] += 1
+                self.processed[name] += 1
+                return parser(data)
+
+            return parse
+
+        def parse_droppable(data: Any) -> Any:
+            self.received[name] += 1
+            if not any(self.listening(event) for event in events):
+                return None
+
+            self.processed[name] += 1
+            return parser(data)
+
+        return parse_droppable
+
+    def reset(self) -> None:
+        self.received.clear()
+        self.processed.clear()
+        self.started = time.monotonic()
+
+    def summary(self) -> str:
+        if not self.received:
+            return "No gateway events have been received yet."
+
+        elapsed = max(time.monotonic() - self.started, 1.0)
+        intents = ", ".join(flag for flag, enabled in self.bot.intents if enabled)
+        return f"Intents: {intents}\n\n" + render_table(
+            ("event", "received", "processed", "dropped", "per second"),
+            [
+                (
+                    name,
+                    count,
+                    self.processed[name],
+                    count - self.processed[name],
+                    f"{count / elapsed:,.2f}",
+                )
+                for name, count in self.received.most_common()
+            ],
+        )
+
+
+__all__ = (
+    "EventFilter",
+    "intent_profile",
+    "listened_events",
+)
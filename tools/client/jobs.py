@@ -0,0 +1,342 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import Counter
+from contextlib import suppress
+from datetime import datetime, timedelta
+from hashlib import sha1
+from json import dumps, loads
+from logging import getLogger
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, List, NamedTuple, Optional
+from uuid import uuid4
+
+from redis.exceptions import RedisError
+
+from .metrics import Histogram, render_table
+
+if TYPE_CHECKING:
+    from main import Harvest
+
+log = getLogger("Harvest/jobs")
+
+# Claims up to ARGV[3] due jobs by pushing them out of sight until
+# ARGV[2] and handing them a lease, the data is returned alongside.
+CLAIM_SCRIPT = b"""
+    local ids = redis.call("zrangebyscore", KEYS[1], "-inf", ARGV[1], "limit", 0, ARGV[3])
+    local claimed = {}
+    for _, id in ipairs(ids) do
+        redis.call("zadd", KEYS[1], ARGV[2], id)
+        redis.call("hset", KEYS[4], id, ARGV[4])
+        table.insert(claimed, id)
+        table.insert(claimed, redis.call("hincrby", KEYS[3], id, 1))
+        table.insert(claimed, redis.call("hget", KEYS[2], id) or "")
+    end
+    return claimed
+"""
+CLAIM_SCRIPT_HASH = sha1(CLAIM_SCRIPT).hexdigest()
+
+# Finishes a job, only while the lease is still ours. With ARGV[3] the job
+# is scheduled again for then, otherwise it's removed, and with ARGV[4]
+# as well it's kept in the dead letter list.
+SETTLE_SCRIPT = b"""
+    if redis.call("hget", KEYS[4], ARGV[1]) ~= ARGV[2] then
+        return 0
+    end
+    redis.call("hdel", KEYS[4], ARGV[1])
+    if ARGV[3] ~= "" then
+        redis.call("zadd", KEYS[1], ARGV[3], ARGV[1])
+        return 1
+    end
+    if ARGV[4] ~= "" then
+        redis.call("lpush", KEYS[5], ARGV[4])
+        redis.call("ltrim", KEYS[5], 0, 999)
+    end
+    redis.call("zrem", KEYS[1], ARGV[1])
+    redis.call("hdel", KEYS[2], ARGV[1])
+    redis.call("hdel", KEYS[3], ARGV[1])
+    return 1
+"""
+SETTLE_SCRIPT_HASH = sha1(SETTLE_SCRIPT).hexdigest()
+
+Handler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class Job(NamedTuple):
+    id: str
+    name: str
+    payload: Dict[str, Any]
+    attempts: int
+    lease: str
+
+
+class JobQueue:
+    """
+    Delayed jobs kept in Redis, so they survive restarts and run once
+    across every process instead of once in each.
+
+    Jobs wait in a sorted set scored by when they're due. A claim takes due
+    jobs atomically and pushes their score out by `visibility` seconds, so a
+    job whose worker died or stalled becomes due again. Delivery is at least
+    once, handlers should be idempotent. Failed jobs are retried with an
+    exponential backoff and kept in a dead letter list after `max_attempts`.
+    """
+
+    def __init__(
+        self,
+        bot: "Harvest",
+        name: str = "default",
+        *,
+        concurrency: int = 4,
+        visibility: float = 60.0,
+        poll: float = 1.0,
+        max_attempts: int = 5,
+        backoff: float = 5.0,
+    ):
+        self.bot = bot
+        self.name = name
+        self.concurrency = concurrency
+        self.visibility = visibility
+        self.poll = poll
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.handlers: Dict[str, Handler] = {}
+        self.workers: List[asyncio.Task[None]] = []
+        self.stopping = asyncio.Event()
+        self.running = 0
+        self.durations = Histogram()
+        self.stats: Counter[str] = Counter()
+
+    @property
+    def keys(self) -> List[str]:
+        prefix = f"jobs:{self.name}"
+        return [f"{prefix}:due", f"{prefix}:data", f"{prefix}:attempts", f"{prefix}:leases"]
+
+    @property
+    def dead(self) -> str:
+        return f"jobs:{self.name}:dead"
+
+    def register(self, name: str, handler: Handler) -> None:
+        self.handlers[name] = handler
+
+    def unregister(self, name: str) -> None:
+        self.handlers.pop(name, None)
+
+    async def enqueue(
+        self,
+        name: str,
+        payload: Optional[Dict[str, Any]] = None,
+        *,
+        delay: float | timedelta = 0,
+        at: Optional[datetime] = None,
+        job_id: Optional[str] = None,
+    ) -> str:
+        """
+        Schedule a job, due after `delay` or `at` a given time.
+        Enqueueing an existing `job_id` moves it instead of adding another.
+        """
+
+        if isinstance(delay, timedelta):
+            delay = delay.total_seconds()
+
+        due = at.timestamp() if at else time.time() + delay
+        job_id = job_id or uuid4().hex
+        due_key, data_key, attempts_key, leases_key = self.keys
+
+        async with self.bot.redis.pipeline(transaction=True) as pipeline:
+            pipeline.hset(data_key, job_id, dumps({"name": name, "payload": payload or {}}))
+            pipeline.zadd(due_key, {job_id: due})
+            # A worker still running the old one can't settle this one.
+            pipeline.hdel(attempts_key, job_id)
+            pipeline.hdel(leases_key, job_id)
+            await pipeline.execute()
+
+        self.stats["enqueued"] += 1
+        return job_id
+
+    async def cancel(self, job_id: str) -> bool:
+        due_key, data_key, attempts_key, leases_key = self.keys
+        async with self.bot.redis.pipeline(transaction=True) as pipeline:
+            pipeline.zrem(due_key, job_id)
+            pipeline.hdel(data_key, job_id)
+            pipeline.hdel(attempts_key, job_id)
+            pipeline.hdel(leases_key, job_id)
+            removed, *_ = await pipeline.execute()
+
+        return bool(removed)
+
+    def start(self) -> None:
+        self.stopping.clear()
+        self.workers = [
+            asyncio.create_task(self.work(), name=f"jobs-{self.name}-{index}")
+            for index in range(self.concurrency)
+        ]
+
+    async def close(self, timeout: float = 10) -> None:
+        """
+        Let the running jobs finish for up to `timeout` seconds, the ones
+        cancelled after that are picked up again once their lease expires.
+        """
+
+        self.stopping.set()
+        if not self.workers:
+            return
+
+        _, unfinished = await asyncio.wait(self.workers, timeout=timeout)
+        for worker in unfinished:
+            worker.cancel()
+
+        for worker in unfinished:
+            with suppress(asyncio.CancelledError):
+                await worker
+
+        self.workers = []
+
+    async def work(self) -> None:
+        while not self.stopping.is_set():
+            try:
+                jobs = await self.claim(1)
+            except RedisError as exc:
+                log.warning("Failed to claim jobs from %s: %s", self.name, exc)
+                jobs = []
+
+            if not jobs:
+                with suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self.stopping.wait(), timeout=self.poll)
+
+                continue
+
+            for job in jobs:
+                await self.execute(job)
+
+    async def claim(self, limit: int) -> List[Job]:
+        now = time.time()
+        lease = uuid4().hex
+        reply = await self.bot.redis.script(
+            CLAIM_SCRIPT,
+            CLAIM_SCRIPT_HASH,
+            self.keys,  # type: ignore
+            [now, now + self.visibility, limit, lease],
+        )
+
+        jobs: List[Job] = []
+        for index in range(0, len(reply), 3):
+            job_id, attempts, data = reply[index : index + 3]
+            job_id = job_id.decode() if isinstance(job_id, bytes) else job_id
+            if not data:
+                # Cancelled between being read and claimed.
+                await self.settle(Job(job_id, "", {}, attempts, lease))
+                continue
+
+            data = loads(data)
+            jobs.append(Job(job_id, data["name"], data["payload"], int(attempts), lease))
+
+        self.stats["claimed"] += len(jobs)
+        return jobs
+
+    async def execute(self, job: Job) -> None:
+        handler = self.handlers.get(job.name)
+        started = time.perf_counter()
+        self.running += 1
+        try:
+            if not handler:
+                raise LookupError(f"no handler is registered for {job.name}")
+
+            # Past the lease another worker may have the job already.
+            await asyncio.wait_for(handler(job.payload), timeout=self.visibility)
+        except Exception as exc:
+            await self.fail(job, exc)
+        else:
+            self.stats["completed"] += 1
+            await self.settle(job)
+        finally:
+            self.running -= 1
+            self.durations.observe((time.perf_counter() - started) * 1000)
+
+    async def fail(self, job: Job, exc: Exception) -> None:
+        if job.attempts >= self.max_attempts:
+            self.stats["dead"] += 1
+            log.error(
+                "Job %s (%s) failed for the last time after %s attempts.",
+                job.id,
+                job.name,
+                job.attempts,
+                exc_info=exc,
+            )
+            entry = {
+                "id": job.id,
+                "name": job.name,
+                "payload": job.payload,
+                "attempts": job.attempts,
+                "error": repr(exc),
+                "failed_at": time.time(),
+            }
+            await self.settle(job, dead=dumps(entry))
+            return
+
+        delay = self.backoff * 2 ** (job.attempts - 1)
+        self.stats["retried"] += 1
+        log.warning(
+            "Job %s (%s) failed on attempt %s, retrying in %.0fs: %r",
+            job.id,
+            job.name,
+            job.attempts,
+            delay,
+            exc,
+        )
+        await self.settle(job, retry_at=time.time() + delay)
+
+    async def settle(
+        self,
+        job: Job,
+        *,
+        retry_at: Optional[float] = None,
+        dead: Optional[str] = None,
+    ) -> None:
+        try:
+            settled = await self.bot.redis.script(
+                SETTLE_SCRIPT,
+                SETTLE_SCRIPT_HASH,
+                [*self.keys, self.dead],  # type: ignore
+                [job.id, job.lease, retry_at or "", dead or ""],
+            )
+        except RedisError as exc:
+            # The lease runs out and the job is claimed again.
+            log.warning("Failed to settle job %s: %s", job.id, exc)
+            return
+
+        if not settled:
+            self.stats["lease lost"] += 1
+
+    async def summary(self) -> str:
+        due_key, *_ = self.keys
+        async with self.bot.redis.pipeline(transaction=False) as pipeline:
+            pipeline.zcount(due_key, "-inf", time.time())
+            pipeline.zcard(due_key)
+            pipeline.llen(self.dead)
+            due, total, dead = await pipeline.execute()
+
+        return render_table(
+            ("queue", "workers", "running", "due", "scheduled", "dead", "p50", "p99"),
+            [
+                (
+                    self.name,
+                    len(self.workers),
+                    self.running,
+                    due,
+                    total - due,
+                    dead,
+                    f"{self.durations.percentile(0.50):.1f}ms",
+                    f"{self.durations.percentile(0.99):.1f}ms",
+                )
+            ],
+        ) + "\n\n" + render_table(
+            ("outcome", "count"),
+            sorted(self.stats.items()),
+        )
+
+
+__all__ = (
+    "Job",
+    "JobQueue",
+)
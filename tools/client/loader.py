@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import asyncio
+from collections import Counter
+from typing import (
+    Awaitable,
+    Callable,
+    Dict,
+    Generic,
+    Hashable,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    TypeVar,
+)
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+BatchFunction = Callable[[List[K]], Awaitable[Dict[K, V]]]
+
+
+class DataLoader(Generic[K, V]):
+    """
+    Merges the keys requested during the same loop iteration into one batch.
+    Keys which are already being loaded share that load instead of queueing
+    again, nothing is kept once a batch has finished.
+
+    The batch function receives unique keys and returns a mapping,
+    keys it leaves out resolve to `default`.
+    """
+
+    def __init__(
+        self,
+        batch: BatchFunction[K, V],
+        *,
+        default: Optional[V] = None,
+        max_batch: int = 1000,
+    ):
+        self.batch = batch
+        self.default = default
+        self.max_batch = max_batch
+        self.queue: List[K] = []
+        self.in_flight: Dict[K, asyncio.Future[V]] = {}
+        self.tasks: Set[asyncio.Task[None]] = set()
+        self.stats: Counter[str] = Counter()
+
+    async def load(self, key: K) -> V:
+        try:
+            future = self.in_flight[key]
+        except KeyError:
+            loop = asyncio.get_running_loop()
+            self.in_flight[key] = future = loop.create_future()
+            if not self.queue:
+                loop.call_soon(self.dispatch)
+
+            self.queue.append(key)
+            self.stats["keys"] += 1
+        else:
+            self.stats["shared"] += 1
+
+        # Other callers are waiting on the same future.
+        return await asyncio.shield(future)
+
+    async def load_many(self, keys: Iterable[K]) -> List[V]:
+        return list(await asyncio.gather(*(self.load(key) for key in keys)))
+
+    def dispatch(self) -> None:
+        keys, self.queue = self.queue, []
+        for start in range(0, len(keys), self.max_batch):
+            task = asyncio.create_task(self.run(keys[start : start + self.max_batch]))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def run(self, keys: List[K]) -> None:
+        self.stats["batches"] += 1
+        try:
+            results = await self.batch(keys)
+        except BaseException as exc:
+            # Cancelled included, or the keys would stay in flight forever.
+            for key in keys:
+                future = self.in_flight.pop(key)
+                if future.done():
+                    continue
+
+                if isinstance(exc, asyncio.CancelledError):
+                    future.cancel()
+                else:
+                    future.set_exception(exc)
+
+            if not isinstance(exc, Exception):
+                raise
+
+            return
+
+        for key in keys:
+            future = self.in_flight.pop(key)
+            if not future.done():
+                future.set_result(results.get(key, self.default))  # type: ignore
+
+
+__all__ = ("DataLoader",)
@@ -1,59 +1,84 @@
+import atexit
+import copy
+import json
 import logging.handlers
 import pathlib
+import queue
 import sys
-from datetime import datetime
+from collections import Counter
+from datetime import datetime, timezone
+from functools import cache
 from logging import LogRecord
-from logging.handlers import RotatingFileHandler
-from os import name, system
-from typing import Dict, List, Optional, Tuple, cast
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, cast
 
 import rich
-from discord.utils import setup_logging
-from pygments.styles.monokai import MonokaiStyle  # DEP-WARN
-from pygments.token import (
-    Comment,
-    Error,
-    Keyword,
-    Name,
-    Number,
-    Operator,
-    String,
-    Token,
-)
 from rich._log_render import LogRender  # DEP-WARN
 from rich.console import Console, group
 from rich.highlighter import NullHighlighter
 from rich.logging import RichHandler
 from rich.style import Style
-from rich.syntax import ANSISyntaxTheme, PygmentsSyntaxTheme  # DEP-WARN
 from rich.text import Text
 from rich.theme import Theme
 from rich.traceback import PathHighlighter, Traceback  # DEP-WARN
 
+if TYPE_CHECKING:
+    from rich.syntax import SyntaxTheme
+
 TokenType = Tuple[str, ...]
 MAX_OLD_LOGS = 8
+MAX_QUEUED_RECORDS = 10_000
+
+
+@cache
+def get_syntax_theme(truecolor: bool) -> "SyntaxTheme":
+    """
+    Build the traceback syntax theme the first time a traceback is rendered,
+    the pygments style isn't needed for anything else.
+    """
+
+    from pygments.styles.monokai import MonokaiStyle  # DEP-WARN
+    from pygments.token import (
+        Comment,
+        Error,
+        Keyword,
+        Name,
+        Number,
+        Operator,
+        String,
+        Token,
+    )
+    from rich.syntax import ANSISyntaxTheme, PygmentsSyntaxTheme  # DEP-WARN
+
+    if truecolor:
+
+        class FixedMonokaiStyle(MonokaiStyle):
+            styles = {**MonokaiStyle.styles, Token: "#f8f8f2"}
+
+        return PygmentsSyntaxTheme(FixedMonokaiStyle)
 
-SYNTAX_THEME = {
-    Token: Style(),
-    Comment: Style(color="bright_black"),
-    Keyword: Style(color="cyan", bold=True),
-    Keyword.Constant: Style(color="bright_magenta"),
-    Keyword.Namespace: Style(color="bright_red"),
-    Operator: Style(bold=True),
-    Operator.Word: Style(color="cyan", bold=True),
-    Name.Builtin: Style(bold=True),
-    Name.Builtin.Pseudo: Style(color="bright_red"),
-    Name.Exception: Style(bold=True),
-    Name.Class: Style(color="bright_green"),
-    Name.Function: Style(color="bright_green"),
-    String: Style(color="yellow"),
-    Number: Style(color="cyan"),
-    Error: Style(bgcolor="bright_blue"),
-}
-
-
-class FixedMonokaiStyle(MonokaiStyle):
-    styles = {**MonokaiStyle.styles, Token: "#f8f8f2"}
+    return ANSISyntaxTheme(
+        cast(
+            Dict[TokenType, Style],
+            {
+                Token: Style(),
+                Comment: Style(color="bright_black"),
+                Keyword: Style(color="cyan", bold=True),
+                Keyword.Constant: Style(color="bright_magenta"),
+                Keyword.Namespace: Style(color="bright_red"),
+                Operator: Style(bold=True),
+                Operator.Word: Style(color="cyan", bold=True),
+                Name.Builtin: Style(bold=True),
+                Name.Builtin.Pseudo: Style(color="bright_red"),
+                Name.Exception: Style(bold=True),
+                Name.Class: Style(color="bright_green"),
+                Name.Function: Style(color="bright_green"),
+                String: Style(color="yellow"),
+                Number: Style(color="cyan"),
+                Error: Style(bgcolor="bright_blue"),
+            },
+        )
+    )
 
 
 class HarvestTraceback(Traceback):
@@ -156,7 +181,8 @@ class HarvestRichHandler(RichHandler):
                 exc_traceback,
                 width=self.tracebacks_width,
                 extra_lines=self.tracebacks_extra_lines,
-                theme=self.tracebacks_theme,
+                theme=self.tracebacks_theme
+                or get_syntax_theme(self.console.color_system == "truecolor"),
                 word_wrap=self.tracebacks_word_wrap,
                 show_locals=self.tracebacks_show_locals,
                 locals_max_length=self.locals_max_length,
@@ -192,10 +218,77 @@ class HarvestRichHandler(RichHandler):
             self.console.print(traceback)
 
 
-def init_logging(level: int) -> None:
-    system("cls" if name == "nt" else "clear")
+class BoundedQueueHandler(QueueHandler):
+    """
+    Hands records over to the listener thread without ever blocking the loop.
+    Records are dropped and counted once the queue is full.
+    """
+
+    def __init__(self, maxsize: int = MAX_QUEUED_RECORDS):
+        super().__init__(queue.Queue(maxsize))
+        self.dropped: Counter[str] = Counter()
+        self.enqueued = 0
+
+    def prepare(self, record: LogRecord) -> LogRecord:
+        # Unlike QueueHandler we keep exc_info, the traceback is rendered
+        # by the console handler on the listener thread instead of here.
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        return record
+
+    def enqueue(self, record: LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped[record.levelname] += 1
+        else:
+            self.enqueued += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "enqueued": self.enqueued,
+            "pending": self.queue.qsize(),  # type: ignore
+            "dropped": sum(self.dropped.values()),
+            **{f"dropped.{level.lower()}": count for level, count in self.dropped.items()},
+        }
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    One JSON object per line, for shipping production logs.
+    """
+
+    def format(self, record: LogRecord) -> str:
+        payload = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "module": record.module,
+            "line": record.lineno,
+            "thread": record.threadName,
+        }
+        if record.exc_info:
+            payload["exception"] = self.formatException(record.exc_info)
+
+        return json.dumps(payload, default=str)
+
+
+pipeline: Optional[BoundedQueueHandler] = None
+
+
+def init_logging(level: int, structured: Optional[str] = None) -> QueueListener:
+    """
+    Every record goes through a bounded queue to a listener thread,
+    which owns the console and the optional JSON lines file.
+    """
+
+    global pipeline
 
     rich_console = rich.get_console()
+    rich_console.clear()
     rich.reconfigure(tab_size=4)
     rich_console.push_theme(
         Theme(
@@ -224,19 +317,29 @@ def init_logging(level: int) -> None:
         highlighter=NullHighlighter(),
         tracebacks_extra_lines=0,
         tracebacks_show_locals=False,
-        tracebacks_theme=(
-            PygmentsSyntaxTheme(FixedMonokaiStyle)
-            if rich_console.color_system == "truecolor"
-            else ANSISyntaxTheme(cast(Dict[TokenType, Style], SYNTAX_THEME))
-        ),
     )
 
-    setup_logging(
-        handler=stdout_handler,
-        formatter=rich_formatter,
-        level=logging.INFO,
-        root=True,
-    )
+    stdout_handler.setFormatter(rich_formatter)
+    handlers: List[logging.Handler] = [stdout_handler]
+
+    if structured:
+        json_handler = RotatingFileHandler(
+            structured,
+            encoding="utf-8",
+            maxBytes=64 * 1024 * 1024,
+            backupCount=MAX_OLD_LOGS,
+        )
+        json_handler.setFormatter(JSONFormatter())
+        handlers.append(json_handler)
+
+    pipeline = BoundedQueueHandler()
+    listener = QueueListener(pipeline.queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.addHandler(pipeline)
 
     logging.captureWarnings(True)
 
@@ -245,14 +348,6 @@ def init_logging(level: int) -> None:
         logger = logging.getLogger(module)
         logger.setLevel(logging.WARNING)
 
-    # logging.getLogger("discord.http").setLevel(logging.DEBUG)
     logging.getLogger("asyncio").setLevel(logging.CRITICAL)
-    handler = RotatingFileHandler(
-        "Harvest.log",
-        encoding="utf-8",
-        mode="w",
-        maxBytes=32 * 1024 * 1024,
-        backupCount=3,
-    )
-    log = logging.getLogger("discord.http")
-    log.addHandler(handler)
+
+    return listener
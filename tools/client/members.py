@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import asyncio
+import re
+from collections import Counter
+from logging import getLogger
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+
+from discord import Guild, HTTPException, Member, NotFound
+from discord.ext.commands import MemberConverter
+from lru import LRU
+
+if TYPE_CHECKING:
+    from main import Harvest
+
+    from .context import Context
+
+log = getLogger("Harvest/members")
+
+MENTION = re.compile(r"<@!?([0-9]{15,20})>$|([0-9]{15,20})$")
+
+
+class MemberCache:
+    """
+    The members who have recently interacted with us, instead of every member
+    of every guild. Entries are refreshed each time the member talks to us,
+    anyone else is fetched when a command actually needs them.
+    """
+
+    def __init__(self, bot: "Harvest", maxsize: int = 10_000):
+        self.bot = bot
+        self.members: LRU = LRU(maxsize)
+        self.pending: Dict[Tuple[int, int], asyncio.Task[Optional[Member]]] = {}
+        self.stats: Counter[str] = Counter()
+
+    def __len__(self) -> int:
+        return len(self.members)
+
+    @property
+    def maxsize(self) -> int:
+        return self.members.get_size()
+
+    def remember(self, member: object) -> None:
+        if isinstance(member, Member):
+            self.members[(member.guild.id, member.id)] = member
+
+    def forget(self, guild_id: int, user_id: int) -> None:
+        self.members.pop((guild_id, user_id), None)
+
+    def get(self, guild: Guild, user_id: int) -> Optional[Member]:
+        try:
+            member = self.members[(guild.id, user_id)]
+        except KeyError:
+            # Our own member is always cached by discord.py.
+            member = guild.get_member(user_id)
+
+        self.stats["hits" if member else "misses"] += 1
+        return member
+
+    async def fetch(self, guild: Guild, user_id: int) -> Optional[Member]:
+        """
+        Get a member, fetching them over HTTP on a miss.
+        Concurrent lookups of the same member share a single request.
+        """
+
+        if member := self.get(guild, user_id):
+            return member
+
+        key = (guild.id, user_id)
+        try:
+            task = self.pending[key]
+        except KeyError:
+            self.pending[key] = task = asyncio.create_task(self._fetch(guild, user_id))
+            task.add_done_callback(lambda _: self.pending.pop(key, None))
+
+        return await asyncio.shield(task)
+
+    async def _fetch(self, guild: Guild, user_id: int) -> Optional[Member]:
+        self.stats["fetched"] += 1
+        try:
+            member = await guild.fetch_member(user_id)
+        except NotFound:
+            return None
+        except HTTPException as exc:
+            log.warning("Failed to fetch member %s in %s: %s", user_id, guild.id, exc)
+            return None
+
+        self.remember(member)
+        return member
+
+    def summary(self) -> str:
+        return (
+            f"Member cache: {len(self):,}/{self.maxsize:,} members, "
+            f"{self.stats['hits']:,} hits, {self.stats['misses']:,} misses, "
+            f"{self.stats['fetched']:,} fetched."
+        )
+
+
+class CachedMember(MemberConverter):
+    """
+    Resolves mentions and IDs through the member cache, so a member who
+    isn't cached is fetched instead of failing the conversion.
+    Names still go through discord.py, which queries the gateway.
+    """
+
+    async def convert(self, ctx: "Context", argument: str) -> Member:  # type: ignore
+        match = MENTION.match(argument)
+        if match and ctx.guild:
+            user_id = int(match.group(1) or match.group(2))
+            mentioned = next(
+                (user for user in ctx.message.mentions if user.id == user_id), None
+            )
+            if isinstance(mentioned, Member):
+                return mentioned
+
+            if member := await ctx.bot.members.fetch(ctx.guild, user_id):
+                return member
+
+        return await super().convert(ctx, argument)
+
+
+__all__ = (
+    "MemberCache",
+    "CachedMember",
+)
@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import asyncio
+import gc
+import os
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Sequence, Tuple
+
+from asyncpg import Record
+from discord import Member
+
+from tools.paginator import Paginator
+
+from .cache import registry
+from .context import Context
+from .database import Settings
+from .metrics import render_table
+
+if TYPE_CHECKING:
+    from main import Harvest
+
+IGNORED = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def rss() -> int:
+    """
+    The resident set size of the process in bytes.
+    """
+
+    try:
+        pages = int(Path("/proc/self/statm").read_text().split()[1])
+    except (OSError, IndexError, ValueError):
+        import resource
+
+        # ru_maxrss is the peak in kilobytes, the best we can do off Linux.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    return pages * os.sysconf("SC_PAGE_SIZE")
+
+
+def count_objects(types: Sequence[type]) -> Dict[str, int]:
+    """
+    Count the live instances of our own types, subclasses included.
+    This walks every object tracked by the garbage collector.
+    """
+
+    counts: Counter[str] = Counter({kind.__name__: 0 for kind in types})
+    for obj in gc.get_objects():
+        for kind in types:
+            if isinstance(obj, kind):
+                counts[kind.__name__] += 1
+
+    return dict(counts)
+
+
+def cache_sizes() -> List[Tuple[str, int]]:
+    return sorted(
+        (
+            (f"{func.__module__}.{func.__qualname__}", len(func.cache))  # type: ignore
+            for func in registry
+        ),
+        key=lambda item: -item[1],
+    )
+
+
+class MemoryReport:
+    """
+    Allocation growth between two tracemalloc snapshots plus the
+    counters we usually suspect when memory creeps up.
+    """
+
+    def __init__(self, bot: "Harvest", limit: int = 15):
+        self.bot = bot
+        self.limit = limit
+        self.growth: List[tracemalloc.StatisticDiff] = []
+        self.rss: Tuple[int, int] = (0, 0)
+        self.seconds = 0.0
+
+    async def diff(self, seconds: float, frames: int = 1) -> None:
+        """
+        Compare two snapshots taken `seconds` apart. If tracing wasn't
+        already running it is only enabled for the duration of the diff.
+        """
+
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start(frames)
+
+        try:
+            before_rss = rss()
+            before = await asyncio.to_thread(tracemalloc.take_snapshot)
+            await asyncio.sleep(seconds)
+            after = await asyncio.to_thread(tracemalloc.take_snapshot)
+            self.rss = (before_rss, rss())
+        finally:
+            if started:
+                tracemalloc.stop()
+
+        self.seconds = seconds
+        self.growth = await asyncio.to_thread(
+            lambda: after.filter_traces(IGNORED).compare_to(
+                before.filter_traces(IGNORED), "lineno"
+            )[: self.limit]
+        )
+
+    async def objects(self) -> Dict[str, int]:
+        counts = await asyncio.to_thread(
+            count_objects, (Settings, Context, Paginator, Record, Member)
+        )
+        counts["members (discord.py)"] = sum(len(guild.members) for guild in self.bot.guilds)
+        counts["members (recent)"] = len(self.bot.members)
+        counts["tasks"] = len(asyncio.all_tasks())
+        return counts
+
+    async def render(self) -> str:
+        lines: List[str] = []
+        if self.seconds:
+            before, after = self.rss
+            lines.append(
+                f"RSS {before / 2**20:,.1f}MiB -> {after / 2**20:,.1f}MiB "
+                f"over {self.seconds:g} seconds."
+            )
+            lines.append("")
+            lines.append(
+                render_table(
+                    ("allocation site", "growth", "blocks"),
+                    [
+                        (
+                            str(stat.traceback[0]) if stat.traceback else "?",
+                            f"{stat.size_diff / 1024:+,.1f}KiB",
+                            f"{stat.count_diff:+,}",
+                        )
+                        for stat in self.growth
+                    ],
+                )
+            )
+            lines.append("")
+        else:
+            lines.append(f"RSS {rss() / 2**20:,.1f}MiB.")
+
+        lines.append(self.bot.members.summary())
+        lines.append("")
+        objects = await self.objects()
+        lines.append(render_table(("object", "count"), list(objects.items())))
+
+        if caches := cache_sizes():
+            lines.append("")
+            lines.append(render_table(("cache", "entries"), caches))
+
+        return "\n".join(lines)
+
+
+__all__ = (
+    "MemoryReport",
+    "rss",
+)
@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+from bisect import bisect_left
+from typing import Dict, List, Sequence
+
+# Milliseconds, roughly logarithmic so both a 2ms cache hit
+# and a 5s stall land in a meaningful bucket.
+DEFAULT_BOUNDS = (
+    1,
+    2.5,
+    5,
+    10,
+    25,
+    50,
+    100,
+    250,
+    500,
+    1000,
+    2500,
+    5000,
+    10000,
+    30000,
+)
+
+
+class Histogram:
+    """
+    A fixed bucket histogram, cheap enough to update on every event.
+    Percentiles are interpolated within their bucket.
+    """
+
+    __slots__ = ("bounds", "counts", "count", "total", "maximum")
+
+    def __init__(self, bounds: Sequence[float] = DEFAULT_BOUNDS):
+        self.bounds = tuple(bounds)
+        self.counts: List[int] = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.maximum:
+            self.maximum = value
+
+    def merge(self, other: "Histogram") -> None:
+        if other.bounds != self.bounds:
+            raise ValueError("histograms with different bounds can't be merged")
+
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+
+        self.count += other.count
+        self.total += other.total
+        self.maximum = max(self.maximum, other.maximum)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, quantile: float) -> float:
+        if not self.count:
+            return 0.0
+
+        rank = quantile * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if not count or seen + count < rank:
+                seen += count
+                continue
+
+            lower = self.bounds[index - 1] if index else 0.0
+            upper = self.bounds[index] if index < len(self.bounds) else self.maximum
+            return min(
+                lower + (upper - lower) * ((rank - seen) / count),
+                self.maximum,
+            )
+
+        return self.maximum
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "mean": round(self.mean, 2),
+            "p50": round(self.percentile(0.50), 2),
+            "p95": round(self.percentile(0.95), 2),
+            "p99": round(self.percentile(0.99), 2),
+            "max": round(self.maximum, 2),
+        }
+
+
+def render_table(headers: Sequence[str], rows: Sequence[Sequence[object]]) -> str:
+    """
+    Render rows as a plain text table for a code block.
+    """
+
+    cells = [[str(header) for header in headers]] + [
+        [str(value) for value in row] for row in rows
+    ]
+    widths = [max(len(row[column]) for row in cells) for column in range(len(headers))]
+
+    return "\n".join(
+        "  ".join(
+            value.ljust(width) if column == 0 else value.rjust(width)
+            for column, (value, width) in enumerate(zip(row, widths))
+        )
+        for row in cells
+    )
+
+
+__all__ = (
+    "Histogram",
+    "render_table",
+)
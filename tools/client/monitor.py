@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from logging import getLogger
+from typing import Deque, List, Optional
+from weakref import WeakKeyDictionary
+
+from .metrics import Histogram, render_table
+
+log = getLogger("Harvest/monitor")
+
+
+class Stall:
+    """
+    A period where the event loop didn't get to run its timers.
+    """
+
+    __slots__ = ("started", "duration", "command", "stack")
+
+    def __init__(self, command: Optional[str], stack: List[str]):
+        self.started = time.time()
+        self.duration = 0.0
+        self.command = command
+        self.stack = stack
+
+
+class LoopMonitor:
+    """
+    Samples how late the event loop wakes up from a sleep and keeps a histogram
+    of that lag. A watchdog thread notices when the loop stops ticking altogether
+    and captures the main thread's stack while it's still blocked.
+
+    The sampler wakes every `interval` seconds. The watchdog wakes a few times
+    per `threshold` and pings the loop each time, the loop counts as blocked
+    from when it last answered, so it's cheap enough to leave running.
+    """
+
+    def __init__(self, interval: float = 0.25, threshold: float = 0.2):
+        self.interval = interval
+        self.threshold = threshold
+        self.lag = Histogram()
+        self.last_lag = 0.0
+        self.stalls: Deque[Stall] = deque(maxlen=25)
+        self.commands: WeakKeyDictionary[asyncio.Task, str] = WeakKeyDictionary()
+        self.heartbeat = time.monotonic()
+        self.pinged = False
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.thread_id = 0
+        self.sampler: Optional[asyncio.Task[None]] = None
+        self.stopped = threading.Event()
+
+    @property
+    def current_lag(self) -> float:
+        """
+        Seconds since the loop was last seen running, while a ping is waiting.
+        """
+
+        if not self.pinged:
+            return 0.0
+
+        return max(0.0, time.monotonic() - self.heartbeat)
+
+    def start(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.thread_id = threading.get_ident()
+        self.heartbeat = time.monotonic()
+        self.sampler = asyncio.create_task(self.sample())
+
+        threading.Thread(target=self.watch, name="loop-watchdog", daemon=True).start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        if self.sampler:
+            self.sampler.cancel()
+
+    def track(self, task: Optional[asyncio.Task], command: str) -> None:
+        """
+        Remember which command a task is running, for stall reports.
+        """
+
+        if task:
+            self.commands[task] = command
+
+    async def sample(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+
+            self.last_lag = max(0.0, loop.time() - start - self.interval)
+            self.lag.observe(self.last_lag * 1000)
+
+    def pong(self) -> None:
+        self.heartbeat = time.monotonic()
+        self.pinged = False
+
+    def ping(self) -> None:
+        if self.pinged or not self.loop:
+            return
+
+        self.pinged = True
+        try:
+            self.loop.call_soon_threadsafe(self.pong)
+        except RuntimeError:
+            # The loop was closed, there's nothing left to watch.
+            self.stopped.set()
+
+    def capture(self) -> Stall:
+        frame = sys._current_frames().get(self.thread_id)
+        stack = traceback.format_stack(frame) if frame else []
+
+        task = asyncio.current_task(self.loop) if self.loop else None
+        command = self.commands.get(task) if task else None
+        if not command and task:
+            command = f"task {task.get_name()}"
+
+        return Stall(command, stack)
+
+    def watch(self) -> None:
+        stall: Optional[Stall] = None
+
+        while not self.stopped.wait(self.threshold / 4):
+            self.ping()
+            behind = self.current_lag
+            if behind < self.threshold:
+                if stall:
+                    log.warning(
+                        "The event loop was blocked for %.0fms in %s.",
+                        stall.duration * 1000,
+                        stall.command or "an unknown callback",
+                    )
+                    stall = None
+
+                continue
+
+            if not stall:
+                stall = self.capture()
+                self.stalls.append(stall)
+                log.warning(
+                    "The event loop has been blocked for %.0fms in %s:\n%s",
+                    behind * 1000,
+                    stall.command or "an unknown callback",
+                    "".join(stall.stack[-8:]),
+                )
+
+            stall.duration = behind
+
+    def summary(self) -> str:
+        lag = self.lag.summary()
+        lines = [
+            f"Loop lag over {lag['count']:,} samples: p50 {lag['p50']}ms, "
+            f"p95 {lag['p95']}ms, p99 {lag['p99']}ms, max {lag['max']}ms.",
+        ]
+
+        if self.stalls:
+            lines.append("")
+            lines.append(
+                render_table(
+                    ("command", "blocked", "at"),
+                    [
+                        (
+                            stall.command or "unknown",
+                            f"{stall.duration * 1000:.0f}ms",
+                            (stall.stack[-1].strip().splitlines() or ["?"])[0]
+                            if stall.stack
+                            else "?",
+                        )
+                        for stall in reversed(self.stalls)
+                    ],
+                )
+            )
+
+        return "\n".join(lines)
+
+
+__all__ = (
+    "LoopMonitor",
+    "Stall",
+)
@@ -0,0 +1,237 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+from collections import Counter, deque
+from logging import getLogger
+from typing import TYPE_CHECKING, Any, Deque, Dict, List, Optional, Tuple
+
+from discord import Embed, HTTPException, Message
+from discord.abc import Messageable
+from discord.http import Route
+
+if TYPE_CHECKING:
+    from main import Harvest
+
+log = getLogger("Harvest/outbound")
+
+MAX_EMBEDS = 10
+MAX_EMBED_LENGTH = 6000
+MERGEABLE = {"embed", "embeds", "reference"}
+INVALID_FORM_BODY = 50035
+
+
+class Envelope:
+    """
+    A queued message and the future its sender is waiting on.
+    """
+
+    __slots__ = ("kwargs", "future", "batch", "context")
+
+    def __init__(self, kwargs: Dict[str, Any], batch: bool):
+        self.kwargs = kwargs
+        self.context = contextvars.copy_context()
+        self.future: asyncio.Future[Message] = asyncio.get_running_loop().create_future()
+        self.batch = batch
+
+    @property
+    def embeds(self) -> List[Embed]:
+        if embed := self.kwargs.get("embed"):
+            return [embed]
+
+        return list(self.kwargs.get("embeds", []))
+
+    @property
+    def reference(self) -> Optional[int]:
+        reference = self.kwargs.get("reference")
+        return getattr(reference, "message_id", None) or getattr(reference, "id", None)
+
+    def mergeable(self) -> bool:
+        return self.batch and bool(self.embeds) and set(self.kwargs) <= MERGEABLE
+
+
+class ChannelQueue:
+    """
+    Sends the queued messages of a channel one at a time.
+    The worker only lives while there is something to send.
+    """
+
+    def __init__(self, outbound: "Outbound", channel: Messageable, channel_id: int):
+        self.outbound = outbound
+        self.channel = channel
+        self.channel_id = channel_id
+        self.pending: Deque[Envelope] = deque()
+        self.worker: Optional[asyncio.Task[None]] = None
+
+    def put(self, envelope: Envelope) -> None:
+        self.pending.append(envelope)
+        if not self.worker or self.worker.done():
+            self.worker = asyncio.create_task(self.run())
+
+    def take_batch(self) -> List[Envelope]:
+        batch = [self.pending.popleft()]
+        if not batch[0].mergeable():
+            return batch
+
+        embeds = batch[0].embeds
+        length = sum(len(embed) for embed in embeds)
+        while self.pending:
+            following = self.pending[0]
+            if not following.mergeable() or following.reference != batch[0].reference:
+                break
+
+            extra = following.embeds
+            extra_length = sum(len(embed) for embed in extra)
+            if (
+                len(embeds) + len(extra) > MAX_EMBEDS
+                or length + extra_length > MAX_EMBED_LENGTH
+            ):
+                break
+
+            batch.append(self.pending.popleft())
+            embeds = embeds + extra
+            length += extra_length
+
+        return batch
+
+    async def run(self) -> None:
+        while self.pending:
+            # Waiting out an exhausted bucket here lets more messages queue
+            # up behind us, which can then be merged into a single request.
+            if delay := self.outbound.retry_after(self.channel_id):
+                await asyncio.sleep(delay)
+
+            batch = self.take_batch()
+            kwargs = batch[0].kwargs
+            if len(batch) > 1:
+                kwargs = {
+                    key: value
+                    for key, value in kwargs.items()
+                    if key not in ("embed", "embeds")
+                }
+                kwargs["embeds"] = [
+                    embed for envelope in batch for embed in envelope.embeds
+                ]
+                self.outbound.stats["merged"] += len(batch) - 1
+
+            try:
+                # Delivered within the sender's context, so that telemetry
+                # attributes the request to the command which queued it.
+                message = await asyncio.create_task(
+                    self.outbound.deliver(self.channel, kwargs),
+                    context=batch[0].context,
+                )
+            except Exception as exc:
+                for envelope in batch:
+                    if not envelope.future.done():
+                        envelope.future.set_exception(exc)
+            else:
+                for envelope in batch:
+                    if not envelope.future.done():
+                        envelope.future.set_result(message)
+
+        # Nothing awaits between the loop ending and this, so no message can be lost.
+        if self.outbound.queues.get(self.channel_id) is self:
+            del self.outbound.queues[self.channel_id]
+
+
+class Outbound:
+    """
+    Per-channel outbound message queues which respect the remaining
+    rate limit budget. Retrying 429s and server errors is left to discord.py.
+    """
+
+    def __init__(self, bot: "Harvest"):
+        self.bot = bot
+        self.queues: Dict[int, ChannelQueue] = {}
+        self.stats: Counter[str] = Counter()
+
+    def send(
+        self,
+        channel: Messageable,
+        channel_id: int,
+        *,
+        batch: bool = False,
+        **kwargs: Any,
+    ) -> asyncio.Future[Message]:
+        """
+        Queue a message, the returned future resolves once it's delivered.
+        When `batch` is set, queued embed only messages to the same channel
+        may be merged into a single message.
+        """
+
+        envelope = Envelope(kwargs, batch)
+        self.stats["queued"] += 1
+
+        queue = self.queues.get(channel_id)
+        if not queue:
+            queue = self.queues[channel_id] = ChannelQueue(self, channel, channel_id)
+
+        queue.put(envelope)
+        return envelope.future
+
+    @staticmethod
+    def log_failure(future: asyncio.Future[Message]) -> None:
+        if not future.cancelled() and (exc := future.exception()):
+            log.warning("Failed to deliver a queued message.", exc_info=exc)
+
+    def budget(self, channel_id: int) -> Tuple[Optional[int], float]:
+        """
+        The remaining requests and seconds until reset of the channel's
+        message bucket, as far as discord.py knows about it.
+        """
+
+        # DEP-WARN: discord.py keeps its rate limit state private.
+        http = self.bot.http
+        route = Route("POST", "/channels/{channel_id}/messages", channel_id=channel_id)
+        bucket_hash = getattr(http, "_bucket_hashes", {}).get(route.key)
+        if bucket_hash is None:
+            return None, 0.0
+
+        ratelimit = getattr(http, "_buckets", {}).get(
+            f"{bucket_hash}:{route.major_parameters}"
+        )
+        if ratelimit is None or ratelimit.is_expired():
+            return None, 0.0
+
+        reset_after = max(0.0, (ratelimit.expires or 0) - ratelimit._loop.time())
+        return ratelimit.remaining - ratelimit.outgoing, reset_after
+
+    def retry_after(self, channel_id: int) -> float:
+        remaining, reset_after = self.budget(channel_id)
+        if remaining is not None and remaining <= 0:
+            self.stats["throttled"] += 1
+            return reset_after
+
+        return 0.0
+
+    async def deliver(self, channel: Messageable, kwargs: Dict[str, Any]) -> Message:
+        # 429s and 5xx responses are already retried by discord.py's HTTPClient,
+        # only what it can't know about is handled here.
+        try:
+            message = await channel.send(**kwargs)
+        except HTTPException as exc:
+            # The reply target can't be referenced, send it standalone. References
+            # built by Context already pass fail_if_not_exists=False, this catches
+            # the ones passed in directly.
+            if not (
+                exc.code == INVALID_FORM_BODY
+                and "message_reference" in str(exc.text)
+                and kwargs.get("reference")
+            ):
+                self.stats["failed"] += 1
+                raise
+
+            self.stats["retried"] += 1
+            kwargs = {k: v for k, v in kwargs.items() if k != "reference"}
+            try:
+                message = await channel.send(**kwargs)
+            except HTTPException:
+                self.stats["failed"] += 1
+                raise
+
+        self.stats["sent"] += 1
+        return message
+
+
+__all__ = ("Outbound",)
@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import asyncio
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from types import FrameType
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+if TYPE_CHECKING:
+    from .monitor import LoopMonitor
+
+ROOT = str(Path.cwd())
+
+
+def frame_name(frame: FrameType) -> str:
+    code = frame.f_code
+    filename = code.co_filename
+    if filename.startswith(ROOT):
+        filename = filename[len(ROOT) + 1 :]
+    else:
+        filename = Path(filename).name
+
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({filename})".replace(";", ":")
+
+
+class SamplingProfiler:
+    """
+    A sampling profiler which walks the stacks of the running threads from
+    a background thread, so the profiled code isn't instrumented at all.
+
+    Stacks are counted in the collapsed format understood by flamegraph.pl,
+    speedscope and friends: one `root;...;leaf count` line per unique stack.
+    """
+
+    def __init__(
+        self,
+        interval: float = 0.005,
+        loop_only: bool = True,
+        monitor: Optional[LoopMonitor] = None,
+    ):
+        """
+        When a loop monitor is given, loop thread samples are tagged
+        with the command whose task was running at the time.
+        """
+
+        self.interval = interval
+        self.loop_only = loop_only
+        self.monitor = monitor
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.loop_thread = 0
+        self.stopped = threading.Event()
+
+    def command(self) -> Optional[str]:
+        if not self.monitor or not self.loop:
+            return None
+
+        task = asyncio.current_task(self.loop)
+        return self.monitor.commands.get(task) if task else None
+
+    def sample(self, own: int, names: Dict[int, str]) -> None:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+
+            elif self.loop_only and thread_id != self.loop_thread:
+                continue
+
+            stack: List[str] = []
+            current: Optional[FrameType] = frame
+            while current is not None:
+                stack.append(frame_name(current))
+                current = current.f_back
+
+            root = names.get(thread_id, str(thread_id))
+            if thread_id == self.loop_thread and self.monitor:
+                root = f"{root} [{self.command() or 'idle'}]"
+
+            stack.append(root)
+            self.stacks[";".join(reversed(stack))] += 1
+
+        self.samples += 1
+
+    def run(self) -> None:
+        own = threading.get_ident()
+        while not self.stopped.is_set():
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            started = time.perf_counter()
+            self.sample(own, names)  # type: ignore
+
+            self.stopped.wait(max(0.0, self.interval - (time.perf_counter() - started)))
+
+    async def profile(self, seconds: float) -> str:
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread = threading.get_ident()
+        self.stopped.clear()
+
+        thread = threading.Thread(target=self.run, name="sampling-profiler", daemon=True)
+        thread.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            self.stopped.set()
+            await asyncio.to_thread(thread.join)
+
+        return self.collapsed()
+
+    def collapsed(self) -> str:
+        return "\n".join(
+            f"{stack} {count}" for stack, count in self.stacks.most_common()
+        )
+
+
+__all__ = ("SamplingProfiler",)
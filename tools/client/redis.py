@@ -20,6 +20,8 @@ from xxhash import xxh32_hexdigest
 
 from config import config
 
+from .tracing import span
+
 log = getLogger("Harvest/redis")
 
 REDIS_URL = str(config.redis)
@@ -35,6 +37,27 @@ INCREMENT_SCRIPT = b"""
 INCREMENT_SCRIPT_HASH = sha1(INCREMENT_SCRIPT).hexdigest()
 
 
+def encode(value: EncodableT | dict | list | Any) -> EncodableT:
+    if isinstance(value, (dict, list)):
+        return dumps(value)
+
+    return value
+
+
+def decode(output: Any) -> Optional[str | int | dict | list]:
+    if isinstance(output, bytes):
+        output = output.decode("utf-8")
+
+    if output:
+        if output.isnumeric():
+            return int(output)
+
+        with suppress(JSONDecodeError):
+            return loads(output)
+
+    return output
+
+
 class Redis(DefaultRedis):
     async def __aenter__(self) -> "Redis":
         return await self.initialize()
@@ -70,19 +93,20 @@ class Redis(DefaultRedis):
             client_name=name,
         )
 
-        dur = 0
-        for _ in range(10):
-            start = time.perf_counter()
-            await client.ping()
-            dur += time.perf_counter() - start
+        start = time.perf_counter()
+        await client.ping()
 
         log.debug(
             "Established a new Redis client with a %sμs latency.",
-            int((dur / 10) * 1000000),
+            int((time.perf_counter() - start) * 1000000),
         )
 
         return client
 
+    async def execute_command(self, *args: Any, **options: Any) -> Any:
+        with span("redis"):
+            return await super().execute_command(*args, **options)
+
     async def set(
         self,
         name: KeyT,
@@ -96,10 +120,9 @@ class Redis(DefaultRedis):
         exat: Union[AbsExpiryT, None] = None,
         pxat: Union[AbsExpiryT, None] = None,
     ) -> bool | Any:
-        if isinstance(value, (dict, list)):
-            value = dumps(value)
-
-        return await super().set(name, value, ex, px, nx, xx, keepttl, get, exat, pxat)
+        return await super().set(
+            name, encode(value), ex, px, nx, xx, keepttl, get, exat, pxat
+        )
 
     async def get(
         self,
@@ -110,17 +133,18 @@ class Redis(DefaultRedis):
         if not validate:
             return output
 
-        if isinstance(output, bytes):
-            output = output.decode("utf-8")
+        return decode(output)
 
-        if output:
-            if output.isnumeric():
-                return int(output)
-
-            with suppress(JSONDecodeError):
-                return loads(output)
+    async def mget(
+        self,
+        keys: List[KeyT],
+        validate: bool = True,
+    ) -> List[Optional[str | int | dict | list]]:
+        output = await super().mget(keys)
+        if not validate:
+            return output
 
-        return output
+        return [decode(value) for value in output]
 
     async def getdel(
         self,
@@ -134,17 +158,7 @@ class Redis(DefaultRedis):
         if not validate:
             return output
 
-        if isinstance(output, bytes):
-            output = output.decode("utf-8")
-
-        if output:
-            if output.isnumeric():
-                return int(output)
-
-            with suppress(JSONDecodeError):
-                return loads(output)
-
-        return output
+        return decode(output)
 
     async def sadd(
         self,
@@ -251,6 +265,22 @@ class Redis(DefaultRedis):
 
         return int(current_usage) > limit
 
+    async def script(
+        self,
+        source: bytes,
+        digest: str,
+        keys: List[KeyT],
+        args: List[EncodableT],
+    ) -> Any:
+        """
+        Run a Lua script by its hash, loading it on the first miss.
+        """
+
+        try:
+            return await self.evalsha(digest, len(keys), *keys, *args)  # type: ignore
+        except NoScriptError:
+            return await self.eval(source, len(keys), *keys, *args)  # type: ignore
+
     def get_lock(
         self,
         name: KeyT,
@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import Counter, deque
+from typing import Deque, Dict
+
+from .metrics import Histogram, render_table
+
+
+class Waiter:
+    __slots__ = ("future", "cost")
+
+    def __init__(self, future: asyncio.Future[None], cost: int):
+        self.future = future
+        self.cost = cost
+
+
+class Scheduler:
+    """
+    Bounds how much command work runs at once and shares it fairly between
+    guilds with deficit round robin.
+
+    Commands cost one unit unless they declare `extras={"cost": n}`, roughly
+    the number of queries they make. Up to `capacity` units run at once, the
+    rest wait in a queue per guild. Guilds take turns, each turn a guild earns
+    `quantum` units of credit and runs as many of its queued commands as its
+    credit covers, so a burst from one guild can't push everyone else back.
+    """
+
+    def __init__(self, capacity: int = 20, quantum: int = 1):
+        self.capacity = capacity
+        self.quantum = quantum
+        self.available = capacity
+        self.queues: Dict[int, Deque[Waiter]] = {}
+        self.deficit: Dict[int, int] = {}
+        self.active: Deque[int] = deque()
+        self.fresh = True
+        self.waits = Histogram()
+        self.stats: Counter[str] = Counter()
+
+    @property
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self.queues.values())
+
+    async def acquire(self, key: int, cost: int = 1) -> int:
+        """
+        Wait for room to run a command of `cost` for the guild `key`.
+        Returns the cost actually taken, which must be released afterwards.
+        """
+
+        cost = max(1, min(cost, self.capacity))
+        if not self.active and self.available >= cost:
+            self.available -= cost
+            self.stats["immediate"] += 1
+            self.waits.observe(0.0)
+            return cost
+
+        waiter = Waiter(asyncio.get_running_loop().create_future(), cost)
+        if key not in self.queues:
+            self.queues[key] = deque()
+            self.active.append(key)
+
+        self.queues[key].append(waiter)
+        self.dispatch()
+
+        started = time.perf_counter()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            # We were granted a slot in the same iteration as being cancelled.
+            if waiter.future.done() and not waiter.future.cancelled():
+                self.release(cost)
+
+            self.stats["cancelled"] += 1
+            raise
+
+        self.stats["queued"] += 1
+        self.waits.observe((time.perf_counter() - started) * 1000)
+        return cost
+
+    def release(self, cost: int) -> None:
+        self.available += cost
+        self.dispatch()
+
+    def dispatch(self) -> None:
+        while self.active:
+            key = self.active[0]
+            queue = self.queues[key]
+            while queue and queue[0].future.done():
+                queue.popleft()
+
+            if not queue:
+                # An idle guild keeps no credit for later.
+                self.active.popleft()
+                del self.queues[key]
+                self.deficit.pop(key, None)
+                self.fresh = True
+                continue
+
+            if self.fresh:
+                self.deficit[key] = self.deficit.get(key, 0) + self.quantum
+                self.fresh = False
+
+            head = queue[0]
+            if head.cost > self.deficit[key]:
+                self.active.rotate(-1)
+                self.fresh = True
+                continue
+
+            if head.cost > self.available:
+                return
+
+            queue.popleft()
+            self.deficit[key] -= head.cost
+            self.available -= head.cost
+            head.future.set_result(None)
+
+    def summary(self) -> str:
+        wait = self.waits.summary()
+        return "\n".join(
+            (
+                f"{self.capacity - self.available}/{self.capacity} units in use, "
+                f"{self.queued:,} commands queued across {len(self.queues):,} guilds.",
+                f"Queue wait over {wait['count']:,} commands: p50 {wait['p50']}ms, "
+                f"p95 {wait['p95']}ms, p99 {wait['p99']}ms, max {wait['max']}ms.",
+                "",
+                render_table(("scheduled", "count"), self.stats.most_common()),
+            )
+        )
+
+
+__all__ = ("Scheduler",)
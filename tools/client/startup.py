@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import asyncio
+from contextlib import contextmanager
+from logging import getLogger
+from time import perf_counter
+from typing import Any, Awaitable, Iterator, List, NamedTuple, Optional, Tuple
+
+log = getLogger("Harvest/startup")
+
+
+class Phase(NamedTuple):
+    name: str
+    start: float
+    end: float
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+
+class Timeline:
+    """
+    Records how long each startup phase took, relative to the process start.
+    Phases may overlap when they were run concurrently.
+    """
+
+    origin: float
+    phases: List[Phase]
+
+    def __init__(self, origin: Optional[float] = None) -> None:
+        self.origin = perf_counter() if origin is None else origin
+        self.phases = []
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append(
+                Phase(name, start - self.origin, perf_counter() - self.origin)
+            )
+
+    def mark(self, name: str) -> float:
+        """
+        Record a milestone without a duration and return its offset.
+        """
+
+        offset = perf_counter() - self.origin
+        self.phases.append(Phase(name, offset, offset))
+        return offset
+
+    async def timed(self, name: str, awaitable: Awaitable[Any]) -> Any:
+        with self.phase(name):
+            return await awaitable
+
+    async def gather(self, *phases: Tuple[str, Awaitable[Any]]) -> List[Any]:
+        """
+        Run every awaitable concurrently, each recorded as its own phase.
+        The first exception is propagated once all of them have finished.
+        """
+
+        results = await asyncio.gather(
+            *(self.timed(name, awaitable) for name, awaitable in phases),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+        return results
+
+    @property
+    def elapsed(self) -> float:
+        return perf_counter() - self.origin
+
+    def render(self, title: str = "Startup timeline") -> str:
+        phases = sorted(self.phases, key=lambda phase: (phase.start, phase.end))
+        width = max((len(phase.name) for phase in phases), default=0)
+
+        lines = [f"{title} ({self.elapsed:.3f}s since process start):"]
+        for phase in phases:
+            duration = (
+                f"{phase.duration * 1000:>9.1f}ms" if phase.duration else " " * 11
+            )
+            lines.append(f"  +{phase.start:07.3f}s  {phase.name:<{width}}  {duration}")
+
+        return "\n".join(lines)
+
+    def report(self, title: str = "Startup timeline") -> None:
+        log.info(self.render(title))
+
+
+__all__ = (
+    "Phase",
+    "Timeline",
+)
@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import asyncio
+from collections import Counter
+from logging import getLogger
+from typing import Any, Coroutine, Dict, Optional, Set
+
+from .metrics import render_table
+from .tracing import current_trace
+
+log = getLogger("Harvest/tasks")
+
+
+class TaskGroup:
+    """
+    Background tasks which share a concurrency limit and counters.
+    """
+
+    def __init__(self, name: str, limit: Optional[int] = None):
+        self.name = name
+        self.limit = limit
+        self.semaphore = asyncio.Semaphore(limit) if limit else None
+        self.tasks: Set[asyncio.Task[Any]] = set()
+        self.running = 0
+        self.stats: Counter[str] = Counter()
+
+    @property
+    def waiting(self) -> int:
+        return len(self.tasks) - self.running
+
+    async def run(self, coro: Coroutine[Any, Any, Any]) -> Any:
+        # The spawning command's trace has finished by the time we run.
+        current_trace.set(None)
+        if not self.semaphore:
+            return await self.execute(coro)
+
+        try:
+            async with self.semaphore:
+                return await self.execute(coro)
+        finally:
+            # Cancelled while waiting for the semaphore.
+            coro.close()
+
+    async def execute(self, coro: Coroutine[Any, Any, Any]) -> Any:
+        self.running += 1
+        try:
+            return await coro
+        finally:
+            self.running -= 1
+
+    def done(self, task: asyncio.Task[Any]) -> None:
+        self.tasks.discard(task)
+        if task.cancelled():
+            self.stats["cancelled"] += 1
+            return
+
+        if exc := task.exception():
+            self.stats["failed"] += 1
+            log.error(
+                "Background task %s in %s failed.",
+                task.get_name(),
+                self.name,
+                exc_info=exc,
+            )
+            return
+
+        self.stats["completed"] += 1
+
+
+class TaskManager:
+    """
+    Owns every background task the bot starts, so none of them can be
+    garbage collected mid-flight or fail without a trace, and drains
+    them when the bot closes.
+
+    Groups created without a limit get `default_limit`.
+    """
+
+    def __init__(self, default_limit: int = 16) -> None:
+        self.groups: Dict[str, TaskGroup] = {}
+        self.default_limit = default_limit
+        self.closing = False
+
+    def group(self, name: str, limit: Optional[int] = None) -> TaskGroup:
+        """
+        Get a group, creating it with the given concurrency limit.
+        The limit of an existing group is left as it is.
+        """
+
+        try:
+            return self.groups[name]
+        except KeyError:
+            self.groups[name] = group = TaskGroup(name, limit or self.default_limit)
+            return group
+
+    def spawn(
+        self,
+        coro: Coroutine[Any, Any, Any],
+        *,
+        group: str = "default",
+        name: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> asyncio.Task[Any]:
+        if self.closing:
+            coro.close()
+            raise RuntimeError("can't spawn tasks while the bot is closing")
+
+        task_group = self.group(group, limit)
+        task = asyncio.create_task(task_group.run(coro), name=name)
+        task_group.tasks.add(task)
+        task_group.stats["spawned"] += 1
+        task.add_done_callback(task_group.done)
+        return task
+
+    @property
+    def in_flight(self) -> int:
+        return sum(len(group.tasks) for group in self.groups.values())
+
+    async def drain(self, timeout: float = 10) -> None:
+        """
+        Stop accepting tasks and wait up to `timeout` seconds for the
+        running ones, whatever is left after that is cancelled.
+        """
+
+        self.closing = True
+        pending = [task for group in self.groups.values() for task in group.tasks]
+        if not pending:
+            return
+
+        log.info("Waiting for %s background tasks to finish.", len(pending))
+        _, unfinished = await asyncio.wait(pending, timeout=timeout)
+        if unfinished:
+            log.warning(
+                "Cancelling %s background tasks which didn't finish in %s seconds.",
+                len(unfinished),
+                timeout,
+            )
+            for task in unfinished:
+                task.cancel()
+
+            await asyncio.wait(unfinished)
+
+    def summary(self) -> str:
+        if not self.groups:
+            return "No background tasks have been spawned."
+
+        return render_table(
+            ("group", "limit", "running", "waiting", "completed", "failed", "cancelled"),
+            [
+                (
+                    group.name,
+                    group.limit or "-",
+                    group.running,
+                    group.waiting,
+                    group.stats["completed"],
+                    group.stats["failed"],
+                    group.stats["cancelled"],
+                )
+                for group in self.groups.values()
+            ],
+        )
+
+
+__all__ = (
+    "TaskManager",
+    "TaskGroup",
+)
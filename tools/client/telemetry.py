@@ -0,0 +1,222 @@
+from __future__ import annotations
+
+import time
+from collections import Counter
+from contextvars import ContextVar
+from functools import wraps
+from logging import getLogger
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+from aiohttp import ClientSession, TraceConfig, TraceRequestEndParams
+from discord import HTTPException
+from lru import LRU
+
+from .metrics import Histogram, render_table
+
+if TYPE_CHECKING:
+    from discord.http import HTTPClient, Route
+
+log = getLogger("Harvest/telemetry")
+
+# The route of the REST call currently being made, read by the aiohttp
+# trace hooks which run inside the same task as HTTPClient.request.
+current_route: ContextVar[Optional[str]] = ContextVar("current_route", default=None)
+
+# The qualified name of the command being invoked, set by Harvest.invoke.
+current_command: ContextVar[Optional[str]] = ContextVar("current_command", default=None)
+
+
+class RouteStats:
+    __slots__ = (
+        "route",
+        "requests",
+        "attempts",
+        "errors",
+        "ratelimited",
+        "global_hits",
+        "exhausted",
+        "latency",
+    )
+
+    def __init__(self, route: str):
+        self.route = route
+        self.requests = 0
+        self.attempts = 0
+        self.errors = 0
+        self.ratelimited = 0
+        self.global_hits = 0
+        self.exhausted = 0
+        self.latency = Histogram()
+
+    def merge(self, other: "RouteStats") -> None:
+        self.requests += other.requests
+        self.attempts += other.attempts
+        self.errors += other.errors
+        self.ratelimited += other.ratelimited
+        self.global_hits += other.global_hits
+        self.exhausted += other.exhausted
+        self.latency.merge(other.latency)
+
+
+class HTTPTelemetry:
+    """
+    In-memory statistics for every Discord REST call, keyed by
+    route and major parameter.
+
+    HTTPClient.request is wrapped to time the whole call, including the time
+    spent waiting on rate limits. An aiohttp trace sees every attempt it makes,
+    which is where 429s and exhausted buckets show up.
+    """
+
+    def __init__(self, size: int = 4096):
+        self.routes: LRU = LRU(size)
+        self.commands: Counter[str] = Counter()
+        self.command_ratelimits: Counter[str] = Counter()
+        self.started = time.monotonic()
+        self.trace = TraceConfig()
+        self.trace.on_request_end.append(self.on_request_end)
+
+    @staticmethod
+    def route_key(route: Route) -> str:
+        major = route.major_parameters
+        return f"{route.key} ({major})" if major else route.key
+
+    def get_stats(self, key: str) -> RouteStats:
+        try:
+            return self.routes[key]
+        except KeyError:
+            self.routes[key] = stats = RouteStats(key)
+            return stats
+
+    def install(self, http: HTTPClient) -> None:
+        # DEP-WARN: every REST call goes through HTTPClient.request.
+        request = http.request
+
+        @wraps(request)
+        async def wrapper(route: Route, **kwargs: Any) -> Any:
+            key = self.route_key(route)
+            token = current_route.set(key)
+            start = time.perf_counter()
+
+            try:
+                return await request(route, **kwargs)
+            except HTTPException:
+                self.get_stats(key).errors += 1
+                raise
+            finally:
+                stats = self.get_stats(key)
+                stats.requests += 1
+                stats.latency.observe((time.perf_counter() - start) * 1000)
+                self.commands[current_command.get() or "<events>"] += 1
+                current_route.reset(token)
+
+        http.request = wrapper  # type: ignore
+
+    async def on_request_end(
+        self,
+        session: ClientSession,
+        context: SimpleNamespace,
+        params: TraceRequestEndParams,
+    ) -> None:
+        key = current_route.get()
+        if key is None:
+            return
+
+        stats = self.get_stats(key)
+        stats.attempts += 1
+
+        headers = params.response.headers
+        if params.response.status == 429:
+            stats.ratelimited += 1
+            self.command_ratelimits[current_command.get() or "<events>"] += 1
+            if headers.get("X-RateLimit-Global") or (
+                headers.get("X-RateLimit-Scope") == "global"
+            ):
+                stats.global_hits += 1
+
+        elif headers.get("X-RateLimit-Remaining") == "0":
+            stats.exhausted += 1
+
+    def reset(self) -> None:
+        self.routes.clear()
+        self.commands.clear()
+        self.command_ratelimits.clear()
+        self.started = time.monotonic()
+
+    def aggregate(self) -> Dict[str, RouteStats]:
+        """
+        Statistics per route with every major parameter merged together.
+        """
+
+        routes: Dict[str, RouteStats] = {}
+        for key, stats in self.routes.items():
+            route = key.split(" (", 1)[0]
+            if route not in routes:
+                routes[route] = RouteStats(route)
+
+            routes[route].merge(stats)
+
+        return routes
+
+    def summary(self, limit: int = 10) -> str:
+        routes = sorted(
+            self.aggregate().values(),
+            key=lambda stats: stats.requests,
+            reverse=True,
+        )
+        total = RouteStats("total")
+        for stats in routes:
+            total.merge(stats)
+
+        minutes = (time.monotonic() - self.started) / 60
+        lines = [
+            f"{total.requests:,} requests in {minutes:.1f} minutes, "
+            f"{total.ratelimited:,} 429s, {total.global_hits:,} global rate limit hits, "
+            f"{total.exhausted:,} exhausted buckets.",
+            "",
+            render_table(
+                ("route", "calls", "p50", "p95", "p99", "429", "exhausted"),
+                [
+                    (
+                        stats.route,
+                        stats.requests,
+                        f"{stats.latency.percentile(0.50):.0f}ms",
+                        f"{stats.latency.percentile(0.95):.0f}ms",
+                        f"{stats.latency.percentile(0.99):.0f}ms",
+                        stats.ratelimited,
+                        stats.exhausted,
+                    )
+                    for stats in routes[:limit]
+                ],
+            ),
+        ]
+
+        hottest = sorted(
+            (stats for stats in self.routes.values() if stats.ratelimited),
+            key=lambda stats: stats.ratelimited,
+            reverse=True,
+        )[:5]
+        if hottest:
+            lines.append("")
+            lines.append("Most rate limited:")
+            lines.extend(
+                f"  {stats.route}: {stats.ratelimited:,} 429s" for stats in hottest
+            )
+
+        if self.commands:
+            lines.append("")
+            lines.append("Calls by command:")
+            lines.extend(
+                f"  {command}: {count:,} calls, "
+                f"{self.command_ratelimits[command]:,} 429s"
+                for command, count in self.commands.most_common(5)
+            )
+
+        return "\n".join(lines)
+
+
+__all__ = (
+    "HTTPTelemetry",
+    "current_command",
+)
@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import json
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging import getLogger
+from logging.handlers import QueueListener, RotatingFileHandler
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .logging import BoundedQueueHandler
+from .metrics import Histogram, render_table
+
+
+class Trace:
+    """
+    The spans recorded while handling a single message.
+    """
+
+    __slots__ = ("command", "started", "checkpoint", "phases", "spans")
+
+    def __init__(self) -> None:
+        self.command: Optional[str] = None
+        self.started = time.perf_counter()
+        self.checkpoint = self.started
+        self.phases: Dict[str, float] = {}
+        self.spans: List[Tuple[str, float, float]] = []
+
+    def record(self, phase: str, start: float, duration: float) -> None:
+        self.phases[phase] = self.phases.get(phase, 0.0) + duration
+        self.spans.append((phase, start - self.started, duration))
+
+    def mark(self) -> None:
+        """
+        Start the next split from now.
+        """
+
+        self.checkpoint = time.perf_counter()
+
+    def split(self, phase: str) -> None:
+        """
+        Record the time since the previous split as its own phase.
+        """
+
+        now = time.perf_counter()
+        self.record(phase, self.checkpoint, now - self.checkpoint)
+        self.checkpoint = now
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def to_dict(self) -> dict:
+        return {
+            "command": self.command,
+            "time": time.time() - self.elapsed,
+            "total_ms": round(self.elapsed * 1000, 3),
+            "phases": {
+                phase: round(duration * 1000, 3)
+                for phase, duration in self.phases.items()
+            },
+            "spans": [
+                [phase, round(start * 1000, 3), round(duration * 1000, 3)]
+                for phase, start, duration in self.spans
+            ],
+        }
+
+
+current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+
+
+@contextmanager
+def span(phase: str) -> Iterator[None]:
+    """
+    Time a block as part of the current trace, a no-op outside of one.
+    """
+
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.record(phase, start, time.perf_counter() - start)
+
+
+def record_span(phase: str, duration: float) -> None:
+    """
+    Record a span which was timed elsewhere, such as by asyncpg.
+    """
+
+    if trace := current_trace.get():
+        trace.record(phase, time.perf_counter() - duration, duration)
+
+
+class Tracer:
+    """
+    Aggregates the finished traces into phase histograms per command.
+    A sample of full traces can be written to a JSON lines file,
+    through its own queue so the loop never touches the file.
+    """
+
+    def __init__(self, sink: Optional[str] = None, sample_rate: float = 0.01):
+        self.commands: Dict[str, Dict[str, Histogram]] = {}
+        self.sample_rate = sample_rate
+        self.sampled = getLogger("Harvest/traces")
+        self.sampled.propagate = False
+        self.listener: Optional[QueueListener] = None
+        if sink:
+            self.open(sink)
+
+    def open(self, sink: str) -> None:
+        handler = RotatingFileHandler(
+            sink,
+            encoding="utf-8",
+            maxBytes=64 * 1024 * 1024,
+            backupCount=3,
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+
+        pipeline = BoundedQueueHandler()
+        self.sampled.addHandler(pipeline)
+        self.sampled.setLevel(logging.INFO)
+        self.listener = QueueListener(pipeline.queue, handler)
+        self.listener.start()
+
+    def close(self) -> None:
+        if self.listener:
+            self.listener.stop()
+            self.listener = None
+
+    def begin(self) -> Tuple[Trace, object]:
+        trace = Trace()
+        return trace, current_trace.set(trace)
+
+    def finish(self, trace: Trace, token: object) -> None:
+        current_trace.reset(token)  # type: ignore
+        if not trace.command:
+            return
+
+        phases = self.commands.setdefault(trace.command, {})
+        for phase, duration in (*trace.phases.items(), ("total", trace.elapsed)):
+            if phase not in phases:
+                phases[phase] = Histogram()
+
+            phases[phase].observe(duration * 1000)
+
+        if self.listener and random.random() < self.sample_rate:
+            self.sampled.info(json.dumps(trace.to_dict()))
+
+    def reset(self) -> None:
+        self.commands.clear()
+
+    def summary(self, command: Optional[str] = None) -> str:
+        if command:
+            phases = self.commands.get(command)
+            if not phases:
+                return f"No traces have been recorded for {command}."
+
+            return f"{command} ({phases['total'].count:,} invocations)\n\n" + render_table(
+                ("phase", "count", "p50", "p95", "p99", "max"),
+                [
+                    (
+                        phase,
+                        histogram.count,
+                        f"{histogram.percentile(0.50):.1f}ms",
+                        f"{histogram.percentile(0.95):.1f}ms",
+                        f"{histogram.percentile(0.99):.1f}ms",
+                        f"{histogram.maximum:.1f}ms",
+                    )
+                    for phase, histogram in sorted(
+                        phases.items(), key=lambda item: -item[1].total
+                    )
+                ],
+            )
+
+        return render_table(
+            ("command", "count", "p50", "p95", "p99", "slowest phase"),
+            [
+                (
+                    name,
+                    phases["total"].count,
+                    f"{phases['total'].percentile(0.50):.1f}ms",
+                    f"{phases['total'].percentile(0.95):.1f}ms",
+                    f"{phases['total'].percentile(0.99):.1f}ms",
+                    max(
+                        (phase for phase in phases if phase != "total"),
+                        key=lambda phase: phases[phase].percentile(0.95),
+                        default="-",
+                    ),
+                )
+                for name, phases in sorted(
+                    self.commands.items(), key=lambda item: -item[1]["total"].total
+                )
+            ],
+        )
+
+
+__all__ = (
+    "Trace",
+    "Tracer",
+    "span",
+    "record_span",
+    "current_trace",
+)
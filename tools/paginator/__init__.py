@@ -1,38 +1,65 @@
 from __future__ import annotations
 
 import asyncio
+from collections import Counter
 from contextlib import suppress
-from math import ceil
-from typing import TYPE_CHECKING, List, Optional, cast
+from logging import getLogger
+from typing import TYPE_CHECKING, ClassVar, List, Optional
 
 from discord import ButtonStyle, Color, Embed, HTTPException, Interaction, Message
-from discord.utils import as_chunks
+from lru import LRU
 
 from tools import Button, View
+from tools.client.metrics import render_table
+
+from .persistent import PageButton, register_source, send_persistent
+from .sources import ListPageSource, Page, PageSource, QueryPageSource
 
 if TYPE_CHECKING:
     from tools.client import Context
 
+log = getLogger("Harvest/paginator")
+
 
 class Paginator(View):
-    entries: List[str] | List[Embed]
+    source: PageSource
     message: Message
     index: int
+    pages: int
+    shown: Optional[int]
+    flusher: Optional[asyncio.Task[None]]
+
+    # Process wide edit counters, the requested edits which were
+    # neither sent nor failed are what coalescing saved us.
+    stats: ClassVar[Counter[str]] = Counter()
 
     def __init__(
         self,
         ctx: Context,
         *,
-        entries: List[str] | List[dict] | List[Embed],
+        entries: Optional[List[str] | List[dict] | List[Embed]] = None,
+        source: Optional[PageSource] = None,
         embed: Optional[Embed] = None,
         per_page: int = 10,
         counter: bool = True,
+        cache_size: int = 5,
     ):
         super().__init__(timeout=60)
         self.ctx = ctx
-        self.entries = self.prepare_entries(entries, embed, per_page, counter)
+        self.source = source or ListPageSource(
+            entries or [],
+            embed=embed,
+            per_page=per_page,
+            counter=counter,
+            color=ctx.color,
+        )
+        self.cache: LRU = LRU(cache_size)
         self.message = None  # type: ignore
         self.index = 0
+        self.pages = 0
+        self.shown = None
+        self.dirty = False
+        self.flusher = None
         self.add_buttons()
 
     async def interaction_check(self, interaction: Interaction) -> bool:
@@ -45,7 +72,21 @@ class Paginator(View):
 
         return interaction.user == self.ctx.author
 
+    @classmethod
+    def edits_saved(cls) -> int:
+        return cls.stats["requested"] - cls.stats["sent"] - cls.stats["failed"]
+
+    @classmethod
+    def summary(cls) -> str:
+        return render_table(
+            ("edits", "count"),
+            [*sorted(cls.stats.items()), ("saved", cls.edits_saved())],
+        )
+
     async def on_timeout(self) -> None:
+        if self.flusher:
+            self.flusher.cancel()
+
         if self.message:
             with suppress(HTTPException):
                 await self.message.edit(view=None)
@@ -77,140 +118,55 @@ class Paginator(View):
         ):
             self.add_item(button)
 
-    def prepare_entries(
-        self,
-        entries: List[str] | List[dict] | List[Embed],
-        embed: Optional[Embed],
-        per_page: int,
-        counter: bool,
-    ) -> List[str] | List[Embed]:
+    def prepare_entries(self) -> List[Page]:
         """
-        Compiles the entries to a proper list.
-        If an embed isn't present then we'll use a list of strings.
-
-        If the first item is a dictionary then we'll use fields instead of the description.
+        Compiles every page up front.
+        Only list sources can do this, the paginator itself renders on demand.
         """
 
-        compiled: List[str | Embed] = []
-        pages = ceil(len(entries) / per_page)
-
-        if not embed:
-            if isinstance(entries[0], str):
-                entries = cast(List[str], entries)
-
-                for index, entry in enumerate(entries):
-                    if "page" not in entry and counter:
-                        entry = f"({index + 1}/{len(entries)}) {entry}"
-
-                    entry = entry.format(page=index + 1, pages=len(entries))
-                    compiled.append(entry)
-
-        elif not entries:
-            compiled.append(embed)
-
-        elif isinstance(entries[0], str):
-            offset = 0
-
-            for chunk in as_chunks(entries, per_page):
-                entry = embed.copy()
-                if not entry.color:
-                    entry.color = self.ctx.color
-
-                entry.description = f"{entry.description or ''}\n\n"
-
-                for value in chunk:
-                    offset += 1
-                    entry.description += (
-                        f"`{offset}` {value}\n" if counter else f"{value}\n"
-                    )
-
-                if pages > 1:
-                    footer = entry.footer
-                    if footer and footer.text:
-                        entry.set_footer(
-                            text=" • ".join(
-                                [
-                                    footer.text,
-                                    f"Page {len(compiled) + 1} of {pages:,}",
-                                ]
-                            ),
-                            icon_url=footer.icon_url,
-                        )
-
-                    else:
-                        entry.set_footer(
-                            text=f"Page {len(compiled) + 1} of {pages:,}",
-                        )
-
-                compiled.append(entry)
-
-        elif isinstance(entries[0], dict):
-            entries = cast(List[dict], entries)
-            pages = ceil(len(entries) / per_page)
-
-            for chunk in as_chunks(entries, per_page):
-                entry = embed.copy()
-                if not entry.color:
-                    entry.color = self.ctx.color
-
-                for field in chunk:
-                    entry.add_field(**field)
-
-                if pages > 1:
-                    footer = entry.footer
-                    if footer and footer.text:
-                        entry.set_footer(
-                            text=" • ".join(
-                                [
-                                    footer.text,
-                                    f"Page {len(compiled) + 1} of {pages}",
-                                ]
-                            ),
-                            icon_url=footer.icon_url,
-                        )
-
-                    else:
-                        entry.set_footer(
-                            text=f"Page {len(compiled) + 1} of {pages}",
-                        )
-
-                compiled.append(entry)
-
-        if entries and isinstance(entries[0], Embed):
-            pages = len(entries)
-            for index, entry in enumerate(entries):
-                entry = cast(Embed, entry)
-                if not entry.color:
-                    entry.color = self.ctx.color
-
-                if len(entries) > 1:
-                    footer = entry.footer
-                    if footer and footer.text:
-                        entry.set_footer(
-                            text=" • ".join(
-                                [
-                                    footer.text,
-                                    f"Page {len(compiled) + 1} of {pages}",
-                                ]
-                            ),
-                            icon_url=footer.icon_url,
-                        )
-
-                    else:
-                        entry.set_footer(
-                            text=f"Page {len(compiled) + 1} of {pages}",
-                        )
-
-                compiled.append(entry)
-
-        return compiled  # type: ignore
+        if not isinstance(self.source, ListPageSource):
+            raise TypeError("only list sources can be compiled up front")
+
+        return [self.source.format_page(index) for index in range(self.source.pages)]
+
+    def get_page(self, index: int) -> asyncio.Task[Page]:
+        try:
+            return self.cache[index]
+        except KeyError:
+            self.cache[index] = task = asyncio.create_task(self.source.get_page(index))
+            task.add_done_callback(lambda task: self.evict_failed(index, task))
+            return task
+
+    def evict_failed(self, index: int, task: asyncio.Task[Page]) -> None:
+        # Prefetched pages may never be awaited, so failures are seen here.
+        if task.cancelled():
+            exc: Optional[BaseException] = None
+        elif (exc := task.exception()) is None:
+            return
+
+        if exc:
+            log.warning("Failed to render page %s.", index + 1, exc_info=exc)
+
+        with suppress(KeyError):
+            if self.cache[index] is task:
+                del self.cache[index]
+
+    async def render_page(self, index: int) -> Page:
+        page = await self.get_page(index)
+
+        # Warm the next page while the user is reading this one.
+        if self.pages > 1:
+            self.get_page((index + 1) % self.pages)
+
+        return page
 
     async def start(self) -> Message:
-        if not self.entries:
+        self.pages = await self.source.get_page_count()
+        if not self.pages:
             raise ValueError("no entries were provided")
 
-        page = self.entries[self.index]
-        if len(self.entries) == 1:
+        page = await self.render_page(self.index)
+        if self.pages == 1:
             self.message = (
                 await self.ctx.send(content=page)
                 if isinstance(page, str)
@@ -223,15 +179,61 @@ class Paginator(View):
                 else await self.ctx.send(embed=page, view=self)
             )
 
+        self.shown = self.index
         return self.message
 
+    def request_edit(self, *, force: bool = False) -> None:
+        """
+        Ask for the message to show the current index.
+        While an edit is in flight only the latest index is kept,
+        so there is never more than one edit pending per message.
+        """
+
+        self.stats["requested"] += 1
+        self.dirty = self.dirty or force
+
+        if self.flusher and not self.flusher.done():
+            self.stats["coalesced"] += 1
+            return
+
+        elif self.shown == self.index and not self.dirty:
+            self.stats["skipped"] += 1
+            return
+
+        self.flusher = asyncio.create_task(self.flush())
+
+    async def flush(self) -> None:
+        while self.shown != self.index or self.dirty:
+            index, self.dirty = self.index, False
+
+            try:
+                page = await self.render_page(index)
+            except Exception:
+                # Logged by evict_failed already.
+                return
+
+            try:
+                if isinstance(page, str):
+                    await self.message.edit(content=page, view=self)
+                else:
+                    await self.message.edit(embed=page, view=self)
+            except HTTPException as exc:
+                # Left as it was, so the next request tries again.
+                self.stats["failed"] += 1
+                self.dirty = True
+                log.warning("Failed to show page %s: %s", index + 1, exc)
+                return
+
+            self.stats["sent"] += 1
+            self.shown = index
+
     async def callback(self, interaction: Interaction, button: Button):
         await interaction.response.defer()
 
         if button.custom_id == "previous":
-            self.index = len(self.entries) - 1 if self.index <= 0 else self.index - 1
+            self.index = self.pages - 1 if self.index <= 0 else self.index - 1
         elif button.custom_id == "next":
-            self.index = 0 if self.index >= (len(self.entries) - 1) else self.index + 1
+            self.index = 0 if self.index >= (self.pages - 1) else self.index + 1
         elif button.custom_id == "navigation":
             await self.disable_buttons()
             await self.message.edit(view=self)
@@ -253,7 +255,7 @@ class Paginator(View):
                         m.author == interaction.user
                         and m.channel == interaction.channel
                         and m.content.isdigit()
-                        and int(m.content) <= len(self.entries)
+                        and 0 < int(m.content) <= self.pages
                     ),
                 )
             except asyncio.TimeoutError:
@@ -269,6 +271,9 @@ class Paginator(View):
                     if response:
                         await response.delete()
         elif button.custom_id == "cancel":
+            if self.flusher:
+                self.flusher.cancel()
+
             with suppress(HTTPException):
                 await self.message.delete()
                 await self.ctx.message.delete()
@@ -276,9 +281,16 @@ class Paginator(View):
 
             return
 
-        page = self.entries[self.index]
-        with suppress(HTTPException):
-            if isinstance(page, str):
-                await self.message.edit(content=page, view=self)
-            else:
-                await self.message.edit(embed=page, view=self)
+        # The buttons were re-enabled after navigating, so that edit is forced.
+        self.request_edit(force=button.custom_id == "navigation")
+
+
+__all__ = (
+    "Paginator",
+    "PageSource",
+    "ListPageSource",
+    "QueryPageSource",
+    "PageButton",
+    "register_source",
+    "send_persistent",
+)
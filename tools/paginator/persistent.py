@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import re
+from typing import TYPE_CHECKING, Callable, Dict, Optional
+
+from discord import ButtonStyle, Color, Embed, Interaction, Message
+from discord.ui import Button as OriginalButton
+from discord.ui import DynamicItem
+from discord.ui import View as OriginalView
+from lru import LRU
+
+from .sources import PageSource
+
+if TYPE_CHECKING:
+    from main import Harvest
+    from tools.client import Context
+
+SourceFactory = Callable[["Harvest", str], PageSource]
+
+ACTIONS = {
+    "previous": "⬅",
+    "next": "➡",
+    "cancel": "⏹",
+}
+
+# Discord rejects longer custom ids.
+CUSTOM_ID_LIMIT = 100
+
+# Every persistent paginator of a source shares the same instance,
+# this keeps page counts and keyset bookmarks around between clicks.
+factories: Dict[str, SourceFactory] = {}
+sources: LRU = LRU(256)
+
+
+def register_source(name: str, factory: SourceFactory) -> None:
+    """
+    Register a page source factory under a name that is stored in button ids.
+    The factory receives the bot and the argument the paginator was started with.
+    """
+
+    if not re.fullmatch(r"\w+", name):
+        raise ValueError("source names may only contain word characters")
+
+    factories[name] = factory
+
+
+def get_source(bot: "Harvest", name: str, argument: str) -> PageSource:
+    key = f"{name}:{argument}"
+    try:
+        return sources[key]
+    except KeyError:
+        sources[key] = source = factories[name](bot, argument)
+        return source
+
+
+class PageButton(
+    DynamicItem[OriginalButton],
+    template=r"pg:(?P<name>\w+):(?P<argument>[^:]*):(?P<author>\d+):(?P<index>\d+):(?P<action>\w+)",
+):
+    """
+    A paginator button which carries all of its state in the custom id.
+    It's registered once at startup and handles every persistent paginator,
+    the page is re-rendered from its source on each click.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        argument: str,
+        author: int,
+        index: int,
+        action: str,
+    ):
+        self.name = name
+        self.argument = argument
+        self.author = author
+        self.index = index
+        self.action = action
+        super().__init__(
+            OriginalButton(
+                style=ButtonStyle.blurple,
+                emoji=ACTIONS[action],
+                custom_id=f"pg:{name}:{argument}:{author}:{index}:{action}",
+            )
+        )
+
+    @classmethod
+    async def from_custom_id(
+        cls,
+        interaction: Interaction,
+        item: OriginalButton,
+        match: re.Match[str],
+        /,
+    ) -> "PageButton":
+        return cls(
+            match["name"],
+            match["argument"],
+            int(match["author"]),
+            int(match["index"]),
+            match["action"],
+        )
+
+    async def interaction_check(self, interaction: Interaction) -> bool:
+        if interaction.user.id != self.author:
+            embed = Embed(
+                description="You are not allowed to interact with this paginator!",
+                color=Color.dark_embed(),
+            )
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+            return False
+
+        elif self.name not in factories:
+            await interaction.response.edit_message(view=None)
+            return False
+
+        return True
+
+    async def callback(self, interaction: Interaction) -> None:
+        if self.action == "cancel":
+            await interaction.response.defer()
+            if interaction.message:
+                await interaction.message.delete()
+
+            return
+
+        source = get_source(interaction.client, self.name, self.argument)  # type: ignore
+        pages = await source.get_page_count()
+        if not pages:
+            await interaction.response.edit_message(view=None)
+            return
+
+        index = min(self.index, pages - 1)
+        if self.action == "previous":
+            index = pages - 1 if index <= 0 else index - 1
+        elif self.action == "next":
+            index = 0 if index >= pages - 1 else index + 1
+
+        page = await source.get_page(index)
+        view = build_view(self.name, self.argument, self.author, index)
+        if isinstance(page, str):
+            await interaction.response.edit_message(content=page, view=view)
+        else:
+            await interaction.response.edit_message(embed=page, view=view)
+
+
+def build_view(name: str, argument: str, author: int, index: int) -> OriginalView:
+    view = OriginalView(timeout=None)
+    for action in ACTIONS:
+        view.add_item(PageButton(name, argument, author, index, action))
+
+    # Nothing needs to be kept in the view store, PageButton is
+    # registered as a dynamic item and rebuilds itself from the id.
+    view.stop()
+    return view
+
+
+async def send_persistent(
+    ctx: Context,
+    name: str,
+    argument: str = "",
+) -> Optional[Message]:
+    """
+    Start a stateless paginator over a registered source.
+    The argument is kept in the button ids, so it can't contain colons.
+    """
+
+    if ":" in argument:
+        raise ValueError("source arguments may not contain colons")
+
+    source = get_source(ctx.bot, name, argument)
+    pages = await source.get_page_count()
+    if not pages:
+        raise ValueError("no entries were provided")
+
+    longest = max(ACTIONS, key=len)
+    if len(f"pg:{name}:{argument}:{ctx.author.id}:{pages - 1}:{longest}") > CUSTOM_ID_LIMIT:
+        raise ValueError("the source argument is too long for a button id")
+
+    page = await source.get_page(0)
+    view = build_view(name, argument, ctx.author.id, 0) if pages > 1 else None
+    if isinstance(page, str):
+        return await ctx.send(content=page, view=view)
+
+    return await ctx.send(embed=page, view=view)
+
+
+__all__ = (
+    "PageButton",
+    "register_source",
+    "send_persistent",
+)
@@ -0,0 +1,336 @@
+from __future__ import annotations
+
+import time
+from abc import ABC, abstractmethod
+from math import ceil
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+    cast,
+)
+
+from discord import Colour, Embed
+
+if TYPE_CHECKING:
+    from tools.client.database import Database, Record
+
+Page = Union[str, Embed]
+
+
+def set_page_footer(entry: Embed, index: int, pages: int) -> Embed:
+    footer = entry.footer
+    if footer and footer.text:
+        entry.set_footer(
+            text=" • ".join([footer.text, f"Page {index + 1} of {pages:,}"]),
+            icon_url=footer.icon_url,
+        )
+
+    else:
+        entry.set_footer(text=f"Page {index + 1} of {pages:,}")
+
+    return entry
+
+
+def render_lines(
+    embed: Embed,
+    lines: Sequence[str],
+    *,
+    index: int,
+    pages: int,
+    offset: int,
+    counter: bool,
+    color: Optional[Colour] = None,
+) -> Embed:
+    """
+    Render a chunk of lines into a copy of the embed template.
+    The offset is the number of entries on the previous pages.
+    """
+
+    entry = embed.copy()
+    if not entry.color:
+        entry.color = color
+
+    description = [f"{entry.description or ''}\n\n"]
+    for value in lines:
+        offset += 1
+        description.append(f"`{offset}` {value}\n" if counter else f"{value}\n")
+
+    entry.description = "".join(description)
+    if pages > 1:
+        set_page_footer(entry, index, pages)
+
+    return entry
+
+
+class PageSource(ABC):
+    """
+    Renders the pages of a paginator on demand.
+    """
+
+    @abstractmethod
+    async def get_page_count(self) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_page(self, index: int) -> Page:
+        raise NotImplementedError
+
+
+class ListPageSource(PageSource):
+    """
+    Pages over an in-memory list of strings, field dictionaries or embeds.
+
+    If an embed isn't present then every string is its own page.
+    If the first item is a dictionary then we'll use fields instead of the description.
+    """
+
+    def __init__(
+        self,
+        entries: List[str] | List[dict] | List[Embed],
+        *,
+        embed: Optional[Embed] = None,
+        per_page: int = 10,
+        counter: bool = True,
+        color: Optional[Colour] = None,
+    ):
+        self.entries = entries
+        self.embed = embed
+        self.per_page = per_page
+        self.counter = counter
+        self.color = color
+        self.pages = self.count_pages()
+
+    def count_pages(self) -> int:
+        entries, embed = self.entries, self.embed
+
+        if not entries:
+            return 1 if embed else 0
+
+        elif isinstance(entries[0], Embed):
+            return len(entries)
+
+        elif not embed:
+            return len(entries) if isinstance(entries[0], str) else 0
+
+        return ceil(len(entries) / self.per_page)
+
+    def format_page(self, index: int) -> Page:
+        entries, embed = self.entries, self.embed
+
+        if not entries:
+            return cast(Embed, embed)
+
+        elif isinstance(entries[0], Embed):
+            entry = cast(Embed, entries[index]).copy()
+            if not entry.color:
+                entry.color = self.color
+
+            if self.pages > 1:
+                set_page_footer(entry, index, self.pages)
+
+            return entry
+
+        elif not embed:
+            text = cast(str, entries[index])
+            if "page" not in text and self.counter:
+                text = f"({index + 1}/{len(entries)}) {text}"
+
+            return text.format(page=index + 1, pages=len(entries))
+
+        start = index * self.per_page
+        chunk = entries[start : start + self.per_page]
+
+        if isinstance(entries[0], dict):
+            entry = embed.copy()
+            if not entry.color:
+                entry.color = self.color
+
+            for field in cast(List[dict], chunk):
+                entry.add_field(**field)
+
+            if self.pages > 1:
+                set_page_footer(entry, index, self.pages)
+
+            return entry
+
+        return render_lines(
+            embed,
+            cast(List[str], chunk),
+            index=index,
+            pages=self.pages,
+            offset=start,
+            counter=self.counter,
+            color=self.color,
+        )
+
+    async def get_page_count(self) -> int:
+        return self.pages
+
+    async def get_page(self, index: int) -> Page:
+        return self.format_page(index)
+
+
+class QueryPageSource(PageSource):
+    """
+    Pages straight out of PostgreSQL with keyset pagination,
+    so only the rows of the page being viewed are ever loaded.
+
+    The query is wrapped as a subquery and ordered by the key columns,
+    which must uniquely identify a row. The first and last row keys of every
+    visited page are remembered, a page is always found by seeking from a
+    neighbour's keys or from either end, so every fetch stays an index scan
+    and nothing is ever skipped with OFFSET. Jumping further ahead walks the
+    pages in between. Both the count and the bookmarks are refreshed every
+    `ttl` seconds.
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        query: str,
+        *args: Any,
+        keys: Tuple[str, ...],
+        format_entry: Callable[[Record], str],
+        embed: Embed,
+        per_page: int = 10,
+        descending: bool = False,
+        counter: bool = True,
+        count_query: Optional[str] = None,
+        color: Optional[Colour] = None,
+        ttl: float = 60,
+    ):
+        self.db = db
+        self.query = query
+        self.args = args
+        self.keys = keys
+        self.format_entry = format_entry
+        self.embed = embed
+        self.per_page = per_page
+        self.descending = descending
+        self.counter = counter
+        self.count_query = count_query or f"SELECT COUNT(*) FROM ({query}) AS source"
+        self.color = color
+        self.ttl = ttl
+        self.total = 0
+        self.pages: Optional[int] = None
+        self.counted_at = 0.0
+        # The first and last row keys of each visited page.
+        self.bookmarks: Dict[int, Tuple[Tuple[Any, ...], Tuple[Any, ...]]] = {}
+
+    async def get_page_count(self) -> int:
+        if self.pages is None or time.monotonic() > self.counted_at + self.ttl:
+            self.total = cast(int, await self.db.fetchval(self.count_query, *self.args)) or 0
+            self.pages = ceil(self.total / self.per_page)
+            self.counted_at = time.monotonic()
+            self.bookmarks.clear()
+
+        return self.pages
+
+    def build_query(self, seek: Optional[str], backwards: bool, limit: int) -> str:
+        """
+        Seek "after" or "before" the keys passed after the query's own
+        arguments, reading backwards returns the rows in reverse order.
+        """
+
+        columns = ", ".join(self.keys)
+        # Going forwards means increasing keys unless the order is descending.
+        increasing = self.descending == backwards
+        position = len(self.args)
+
+        query = [f"SELECT * FROM ({self.query}) AS source"]
+        if seek:
+            placeholders = ", ".join(
+                f"${position + index + 1}" for index in range(len(self.keys))
+            )
+            query.append(f"WHERE ({columns}) {'>' if increasing else '<'} ({placeholders})")
+
+        direction = "ASC" if increasing else "DESC"
+        query.append("ORDER BY " + ", ".join(f"{key} {direction}" for key in self.keys))
+        query.append(f"LIMIT {limit}")
+        return "\n".join(query)
+
+    async def seek(
+        self,
+        after: Optional[Tuple[Any, ...]] = None,
+        before: Optional[Tuple[Any, ...]] = None,
+        limit: Optional[int] = None,
+        backwards: bool = False,
+    ) -> List[Record]:
+        limit = limit or self.per_page
+        if after is not None:
+            return await self.db.fetch(
+                self.build_query("after", False, limit), *self.args, *after
+            )
+
+        if before is not None:
+            rows = await self.db.fetch(
+                self.build_query("before", True, limit), *self.args, *before
+            )
+        else:
+            rows = await self.db.fetch(self.build_query(None, backwards, limit), *self.args)
+
+        return list(reversed(rows)) if backwards or before is not None else rows
+
+    async def fetch_rows(self, index: int) -> List[Record]:
+        pages = self.pages or 0
+        if index == 0:
+            rows = await self.seek()
+        elif index - 1 in self.bookmarks:
+            rows = await self.seek(after=self.bookmarks[index - 1][1])
+        elif index + 1 in self.bookmarks:
+            rows = await self.seek(before=self.bookmarks[index + 1][0])
+        elif index == pages - 1:
+            rows = await self.seek(
+                limit=self.total - index * self.per_page or self.per_page, backwards=True
+            )
+        else:
+            # Walk from the closest page we can seek from.
+            below = max((page for page in self.bookmarks if page < index), default=0)
+            above = min((page for page in self.bookmarks if page > index), default=pages - 1)
+            steps = (
+                range(below, index)
+                if index - below <= above - index
+                else range(above, index, -1)
+            )
+            for page in steps:
+                if page not in self.bookmarks and not await self.fetch_rows(page):
+                    return []
+
+            return await self.fetch_rows(index)
+
+        if rows:
+            self.bookmarks[index] = (
+                tuple(rows[0][key] for key in self.keys),
+                tuple(rows[-1][key] for key in self.keys),
+            )
+
+        return rows
+
+    async def get_page(self, index: int) -> Page:
+        pages = await self.get_page_count()
+        rows = await self.fetch_rows(index)
+
+        return render_lines(
+            self.embed,
+            [self.format_entry(row) for row in rows],
+            index=index,
+            pages=pages,
+            offset=index * self.per_page,
+            counter=self.counter,
+            color=self.color,
+        )
+
+
+__all__ = (
+    "Page",
+    "PageSource",
+    "ListPageSource",
+    "QueryPageSource",
+)